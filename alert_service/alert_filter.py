@@ -0,0 +1,134 @@
+import time
+import threading
+from collections import OrderedDict
+
+# Also imported by the backend, which filters alerts before they are sent.
+# Keep this module dependency-free.
+
+PASS = "pass"
+ESCALATED = "escalated"
+DUPLICATE = "duplicate"
+RATE_LIMITED = "rate_limited"
+
+
+def parse_class_windows(spec):
+    # "STUDENT LEFT FRAME=10,cell phone=2" -> {"STUDENT LEFT FRAME": 10.0, "cell phone": 2.0}
+    windows = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        name, _, seconds = item.rpartition("=")
+        windows[name.strip()] = float(seconds)
+    return windows
+
+
+class KeyState:
+    __slots__ = ("last_emit", "last_confidence", "tokens", "refilled_at", "suppressed", "last_seen")
+
+    def __init__(self, now, burst):
+        self.last_emit = None
+        self.last_confidence = 0.0
+        self.tokens = burst
+        self.refilled_at = now
+        self.suppressed = 0  # raw alerts absorbed since the last one that went through
+        self.last_seen = now
+
+
+class AlertFilter:
+    # Per-(stream_id, object_class) deduplication and rate limiting.
+    # An alert is a duplicate if the same key already went through less than
+    # window_s ago, unless its confidence beats that one by escalation_delta.
+    # Whatever survives dedup still needs a token from the key's bucket
+    # (rate_per_s refill, burst capacity), which caps a flapping detection.
+    # Suppressed alerts are counted and folded into the next alert that goes
+    # through. Each check is O(1); keys idle for ttl_s are evicted and at most
+    # max_keys are kept (least recently seen goes first).
+
+    def __init__(self, window_s=2.0, rate_per_s=1.0, burst=3, escalation_delta=0.15,
+                 ttl_s=300, max_keys=10000, class_windows=None):
+        self.window_s = window_s
+        self.class_windows = class_windows or {}
+        self.rate_per_s = rate_per_s
+        self.burst = burst
+        self.escalation_delta = escalation_delta
+        self.ttl_s = ttl_s
+        self.max_keys = max_keys
+
+        self.keys = OrderedDict()
+        self.lock = threading.Lock()
+
+        # Metrics
+        self.passed_total = 0
+        self.escalated_total = 0
+        self.duplicates_total = 0
+        self.rate_limited_total = 0
+        self.evicted_total = 0
+
+    def check(self, stream_id, object_class, confidence, count=1, now=None):
+        # Returns (decision, count). count is how many raw alerts the passing
+        # alert stands for, including the ones suppressed before it.
+        now = time.monotonic() if now is None else now
+        key = (stream_id, object_class)
+        with self.lock:
+            self._evict(now)
+            state = self.keys.get(key)
+            if state is None:
+                state = KeyState(now, self.burst)
+                self.keys[key] = state
+                if len(self.keys) > self.max_keys:
+                    self.keys.popitem(last=False)
+                    self.evicted_total += 1
+            else:
+                self.keys.move_to_end(key)
+            state.last_seen = now
+
+            decision = PASS
+            window_s = self.class_windows.get(object_class, self.window_s)
+            if state.last_emit is not None and now - state.last_emit < window_s:
+                if confidence < state.last_confidence + self.escalation_delta:
+                    state.suppressed += count
+                    self.duplicates_total += 1
+                    return DUPLICATE, 0
+                decision = ESCALATED
+
+            state.tokens = min(self.burst, state.tokens + (now - state.refilled_at) * self.rate_per_s)
+            state.refilled_at = now
+            if state.tokens < 1:
+                state.suppressed += count
+                self.rate_limited_total += 1
+                return RATE_LIMITED, 0
+            state.tokens -= 1
+
+            state.last_emit = now
+            state.last_confidence = confidence
+            count += state.suppressed
+            state.suppressed = 0
+            if decision == ESCALATED:
+                self.escalated_total += 1
+            else:
+                self.passed_total += 1
+            return decision, count
+
+    def _evict(self, now):
+        while self.keys:
+            oldest = next(iter(self.keys.values()))
+            if now - oldest.last_seen <= self.ttl_s:
+                break
+            self.keys.popitem(last=False)
+            self.evicted_total += 1
+
+    def clear(self):
+        with self.lock:
+            self.keys.clear()
+
+    def stats(self):
+        return {
+            "keys": len(self.keys),
+            "max_keys": self.max_keys,
+            "window_s": self.window_s,
+            "rate_per_s": self.rate_per_s,
+            "burst": self.burst,
+            "passed_total": self.passed_total,
+            "escalated_total": self.escalated_total,
+            "duplicates_total": self.duplicates_total,
+            "rate_limited_total": self.rate_limited_total,
+            "evicted_total": self.evicted_total,
+        }
@@ -1,8 +1,13 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from pydantic import BaseModel
 from datetime import datetime
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List
+from alert_service.incident_store import IncidentStore
+from alert_service.alert_filter import AlertFilter, DUPLICATE, RATE_LIMITED, parse_class_windows
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+import os
+import time
 
 app = FastAPI()
 
@@ -15,47 +20,131 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory storage for alerts (resets on restart)
-incident_log = []
+# Persistent incident log (SQLite ring buffer, see incident_store.py)
+ALERT_DB_PATH = os.getenv("ALERT_DB_PATH", "alerts.db")
+ALERT_STORE_MAX_ROWS = int(os.getenv("ALERT_STORE_MAX_ROWS", "100000"))
+MAX_PAGE_SIZE = 500
+incident_store = IncidentStore(ALERT_DB_PATH, max_rows=ALERT_STORE_MAX_ROWS)
+
+# Dedup / rate limiting per (stream_id, object_class), see alert_filter.py.
+# Only applied to alerts from clients that don't filter themselves.
+ALERT_DEDUP_WINDOW_S = float(os.getenv("ALERT_DEDUP_WINDOW_S", "2"))
+ALERT_CLASS_WINDOWS = parse_class_windows(os.getenv("ALERT_CLASS_WINDOWS", ""))  # "cell phone=5,book=10"
+ALERT_RATE_PER_S = float(os.getenv("ALERT_RATE_PER_S", "1"))
+ALERT_BURST = float(os.getenv("ALERT_BURST", "3"))
+ALERT_ESCALATION_DELTA = float(os.getenv("ALERT_ESCALATION_DELTA", "0.15"))
+alert_filter = AlertFilter(window_s=ALERT_DEDUP_WINDOW_S, rate_per_s=ALERT_RATE_PER_S, burst=ALERT_BURST,
+                           escalation_delta=ALERT_ESCALATION_DELTA, class_windows=ALERT_CLASS_WINDOWS)
+
+# --- METRICS ---
+ALERTS_RECEIVED = Counter("alert_service_alerts", "Alerts received", ["object_class", "outcome"])
+ERRORS = Counter("alert_service_errors", "Failed alert requests", ["endpoint"])
+REQUEST_SECONDS = Histogram("alert_service_request_seconds", "Alert ingestion latency", ["endpoint"],
+                            buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+BATCH_SIZE = Histogram("alert_service_batch_size", "Alerts per /log_violations call",
+                       buckets=(1, 2, 5, 10, 25, 50, 100, 250))
+INCIDENT_LOG_SIZE = Gauge("alert_service_incident_log_size", "Alerts currently held")
+INCIDENT_LOG_SIZE.set_function(lambda: incident_store.size)
 
 class Violation(BaseModel):
     object_class: str
     confidence: float
     timestamp: str = None
+    count: int = 1  # How many raw detections the backend coalesced into this alert
+    stream_id: str = None
+    # Already deduped / rate limited by the sender (the backend runs the same
+    # AlertFilter); stored as-is instead of being filtered a second time
+    filtered: bool = False
 
 @app.get("/health")
 def health():
     return {"status": "active", "service": "Alert Service"}
 
+def record_violations(violations):
+    # Dedups, then stores every accepted alert of the request in one transaction
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    results, entries = [], []
+    for violation in violations:
+        violation.timestamp = timestamp
+
+        if not violation.filtered:
+            # Same object in the same stream within the window -> dropped, unless
+            # it is clearly more confident; floods are capped per stream and class
+            decision, count = alert_filter.check(violation.stream_id, violation.object_class,
+                                                 violation.confidence, violation.count)
+            if decision == DUPLICATE:
+                results.append({"status": "duplicate_ignored"})
+                continue
+            if decision == RATE_LIMITED:
+                results.append({"status": "rate_limited"})
+                continue
+            violation.count = count  # includes the suppressed repeats before it
+
+        entry = violation.dict(exclude={"filtered"})
+        entries.append(entry)
+        results.append({"status": "logged", "entry": entry})
+
+    for entry, row in zip(entries, incident_store.append(entries)):
+        entry.update(id=row["id"], ts=row["ts"])
+        print(f"🚨 SECURITY ALERT: {entry['object_class']} detected!")
+    return results
+
+def count_result(violation, result):
+    ALERTS_RECEIVED.labels(object_class=violation.object_class, outcome=result["status"]).inc()
+    return result
+
 @app.post("/log_violation")
 def log_violation(violation: Violation):
-    # Add timestamp
-    violation.timestamp = datetime.now().strftime("%H:%M:%S")
-    
-    # Simple De-duplication: Don't spam the log if the same object was just seen
-    if incident_log:
-        last = incident_log[0] # Newest is first
-        # If same object seen within last 2 seconds, ignore to prevent flooding
-        # (This is a basic logic, can be improved)
-        if last['object_class'] == violation.object_class:
-            return {"status": "duplicate_ignored"}
-
-    entry = violation.dict()
-    incident_log.insert(0, entry) # Add to top
-    
-    # Keep only last 50 alerts
-    if len(incident_log) > 50:
-        incident_log.pop()
-        
-    print(f"🚨 SECURITY ALERT: {entry['object_class']} detected!")
-    return {"status": "logged", "entry": entry}
+    start = time.perf_counter()
+    try:
+        return count_result(violation, record_violations([violation])[0])
+    except Exception:
+        ERRORS.labels(endpoint="log_violation").inc()
+        raise
+    finally:
+        REQUEST_SECONDS.labels(endpoint="log_violation").observe(time.perf_counter() - start)
+
+@app.post("/log_violations")
+def log_violations(violations: List[Violation]):
+    # Batch endpoint used by the backend's AlertDispatcher
+    start = time.perf_counter()
+    try:
+        results = [count_result(v, r) for v, r in zip(violations, record_violations(violations))]
+    except Exception:
+        ERRORS.labels(endpoint="log_violations").inc()
+        raise
+    finally:
+        REQUEST_SECONDS.labels(endpoint="log_violations").observe(time.perf_counter() - start)
+    BATCH_SIZE.observe(len(violations))
+    logged = sum(1 for r in results if r["status"] == "logged")
+    rate_limited = sum(1 for r in results if r["status"] == "rate_limited")
+    return {"status": "ok", "logged": logged, "duplicates": len(results) - logged - rate_limited,
+            "rate_limited": rate_limited}
+
+@app.get("/metrics")
+def metrics():
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 @app.get("/get_alerts")
-def get_alerts():
-    return incident_log
+def get_alerts(since: int = None, before: int = None, limit: int = 50,
+               object_class: str = None, stream_id: str = None, since_ts: float = None):
+    # Newest first. Pollers pass since=<newest id they have> to only get new alerts
+    # (the oldest `limit` of them, so none are skipped when more than a page arrived);
+    # before=<oldest id they have> pages back through history.
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    return incident_store.query(since=since, before=before, limit=limit, object_class=object_class,
+                                stream_id=stream_id, since_ts=since_ts)
+
+@app.get("/alert_stats")
+def alert_stats():
+    return {"store": incident_store.stats(), "filter": alert_filter.stats()}
 
 @app.post("/clear_alerts")
 def clear_alerts():
-    global incident_log
-    incident_log = []
+    incident_store.clear()
+    alert_filter.clear()
     return {"status": "cleared"}
+
+@app.on_event("shutdown")
+def shutdown_event():
+    incident_store.close()
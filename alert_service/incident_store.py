@@ -0,0 +1,137 @@
+import sqlite3
+import threading
+import time
+
+# Bounded, append-only incident log on SQLite.
+# Rows get a monotonically increasing id (never reused, even after clear), so
+# the id doubles as the pagination cursor: "since" returns only rows newer than
+# what the client already has and "before" pages back through history. Both are
+# primary-key range scans, so query cost depends on the page size, not on how
+# much history is stored. Past max_rows the oldest rows are trimmed in one
+# range delete, which keeps the table a ring buffer.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS incidents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    timestamp TEXT NOT NULL,
+    object_class TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    count INTEGER NOT NULL DEFAULT 1,
+    stream_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_incidents_ts ON incidents (ts);
+CREATE INDEX IF NOT EXISTS idx_incidents_class ON incidents (object_class, id);
+CREATE INDEX IF NOT EXISTS idx_incidents_stream ON incidents (stream_id, id);
+"""
+
+COLUMNS = ("id", "ts", "timestamp", "object_class", "confidence", "count", "stream_id")
+
+
+class IncidentStore:
+
+    def __init__(self, path="alerts.db", max_rows=100000, trim_every=1000):
+        self.path = path
+        self.max_rows = max_rows
+        self.trim_every = trim_every  # Trim in bulk instead of once per insert
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+        self.min_id, self.max_id = self.db.execute("SELECT MIN(id), MAX(id) FROM incidents").fetchone()
+        self.size = self.db.execute("SELECT COUNT(*) FROM incidents").fetchone()[0]
+        self.since_trim = 0
+
+    def append(self, entries):
+        # entries: dicts with object_class, confidence, count, stream_id, timestamp.
+        # Writes the whole batch in one transaction and returns the stored rows.
+        if not entries:
+            return []
+        now = time.time()
+        rows = [
+            (now, e["timestamp"], e["object_class"], e["confidence"], e.get("count", 1), e.get("stream_id"))
+            for e in entries
+        ]
+        with self.lock, self.db:
+            stored = []
+            for row in rows:
+                row_id = self.db.execute(
+                    "INSERT INTO incidents (ts, timestamp, object_class, confidence, count, stream_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    row,
+                ).lastrowid
+                stored.append(dict(zip(COLUMNS, (row_id,) + row)))
+
+            self.max_id = stored[-1]["id"]
+            if self.min_id is None:
+                self.min_id = stored[0]["id"]
+            self.size += len(stored)
+
+            self.since_trim += len(stored)
+            if self.since_trim >= self.trim_every and self.size > self.max_rows:
+                self._trim()
+        return stored
+
+    def _trim(self):
+        # Called with the lock held, inside a transaction
+        cutoff = self.max_id - self.max_rows
+        deleted = self.db.execute("DELETE FROM incidents WHERE id <= ?", (cutoff,)).rowcount
+        self.size -= deleted
+        self.min_id = cutoff + 1
+        self.since_trim = 0
+
+    def query(self, since=None, before=None, limit=50, object_class=None, stream_id=None, since_ts=None):
+        # Newest first. since/before are row ids from earlier responses. With
+        # since, the page holds the *oldest* rows after it, so a poller that
+        # moves its cursor to the newest id it got never skips any; if it fell
+        # behind it catches up over several polls.
+        clauses, params = [], []
+        if since is not None:
+            clauses.append("id > ?")
+            params.append(since)
+        if before is not None:
+            clauses.append("id < ?")
+            params.append(before)
+        if object_class is not None:
+            clauses.append("object_class = ?")
+            params.append(object_class)
+        if stream_id is not None:
+            clauses.append("stream_id = ?")
+            params.append(stream_id)
+        if since_ts is not None:
+            clauses.append("ts > ?")
+            params.append(since_ts)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        order = "ASC" if since is not None else "DESC"
+        params.append(limit)
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM incidents {where} ORDER BY id {order} LIMIT ?", params
+            ).fetchall()
+        if since is not None:
+            rows.reverse()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def clear(self):
+        # Ids keep counting up, so clients polling with "since" stay consistent
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM incidents")
+            self.size = 0
+            self.min_id = None
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "size": self.size,
+            "max_rows": self.max_rows,
+            "newest_id": self.max_id,
+            "oldest_id": self.min_id,
+        }
@@ -1,13 +1,30 @@
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, Form, Request, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from backend.utils.model_loader import ModelManager
+from backend.utils.runtime import RuntimeProfile, process_uptime_s
+from backend.utils.cascade import RoiCascade
+from backend.utils.model_host import RemoteModelManager
+from backend.utils.batcher import BatchScheduler
+from backend.utils.workers import WorkerPool, decode_and_sign, unpack_images
+from backend.utils.decode import ImageError, image_info, rescale_detections
+from backend.utils.detections import CLASS_NAMES, CLASS_IDS, MEDIA_JSON, class_ids, class_names, to_dicts, negotiate, encode
+from backend.utils.alerts import AlertDispatcher
+from backend.utils.audit import AuditLog
+from backend.utils.config_watcher import ConfigWatcher
+from backend.utils.tracking import PersonTracker, StreamSessions
+from backend.utils.frame_cache import FrameCache
+from backend.utils.pacing import FramePacer, WIDTHS
+from backend.utils.drift import DriftMonitor, load_baseline
+from backend.utils import metrics
+from alert_service.alert_filter import AlertFilter, parse_class_windows
 import numpy as np
 import cv2
+import os
+import asyncio
 import time
 import logging
 from pathlib import Path
-import requests 
 import traceback
 
 app = FastAPI()
@@ -25,115 +42,751 @@ app.add_middleware(
 BASE_DIR = Path(__file__).resolve().parent
 CONFIG_PATH = BASE_DIR / "config" / "current_model.txt"
 
-model_manager = ModelManager()
+# YOLO input: aspect-preserving letterbox (1) or the old plain 640x640 stretch (0)
+YOLO_LETTERBOX = os.getenv("YOLO_LETTERBOX", "1") == "1"
+# Which v2 model file to serve: fp32, int8_dynamic, int8_static, yolov8s, yolov8n
+# (see YOLO_VARIANTS in utils/model_loader.py and scripts/bench_variants.py)
+YOLO_VARIANT = os.getenv("YOLO_VARIANT", "fp32")
+
+# --- CPU THREADING ---
+# The pod's CPU quota is split across the uvicorn worker processes (uvicorn reads
+# WEB_CONCURRENCY too). Overrides: ORT_INTRA_OP_THREADS, ORT_INTER_OP_THREADS,
+# ORT_EXECUTION_MODE, ORT_CPU_ARENA, ORT_ALLOW_SPINNING, TF_INTRA_OP_THREADS,
+# TF_INTER_OP_THREADS. ORT_OPTIMIZED_CACHE_DIR keeps the optimized graph on disk
+# so later starts skip graph optimization. See scripts/bench_threads.py.
+SERVER_WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+runtime_profile = RuntimeProfile.from_env(processes=SERVER_WORKERS)
+
+# --- CASCADED INFERENCE (v2) ---
+# Find the student first (a CASCADE_PERSON_SIZE full-frame pass, or the stream's
+# person boxes from its previous frame), then run the detector only on crops
+# around them at up to CASCADE_ROI_SIZE. A person pass is forced every
+# CASCADE_REFRESH_FRAMES frames so newcomers are picked up.
+# See utils/cascade.py and scripts/bench_cascade.py.
+CASCADE = os.getenv("CASCADE", "0") == "1"
+CASCADE_PERSON_SIZE = int(os.getenv("CASCADE_PERSON_SIZE", "320"))
+CASCADE_ROI_SIZE = int(os.getenv("CASCADE_ROI_SIZE", "480"))
+CASCADE_ROI_MARGIN = float(os.getenv("CASCADE_ROI_MARGIN", "0.2"))
+CASCADE_REFRESH_FRAMES = int(os.getenv("CASCADE_REFRESH_FRAMES", "10"))
+
+roi_cascade = None
+if CASCADE:
+    roi_cascade = RoiCascade(person_size=CASCADE_PERSON_SIZE, roi_size=CASCADE_ROI_SIZE, roi_margin=CASCADE_ROI_MARGIN)
+
+# --- SHARED MODEL HOST ---
+# MODEL_HOST=1 (set up by backend/serve.py): the models live in one host process
+# and this worker only serves HTTP, decodes and applies the rules. Frames go to
+# the host through MODEL_HOST_SLOTS shared-memory slots of MODEL_HOST_SLOT_MB each.
+MODEL_HOST = os.getenv("MODEL_HOST", "0") == "1"
+MODEL_HOST_SOCKET = os.getenv("MODEL_HOST_SOCKET", "/tmp/model_host.sock")
+MODEL_HOST_SLOTS = int(os.getenv("MODEL_HOST_SLOTS", "2"))
+MODEL_HOST_SLOT_MB = float(os.getenv("MODEL_HOST_SLOT_MB", "8"))
+# A host that doesn't answer within MODEL_HOST_TIMEOUT_S is reconnected to
+# (generous: activating a model loads it in the host)
+MODEL_HOST_TIMEOUT_S = float(os.getenv("MODEL_HOST_TIMEOUT_S", "120"))
+
+if MODEL_HOST:
+    model_manager = RemoteModelManager(MODEL_HOST_SOCKET, slots=MODEL_HOST_SLOTS,
+                                       slot_bytes=int(MODEL_HOST_SLOT_MB * 2**20),
+                                       request_timeout_s=MODEL_HOST_TIMEOUT_S, observer=metrics.observe_stage)
+else:
+    model_manager = ModelManager(letterbox=YOLO_LETTERBOX, observer=metrics.observe_stage, yolo_variant=YOLO_VARIANT,
+                                 runtime=runtime_profile, cascade=roi_cascade)
+
+# --- MODEL REGISTRY ---
+# Versions loaded + warmed up at startup; switching between them is instant.
+# Only the active one gates readiness, the rest load in the background after.
+PRELOAD_MODELS = [v for v in os.getenv("PRELOAD_MODELS", "v1,v2").split(",") if v]
+DEFAULT_MODEL = "v2"
+# How often the config file's mtime is checked (no per-request file reads)
+CONFIG_POLL_S = float(os.getenv("CONFIG_POLL_S", "1.0"))
+
+# --- MICRO-BATCHING ---
+# Concurrent /predict calls are grouped into one N x 3 x 640 x 640 inference
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+
+# --- WORKER POOL / BACKPRESSURE ---
+# Decode runs on this pool; past MAX_PENDING_REQUESTS in flight we answer 503 fast
+DECODE_POOL = os.getenv("DECODE_POOL", "thread")  # "thread" or "process"
+DECODE_WORKERS = int(os.getenv("DECODE_WORKERS", "2"))
+MAX_PENDING_REQUESTS = int(os.getenv("MAX_PENDING_REQUESTS", "64"))
+RETRY_AFTER_S = int(os.getenv("RETRY_AFTER_S", "1"))
+# JPEGs much larger than the model input are decoded at 1/2, 1/4 or 1/8 scale
+# (libjpeg DCT scaling); boxes are scaled back to the original frame
+DECODE_REDUCED = os.getenv("DECODE_REDUCED", "1") == "1"
+
+def run_batch(version, images, person_boxes=None):
+    model_manager.load_model(version)
+    return model_manager.predict_batch(version, images, person_boxes)
+
+scheduler = BatchScheduler(run_batch, max_batch_size=BATCH_MAX_SIZE,
+                           max_wait_ms=BATCH_MAX_WAIT_MS, workers=INFERENCE_WORKERS)
+worker_pool = WorkerPool(kind=DECODE_POOL, workers=DECODE_WORKERS,
+                         max_pending=MAX_PENDING_REQUESTS, retry_after_s=RETRY_AFTER_S)
 
 # Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("backend")
 
 # --- STATE FOR MOVEMENT TRACKING ---
-last_person_box = None
+# One tracker per client stream; idle streams expire after STREAM_TTL_S
 MOVEMENT_THRESHOLD = 50 # Pixels of difference to trigger alert
+STREAM_TTL_S = float(os.getenv("STREAM_TTL_S", "300"))
+MAX_STREAMS = int(os.getenv("MAX_STREAMS", "1000"))
+
+stream_sessions = StreamSessions(PersonTracker, ttl_s=STREAM_TTL_S, max_sessions=MAX_STREAMS)
+
+# --- FRAME CACHE ---
+# Webcams mostly show a still scene: reuse the stream's last detections until the
+# frame changes, with a real inference at least every N frames / T seconds
+FRAME_CACHE = os.getenv("FRAME_CACHE", "1") == "1"
+FRAME_CACHE_PIXEL_DELTA = int(os.getenv("FRAME_CACHE_PIXEL_DELTA", "12"))
+FRAME_CACHE_CHANGED_FRACTION = float(os.getenv("FRAME_CACHE_CHANGED_FRACTION", "0.005"))
+FRAME_CACHE_MAX_FRAMES = int(os.getenv("FRAME_CACHE_MAX_FRAMES", "15"))
+FRAME_CACHE_MAX_AGE_S = float(os.getenv("FRAME_CACHE_MAX_AGE_S", "1.0"))
+
+frame_cache = FrameCache(pixel_delta=FRAME_CACHE_PIXEL_DELTA, changed_fraction=FRAME_CACHE_CHANGED_FRACTION,
+                         max_frames=FRAME_CACHE_MAX_FRAMES, max_age_s=FRAME_CACHE_MAX_AGE_S)
+
+# --- FRAME PACING ---
+# Every response tells the client when to send its next frame and how wide to
+# make it, from the inference load and the stream's scene activity
+# (utils/pacing.py). Streams whose scene is still get idle_interval_ms.
+PACING_MIN_INTERVAL_MS = float(os.getenv("PACING_MIN_INTERVAL_MS", "66"))
+PACING_IDLE_INTERVAL_MS = float(os.getenv("PACING_IDLE_INTERVAL_MS", "500"))
+PACING_MAX_INTERVAL_MS = float(os.getenv("PACING_MAX_INTERVAL_MS", "2000"))
+PACING_TARGET_UTILIZATION = float(os.getenv("PACING_TARGET_UTILIZATION", "0.8"))
+PACING_QUEUE_BUDGET_MS = float(os.getenv("PACING_QUEUE_BUDGET_MS", "100"))
+
+frame_pacer = FramePacer(workers=INFERENCE_WORKERS, min_interval_ms=PACING_MIN_INTERVAL_MS,
+                         idle_interval_ms=PACING_IDLE_INTERVAL_MS, max_interval_ms=PACING_MAX_INTERVAL_MS,
+                         target_utilization=PACING_TARGET_UTILIZATION, queue_budget_ms=PACING_QUEUE_BUDGET_MS)
+
+# --- DRIFT MONITOR ---
+# Optional: compare live detections against a histogram baseline built with
+# scripts/drift_detection.py --build-baseline. Only frames of the baseline's
+# model version are counted.
+DRIFT_BASELINE = os.getenv("DRIFT_BASELINE", "")
+DRIFT_BUCKET_FRAMES = int(os.getenv("DRIFT_BUCKET_FRAMES", "500"))
+DRIFT_BUCKETS = int(os.getenv("DRIFT_BUCKETS", "10"))
+
+drift_monitor = None
+if DRIFT_BASELINE and os.path.exists(DRIFT_BASELINE):
+    drift_monitor = DriftMonitor(load_baseline(DRIFT_BASELINE), bucket_frames=DRIFT_BUCKET_FRAMES, buckets=DRIFT_BUCKETS)
+
+# --- AUDIT LOG ---
+# Optional: one JSON record per request (stream, model, stage timings, compact
+# detections) in gzip JSONL segments under AUDIT_LOG_DIR, written by a
+# background thread. Offline tools read them with utils/audit.read_audit
+# (e.g. scripts/drift_detection.py --source <dir>).
+AUDIT_LOG_DIR = os.getenv("AUDIT_LOG_DIR", "")
+AUDIT_SEGMENT_MB = float(os.getenv("AUDIT_SEGMENT_MB", "64"))
+AUDIT_MAX_MB = float(os.getenv("AUDIT_MAX_MB", "1024"))
+AUDIT_SEGMENT_MAX_AGE_S = float(os.getenv("AUDIT_SEGMENT_MAX_AGE_S", "60"))
+AUDIT_MAX_BUFFER = int(os.getenv("AUDIT_MAX_BUFFER", "10000"))
+
+audit_log = None
+if AUDIT_LOG_DIR:
+    audit_log = AuditLog(AUDIT_LOG_DIR, segment_bytes=int(AUDIT_SEGMENT_MB * (1 << 20)),
+                         max_bytes=int(AUDIT_MAX_MB * (1 << 20)), segment_max_age_s=AUDIT_SEGMENT_MAX_AGE_S,
+                         max_buffer=AUDIT_MAX_BUFFER)
+
+# --- BATCH API ---
+# /predict_batch takes many images per request: multipart "files" fields, or a
+# binary body of length-prefixed images (pack_images in utils/workers.py)
+PREDICT_BATCH_MAX_IMAGES = int(os.getenv("PREDICT_BATCH_MAX_IMAGES", "64"))
 
 # --- SECURITY CONFIG ---
 BANNED_ITEMS = ["cell phone", "laptop", "mouse", "keyboard", "remote", "tv"]
-ALERT_SERVICE_URL = "http://alert-service:8001/log_violation"
+# Rules run on the detection arrays' class ids (utils/detections.py)
+BANNED_IDS = class_ids(BANNED_ITEMS)
+PERSON_ID = CLASS_IDS["person"]
+ALERT_SERVICE_URL = os.getenv("ALERT_SERVICE_URL", "http://alert-service:8001/log_violation")
+# Alerts are batched to the service's /log_violations endpoint by a background sender
+ALERT_BATCH_URL = os.getenv("ALERT_BATCH_URL", ALERT_SERVICE_URL.rsplit("/", 1)[0] + "/log_violations")
+ALERT_FLUSH_MS = float(os.getenv("ALERT_FLUSH_MS", "200"))
+ALERT_MAX_BUFFER = int(os.getenv("ALERT_MAX_BUFFER", "1000"))
+
+alert_dispatcher = AlertDispatcher(ALERT_BATCH_URL, max_buffer=ALERT_MAX_BUFFER,
+                                   flush_interval_ms=ALERT_FLUSH_MS,
+                                   observer=metrics.observe_alert_delivery)
+
+# Same dedup / rate-limit rules as the alert service, applied before sending,
+# so repeats of one detection never leave the backend. Alerts are marked
+# "filtered" so the service stores them without filtering them again.
+ALERT_DEDUP_WINDOW_S = float(os.getenv("ALERT_DEDUP_WINDOW_S", "2"))
+ALERT_CLASS_WINDOWS = parse_class_windows(os.getenv("ALERT_CLASS_WINDOWS", ""))
+ALERT_RATE_PER_S = float(os.getenv("ALERT_RATE_PER_S", "1"))
+ALERT_BURST = float(os.getenv("ALERT_BURST", "3"))
+ALERT_ESCALATION_DELTA = float(os.getenv("ALERT_ESCALATION_DELTA", "0.15"))
+alert_filter = AlertFilter(window_s=ALERT_DEDUP_WINDOW_S, rate_per_s=ALERT_RATE_PER_S, burst=ALERT_BURST,
+                           escalation_delta=ALERT_ESCALATION_DELTA, class_windows=ALERT_CLASS_WINDOWS,
+                           max_keys=MAX_STREAMS * 10)
+
+def send_alert(payload):
+    # Never blocks: the dispatcher thread owns the network I/O
+    decision, count = alert_filter.check(payload.get("stream_id"), payload["object_class"],
+                                         payload["confidence"])
+    if count == 0:
+        metrics.ALERTS_SUPPRESSED.labels(type=payload["object_class"], reason=decision).inc()
+        return
+    metrics.ALERTS.labels(type=payload["object_class"]).inc()
+    payload["count"] = count
+    payload["filtered"] = True
+    alert_dispatcher.send(payload)
 
 def get_current_model():
-    if CONFIG_PATH.exists():
-        return CONFIG_PATH.read_text().strip()
-    return "v2"
+    return model_manager.active_version
+
+def apply_model_switch(version):
+    # Load on an inference thread: with INFERENCE_WORKERS=1 it waits for the
+    # running batch; with more it may run next to one on another thread, which
+    # is safe since load_model is locked and every batch carries its version
+    scheduler.executor.submit(model_manager.activate, version).result()
+    # Reset movement tracking on switch. We're on the config watcher's or a
+    # threadpool thread; the sessions are only ever touched from the event loop.
+    if server_loop is not None:
+        server_loop.call_soon_threadsafe(stream_sessions.clear)
+    else:
+        stream_sessions.clear()
+
+config_watcher = ConfigWatcher(CONFIG_PATH, apply_model_switch, interval_s=CONFIG_POLL_S)
+
+# --- STARTUP / READINESS ---
+# The server accepts connections straight away (/health = liveness); /ready
+# turns 200 once the active model has loaded and run its warm-up inferences.
+# startup_report breaks the time to ready down by phase (also at /startup).
+startup_report = {"ready": False, "error": None}
+startup_tasks = set()
+server_loop = None  # the event loop serving requests, set at startup
+
+async def warm_up():
+    loop = asyncio.get_running_loop()
+    initial = config_watcher.read()
+    if initial not in ["v1", "v2"]:
+        initial = DEFAULT_MODEL
+    try:
+        await loop.run_in_executor(scheduler.executor, model_manager.activate, initial)
+    except Exception as e:
+        # Stays unready, so the pod never receives traffic it can't serve
+        metrics.ERRORS.labels(stage="startup").inc()
+        startup_report["error"] = str(e)
+        logger.error(f"Warm-up of model {initial} failed: {e}")
+        return
+
+    info = model_manager.model_info[initial]
+    startup_report.update({
+        "model": initial,
+        "framework_import_s": info["import_s"],
+        "model_load_s": info["load_s"],
+        "warmup_s": info["warmup_s"],
+        "ready_s": process_uptime_s(),
+        "ready": True,
+    })
+    logger.info(f"Ready: {startup_report}")
+    config_watcher.start()
+
+    # Other versions load off the inference thread, so serving isn't held up
+    others = [v for v in PRELOAD_MODELS if v != initial]
+    if others:
+        await loop.run_in_executor(None, model_manager.preload, others)
+
+@app.on_event("startup")
+async def start_scheduler():
+    global server_loop
+    # Interpreter start + uvicorn + imports of this module, up to here
+    startup_report["server_start_s"] = process_uptime_s()
+    server_loop = asyncio.get_running_loop()
+    await scheduler.start()
+    alert_dispatcher.start()
+    if audit_log is not None:
+        audit_log.start()
+    logger.info(f"CPU profile: {runtime_profile.stats()}")
+
+    task = asyncio.create_task(warm_up())
+    startup_tasks.add(task)
+    task.add_done_callback(startup_tasks.discard)
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    config_watcher.stop()
+    await scheduler.stop()
+    worker_pool.shutdown()
+    alert_dispatcher.stop()
+    if audit_log is not None:
+        audit_log.stop()
+    if MODEL_HOST:
+        model_manager.close()
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
+@app.get("/ready")
+def ready():
+    if not startup_report["ready"]:
+        return JSONResponse(status_code=503, content={"status": "warming_up", "error": startup_report["error"]})
+    return {"status": "ready", "model": get_current_model()}
+
+@app.get("/startup")
+def startup():
+    # Seconds per startup phase, for tuning scale-out
+    return startup_report
+
+@app.get("/scheduler_stats")
+def scheduler_stats():
+    # Queue depth / batch size for tuning BATCH_* and the HPA
+    stats = scheduler.stats()
+    stats["admission"] = worker_pool.stats()
+    stats["alerts"] = alert_dispatcher.stats()
+    stats["alert_filter"] = alert_filter.stats()
+    stats["streams"] = stream_sessions.stats()
+    stats["frame_cache"] = frame_cache.stats()
+    stats["pacing"] = frame_pacer.stats()
+    return stats
+
+# Scheduler / admission / dispatcher / stream counters, read on every scrape
+stats_sources = {
+    "scheduler": scheduler.stats,
+    "admission": worker_pool.stats,
+    "alerts": alert_dispatcher.stats,
+    "alert_filter": alert_filter.stats,
+    "streams": stream_sessions.stats,
+    "frame_cache": frame_cache.stats,
+    "pacing": frame_pacer.stats,
+    "startup": lambda: {k: float(v) for k, v in startup_report.items() if isinstance(v, (bool, int, float))},
+}
+if audit_log is not None:
+    stats_sources["audit"] = audit_log.stats
+if drift_monitor is not None:
+    stats_sources["drift"] = drift_monitor.stats
+def cascade_stats():
+    # Counted where the models run (this process or the model host). /metrics
+    # is a sync endpoint, so asking the host happens off the event loop.
+    if MODEL_HOST and not model_manager.connected:
+        return {}
+    return model_manager.stats()["cascade"] or {}
+
+if roi_cascade is not None:
+    stats_sources["cascade"] = cascade_stats
+metrics.register_stats(stats_sources)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/drift")
+async def drift():
+    # PSI / KS / chi-square of the recent window against the baseline. On the
+    # event loop, like observe(): report() flushes pending frames into the window
+    if drift_monitor is None:
+        return {"error": "Drift monitor disabled (set DRIFT_BASELINE)"}
+    return drift_monitor.report()
+
+@app.get("/classes")
+def classes():
+    # class_id -> name, for clients of the compact response encodings
+    return CLASS_NAMES
+
+@app.get("/models")
+def models():
+    # Resident versions with load time, warm-up time and memory footprint
+    return model_manager.stats()
+
 @app.post("/switch_model")
 def switch_model(version: str):
     if version not in ["v1", "v2"]:
         return {"error": "Invalid model version"}
+    apply_model_switch(version)
     CONFIG_PATH.write_text(version)
-    model_manager.load_model(version)
-    # Reset movement tracking on switch
-    global last_person_box
-    last_person_box = None
+    # Resync so the watcher doesn't re-apply our own write
+    config_watcher.read()
     return {"message": f"Model switched to {version}"}
 
+async def detect(image_bytes, stream_id, timings):
+    # Shared by /predict and /ws/predict: decode -> (cached or batched) inference -> alert rules
+    t = time.perf_counter()
+    current_version = get_current_model()
+    img, signature, scale = await worker_pool.run(decode_and_sign, image_bytes, FRAME_CACHE,
+                                                  model_manager.min_decode_size(current_version), DECODE_REDUCED)
+    if img is None:
+        # Reject here so one bad upload can't fail a whole batch
+        raise ImageError("Could not decode image")
+    timings["decode_ms"] = (time.perf_counter() - t) * 1000
+
+    session = stream_sessions.get(stream_id)
+
+    detections = frame_cache.lookup(session, current_version, signature) if FRAME_CACHE else None
+    if detections is not None:
+        batch_info = {"batch_size": 0, "cached": True}
+        session.still_frames += 1
+    else:
+        # A forced refresh of an unchanged scene keeps the stream counted as still
+        session.still_frames = session.still_frames + 1 if frame_cache.unchanged(session, signature) else 0
+        detections, batch_info = await scheduler.submit(current_version, img,
+                                                        cascade_hint(current_version, session, scale))
+        detections = rescale_detections(detections, scale)
+        if roi_cascade is not None:
+            session.person_boxes = roi_cascade.person_boxes(detections)
+        timings["queue_ms"] = batch_info["queue_ms"]
+        timings["inference_ms"] = batch_info["inference_ms"]
+        batch_info["cached"] = False
+        frame_pacer.observe(batch_info)
+        if FRAME_CACHE:
+            frame_cache.store(session, current_version, signature, detections)
+        if drift_monitor is not None and drift_monitor.baseline.model_version in (None, current_version):
+            drift_monitor.observe(detections)
+
+    for stage in ("read", "decode", "queue"):
+        if f"{stage}_ms" in timings:
+            metrics.observe_stage(stage, current_version, timings[f"{stage}_ms"] / 1000)
+    count_detections(current_version, detections)
+
+    apply_rules(current_version, detections, session, stream_id)
+    return current_version, detections, batch_info, session
+
+def pacing(version=None, session=None):
+    # Recommended {"interval_ms", "max_width"} for the client's next frame
+    version = version or get_current_model()
+    admission = worker_pool.pending / worker_pool.max_pending
+    # Until warm-up the model host may not be connected: assume the widest input
+    model_width = model_manager.min_decode_size(version)[0] if startup_report["ready"] else WIDTHS[0]
+    return frame_pacer.recommend(session, admission, model_width)
+
+def cascade_hint(version, session, scale):
+    # The stream's last person boxes, in the (possibly reduced) decoded frame's
+    # pixels; None means the cascade runs its own person pass. Clients without
+    # a stream_id get hints too, from their per-address session: clients behind
+    # one NAT share it, and the periodic refresh bounds the damage of a stale hint.
+    if roi_cascade is None or version != "v2":
+        return None
+    if session.person_boxes is None or session.frames % CASCADE_REFRESH_FRAMES == 0:
+        return None
+    sx, sy = scale
+    return session.person_boxes / np.array([sx, sy, sx, sy])
+
+def audit(endpoint, stream_id, version, latency, timings, batch_info=None, detections=None, error=None, **extra):
+    # Never blocks: the audit log's thread owns the disk I/O
+    if audit_log is None:
+        return
+    entry = {"endpoint": endpoint, "stream_id": stream_id, "model": version,
+             "latency_ms": latency, "timings_ms": timings}
+    if batch_info is not None:
+        entry["batch_size"] = batch_info["batch_size"]
+        entry["cached"] = batch_info.get("cached", False)
+    if detections is not None:
+        entry["detections"] = detections
+    if error is not None:
+        entry["error"] = error
+    entry.update(extra)
+    audit_log.record(entry)
+
+def count_detections(version, detections):
+    ids, counts = np.unique(detections["class_id"], return_counts=True)
+    for class_id, n in zip(ids.tolist(), counts.tolist()):
+        metrics.DETECTIONS.labels(model=version, **{"class": CLASS_NAMES[class_id]}).inc(n)
+
+def apply_rules(current_version, detections, session, stream_id):
+    # --- 2. LOGIC FOR V1 (MOVEMENT DETECTION) ---
+    if current_version == "v1":
+        person_boxes = detections["box"][detections["class_id"] == PERSON_ID] # [x, y, w, h]
+        
+        # If person is missing (Left the frame)
+        if not len(person_boxes) and session.tracker.seen_person:
+            send_alert({"object_class": "STUDENT LEFT FRAME", "confidence": 1.0, "stream_id": stream_id})
+
+        # Match every person against this stream's tracks and check how far each moved
+        _, displacement = session.tracker.update(person_boxes)
+        for dist in displacement[displacement > MOVEMENT_THRESHOLD].tolist():
+            # TRIGGER YELLOW ALERT
+            send_alert({"object_class": "SUSPICIOUS MOVEMENT", "confidence": dist, "stream_id": stream_id})
+
+
+    # --- 3. LOGIC FOR V2 (CONTRABAND DETECTION) ---
+    elif current_version == "v2":
+        banned = detections[np.isin(detections["class_id"], BANNED_IDS) & (detections["score"] > 0.5)]
+        for name, score in zip(class_names(banned).tolist(), banned["score"].tolist()):
+            send_alert({"object_class": name, "confidence": score, "stream_id": stream_id})
+
 @app.post("/predict")
-async def predict(file: UploadFile = File(...)):
-    global last_person_box
-    start = time.time()
+async def predict(request: Request, file: UploadFile = File(...), stream_id: str = Form(None)):
+    if not startup_report["ready"]:
+        return JSONResponse(
+            status_code=503,
+            content={"error": "Model is warming up, retry later", "pacing": pacing()},
+            headers={"Retry-After": str(worker_pool.retry_after_s)},
+        )
+
+    # Backpressure: shed load immediately rather than queueing work we can't finish
+    if not worker_pool.admit():
+        return JSONResponse(
+            status_code=503,
+            content={"error": "Server overloaded, retry later", "pacing": pacing()},
+            headers={"Retry-After": str(worker_pool.retry_after_s)},
+        )
+
+    start = time.perf_counter()
+    timings = {}
+    # Clients that don't send a stream_id are tracked per address
+    stream_id = stream_id or (request.client.host if request.client else "default")
 
     try:
         # 1. Process Image
         image_bytes = await file.read()
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        timings["read_ms"] = (time.perf_counter() - start) * 1000
+        try:
+            # Empty / non-image uploads are refused from the header alone; a
+            # body that still fails to decode (truncated) is refused the same way
+            image_info(image_bytes)
+            current_version, detections, batch_info, session = await detect(image_bytes, stream_id, timings)
+        except ImageError as e:
+            metrics.ERRORS.labels(stage="predict").inc()
+            audit("predict", stream_id, None, 0, timings, error=str(e))
+            return JSONResponse(status_code=400, content={
+                "model": "error", "detections": [], "latency_ms": 0, "error": str(e)})
 
-        current_version = get_current_model()
-        model_manager.load_model(current_version)
-        detections = model_manager.predict(current_version, img)
-
-        latency = (time.time() - start) * 1000
-
-        # --- 2. LOGIC FOR V1 (MOVEMENT DETECTION) ---
-        if current_version == "v1":
-            person_found = False
-            for det in detections:
-                if det["class"] == "person":
-                    person_found = True
-                    box = det["box"] # [x, y, w, h]
-                    
-                    # Calculate center point
-                    center_x = box[0] + (box[2] / 2)
-                    center_y = box[1] + (box[3] / 2)
-
-                    if last_person_box:
-                        # Calculate movement distance
-                        prev_x, prev_y = last_person_box
-                        dist = np.sqrt((center_x - prev_x)**2 + (center_y - prev_y)**2)
-                        
-                        if dist > MOVEMENT_THRESHOLD:
-                            # TRIGGER YELLOW ALERT
-                            try:
-                                payload = {"object_class": "SUSPICIOUS MOVEMENT", "confidence": dist}
-                                requests.post(ALERT_SERVICE_URL, json=payload, timeout=0.1)
-                            except: pass
-                    
-                    # Update history
-                    last_person_box = (center_x, center_y)
-                    break
-            
-            # If person is missing (Left the frame)
-            if not person_found and last_person_box:
-                try:
-                    payload = {"object_class": "STUDENT LEFT FRAME", "confidence": 1.0}
-                    requests.post(ALERT_SERVICE_URL, json=payload, timeout=0.1)
-                except: pass
-
-
-        # --- 3. LOGIC FOR V2 (CONTRABAND DETECTION) ---
-        elif current_version == "v2":
-            for det in detections:
-                if det["class"] in BANNED_ITEMS and det["score"] > 0.5:
-                    try:
-                        payload = {"object_class": det["class"], "confidence": det["score"]}
-                        requests.post(ALERT_SERVICE_URL, json=payload, timeout=0.1)
-                    except: pass
+        latency = (time.perf_counter() - start) * 1000
+        metrics.REQUEST_SECONDS.labels(endpoint="predict", model=current_version).observe(latency / 1000)
+        audit("predict", stream_id, current_version, latency, timings, batch_info, detections)
+
+        # JSON unless the client asked for a compact encoding (utils/detections.py)
+        media = negotiate(request.headers.get("accept"))
+        if media != MEDIA_JSON:
+            payload = {
+                "model": current_version,
+                "latency_ms": latency,
+                "timings_ms": timings,
+                "batch_size": batch_info["batch_size"],
+                "cached": batch_info["cached"],
+                "pacing": pacing(current_version, session)
+            }
+            return Response(content=encode(payload, [detections], media), media_type=media)
 
         return {
             "model": current_version,
-            "detections": detections,
-            "latency_ms": latency
+            "detections": to_dicts(detections),
+            "latency_ms": latency,
+            "timings_ms": timings,
+            "batch_size": batch_info["batch_size"],
+            "cached": batch_info["cached"],
+            "pacing": pacing(current_version, session)
         }
     
     except Exception as e:
+        metrics.ERRORS.labels(stage="predict").inc()
         logger.error(f"Prediction Error: {e}")
         traceback.print_exc()
+        audit("predict", stream_id, None, 0, timings, error=str(e))
         # Return empty detections on error instead of crashing 500
         return {
             "model": "error",
             "detections": [],
             "latency_ms": 0,
             "error": str(e)
-        }
\ No newline at end of file
+        }
+
+    finally:
+        worker_pool.release()
+
+@app.post("/predict_batch")
+async def predict_batch(request: Request):
+    # Images are decoded in parallel and go through the scheduler together, so
+    # they run as full batches next to live traffic. Errors are per image.
+    # Alert rules only run when a stream_id is given (a client sending its
+    # buffered frames, in order); offline jobs leave it out.
+    if not startup_report["ready"]:
+        return JSONResponse(
+            status_code=503,
+            content={"error": "Model is warming up, retry later"},
+            headers={"Retry-After": str(worker_pool.retry_after_s)},
+        )
+    if not worker_pool.admit():
+        return JSONResponse(
+            status_code=503,
+            content={"error": "Server overloaded, retry later"},
+            headers={"Retry-After": str(worker_pool.retry_after_s)},
+        )
+
+    start = time.perf_counter()
+    timings = {}
+    admitted = 1
+
+    try:
+        stream_id = request.query_params.get("stream_id")
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            form = await request.form()
+            stream_id = form.get("stream_id") or stream_id
+            bodies = [await f.read() for f in form.getlist("files")]
+        else:
+            bodies = unpack_images(await request.body())
+        if not bodies:
+            return JSONResponse(status_code=400, content={"error": "No images in request"})
+        if len(bodies) > PREDICT_BATCH_MAX_IMAGES:
+            return JSONResponse(status_code=413, content={
+                "error": f"Too many images ({len(bodies)} > {PREDICT_BATCH_MAX_IMAGES})"})
+        # Every image counts against MAX_PENDING_REQUESTS, like that many /predict calls
+        extra = min(len(bodies), worker_pool.max_pending) - admitted
+        if extra > 0:
+            if not worker_pool.admit(extra):
+                return JSONResponse(
+                    status_code=503,
+                    content={"error": "Server overloaded, retry later"},
+                    headers={"Retry-After": str(worker_pool.retry_after_s)},
+                )
+            admitted += extra
+        timings["read_ms"] = (time.perf_counter() - start) * 1000
+
+        # Bad items are answered from their header, without decoding them
+        results = [{"index": i, "error": "Could not decode image"} for i in range(len(bodies))]
+        valid = []
+        for i, body in enumerate(bodies):
+            try:
+                image_info(body)
+                valid.append(i)
+            except ValueError as e:
+                results[i]["error"] = str(e)
+
+        t = time.perf_counter()
+        current_version = get_current_model()
+        min_size = model_manager.min_decode_size(current_version)
+        decoded = await asyncio.gather(*(worker_pool.run(decode_and_sign, bodies[i], False, min_size, DECODE_REDUCED)
+                                         for i in valid))
+        timings["decode_ms"] = (time.perf_counter() - t) * 1000
+
+        ok = [(i, img, scale) for i, (img, _, scale) in zip(valid, decoded) if img is not None]
+        t = time.perf_counter()
+        outputs = await scheduler.submit_many(current_version, [img for _, img, _ in ok])
+        timings["inference_ms"] = (time.perf_counter() - t) * 1000
+
+        session = stream_sessions.get(stream_id) if stream_id else None
+        frames = [None] * len(bodies)
+        for (i, _, scale), output in zip(ok, outputs):
+            if isinstance(output, Exception):
+                results[i]["error"] = str(output)
+                continue
+            detections, batch_info = output
+            detections = frames[i] = rescale_detections(detections, scale)
+            results[i] = {"index": i, "batch_size": batch_info["batch_size"]}
+            if drift_monitor is not None and drift_monitor.baseline.model_version in (None, current_version):
+                drift_monitor.observe(detections)
+            count_detections(current_version, detections)
+            if session is not None:
+                apply_rules(current_version, detections, session, stream_id)
+
+        errors = sum("error" in r for r in results)
+        if errors:
+            metrics.ERRORS.labels(stage="predict_batch").inc(errors)
+        for stage in ("read", "decode"):
+            metrics.observe_stage(stage, current_version, timings[f"{stage}_ms"] / 1000)
+        latency = (time.perf_counter() - start) * 1000
+        metrics.REQUEST_SECONDS.labels(endpoint="predict_batch", model=current_version).observe(latency / 1000)
+        # One record per image, sharing the request's timings
+        for result, detections in zip(results, frames):
+            if detections is None:
+                audit("predict_batch", stream_id, current_version, latency, timings, error=result["error"], index=result["index"])
+            else:
+                audit("predict_batch", stream_id, current_version, latency, timings, result, detections, index=result["index"])
+
+        payload = {
+            "model": current_version,
+            "results": results,
+            "images": len(results),
+            "errors": errors,
+            "latency_ms": latency,
+            "timings_ms": timings,
+        }
+        media = negotiate(request.headers.get("accept"))
+        if media != MEDIA_JSON:
+            return Response(content=encode(payload, frames, media), media_type=media)
+        for result, detections in zip(results, frames):
+            if detections is not None:
+                result["detections"] = to_dicts(detections)
+        return payload
+
+    except ValueError as e:
+        # Malformed binary body
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    finally:
+        worker_pool.release(admitted)
+
+@app.websocket("/ws/predict")
+async def predict_stream(websocket: WebSocket, stream_id: str = None):
+    # Client sends binary JPEG frames as fast as it likes; we always run the
+    # newest one. Frames that arrive while inference is busy overwrite the
+    # pending slot, so results never lag behind the camera.
+    await websocket.accept()
+    stream_id = stream_id or (websocket.client.host if websocket.client else "default")
+
+    pending = {"frame": None, "seq": 0, "closed": False}
+    frame_ready = asyncio.Event()
+    dropped = 0
+
+    async def receive_frames():
+        nonlocal dropped
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is None:
+                    continue  # text messages are ignored
+                if pending["frame"] is not None:
+                    dropped += 1  # never processed: a newer frame replaced it
+                pending["frame"] = message["bytes"]
+                pending["seq"] += 1
+                frame_ready.set()
+        finally:
+            pending["closed"] = True
+            frame_ready.set()
+
+    receiver = asyncio.create_task(receive_frames())
+    try:
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            if pending["closed"]:
+                break
+
+            image_bytes, seq = pending["frame"], pending["seq"]
+            pending["frame"] = None
+
+            # Not ready yet or overloaded: skip this frame, the next one may get through
+            if not startup_report["ready"] or not worker_pool.admit():
+                dropped += 1
+                continue
+
+            start = time.perf_counter()
+            timings = {}
+            try:
+                current_version, detections, batch_info, session = await detect(image_bytes, stream_id, timings)
+                latency = (time.perf_counter() - start) * 1000
+                metrics.REQUEST_SECONDS.labels(endpoint="ws_predict", model=current_version).observe(latency / 1000)
+                audit("ws_predict", stream_id, current_version, latency, timings, batch_info, detections, frame=seq)
+                result = {
+                    "model": current_version,
+                    "detections": to_dicts(detections),
+                    "latency_ms": latency,
+                    "timings_ms": timings,
+                    "batch_size": batch_info["batch_size"],
+                    "cached": batch_info["cached"],
+                    "pacing": pacing(current_version, session),
+                }
+            except Exception as e:
+                metrics.ERRORS.labels(stage="ws_predict").inc()
+                logger.error(f"Stream Prediction Error: {e}")
+                audit("ws_predict", stream_id, None, 0, timings, error=str(e), frame=seq)
+                result = {"model": "error", "detections": [], "latency_ms": 0, "error": str(e), "pacing": pacing()}
+            finally:
+                worker_pool.release()
+
+            result["frame"] = seq
+            result["dropped_frames"] = dropped
+            await websocket.send_json(result)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
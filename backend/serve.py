@@ -0,0 +1,74 @@
+import os
+import signal
+import logging
+import threading
+import multiprocessing as mp
+import uvicorn
+
+logger = logging.getLogger("backend")
+
+# Container entrypoint ("python -m backend.serve").
+#   MODEL_HOST=0 (default): plain uvicorn; with WEB_CONCURRENCY > 1 every worker
+#                 loads and warms up its own copy of the models.
+#   MODEL_HOST=1: one model-host process owns the models and the
+#                 WEB_CONCURRENCY uvicorn workers hand it decoded frames through
+#                 shared memory (utils/model_host.py), so adding workers adds
+#                 HTTP / decode capacity without adding model copies.
+# Per-stream state (StreamSessions, FrameCache, AlertFilter, FramePacer) lives
+# in each uvicorn worker, and uvicorn spreads connections across workers, so
+# keep WEB_CONCURRENCY=1 for webcam streams that rely on it.
+MODEL_HOST = os.getenv("MODEL_HOST", "0") == "1"
+MODEL_HOST_SOCKET = os.getenv("MODEL_HOST_SOCKET", "/tmp/model_host.sock")
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+# Batches the host runs side by side (default: one per HTTP worker); the CPU
+# budget is split between them like between uvicorn workers
+MODEL_HOST_THREADS = int(os.getenv("MODEL_HOST_THREADS", str(WEB_CONCURRENCY)))
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+
+
+def run_host(socket_path, threads):
+    # Same model settings as backend/app.py reads for in-process serving
+    from backend.utils.model_loader import ModelManager
+    from backend.utils.runtime import RuntimeProfile
+    from backend.utils.cascade import RoiCascade
+    from backend.utils.model_host import ModelHost
+
+    logging.basicConfig(level=logging.INFO)
+    cascade = None
+    if os.getenv("CASCADE", "0") == "1":
+        cascade = RoiCascade(person_size=int(os.getenv("CASCADE_PERSON_SIZE", "320")),
+                             roi_size=int(os.getenv("CASCADE_ROI_SIZE", "480")),
+                             roi_margin=float(os.getenv("CASCADE_ROI_MARGIN", "0.2")))
+    model_manager = ModelManager(letterbox=os.getenv("YOLO_LETTERBOX", "1") == "1",
+                                 yolo_variant=os.getenv("YOLO_VARIANT", "fp32"),
+                                 runtime=RuntimeProfile.from_env(processes=threads), cascade=cascade)
+    ModelHost(model_manager, socket_path, threads=threads).serve_forever()
+
+
+def watch(host):
+    # Without its host the workers can't serve: stop, so the container restarts
+    host.join()
+    logger.error(f"Model host exited (code {host.exitcode}), shutting down")
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    host = None
+    if MODEL_HOST:
+        host = mp.get_context("spawn").Process(target=run_host, args=(MODEL_HOST_SOCKET, MODEL_HOST_THREADS),
+                                               name="model-host", daemon=True)
+        host.start()
+        threading.Thread(target=watch, args=(host,), daemon=True).start()
+        logger.info(f"Model host started (pid {host.pid}), {WEB_CONCURRENCY} HTTP worker(s)")
+    try:
+        uvicorn.run("backend.app:app", host=HOST, port=PORT, workers=WEB_CONCURRENCY)
+    finally:
+        if host is not None and host.is_alive():
+            host.terminate()
+            host.join(5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import time
+import logging
+import threading
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("backend")
+
+
+class AlertDispatcher:
+    # Delivers alerts to the alert service from a background thread.
+    # send() only appends to an in-memory buffer, so /predict never blocks on
+    # the network. The sender thread wakes up every flush_interval_ms, merges
+    # repeats of the same alert, and POSTs them as one batch over a pooled
+    # keep-alive connection. Failed batches go back to the front of the buffer
+    # and are retried with exponential backoff; if the buffer fills up the
+    # oldest alerts are dropped (and counted).
+
+    def __init__(self, url, max_buffer=1000, max_batch=100, flush_interval_ms=200,
+                 timeout_s=1.0, max_backoff_s=10.0, observer=None):
+        self.url = url
+        # observer(seconds, alerts, ok) is called after every delivery attempt
+        self.observer = observer
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval_ms / 1000
+        self.timeout_s = timeout_s
+        self.max_backoff_s = max_backoff_s
+
+        self.buffer = deque()
+        self.max_buffer = max_buffer
+        self.cond = threading.Condition()
+        self.thread = None
+        self.stopping = False
+
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
+        # Metrics
+        self.enqueued_total = 0
+        self.sent_total = 0
+        self.coalesced_total = 0
+        self.dropped_total = 0
+        self.failed_batches_total = 0
+        self.consecutive_failures = 0
+
+    def start(self):
+        self.stopping = False
+        self.thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout_s=2.0):
+        # Wake the sender so it makes one last delivery attempt before exiting
+        with self.cond:
+            self.stopping = True
+            self.cond.notify()
+        if self.thread:
+            self.thread.join(timeout_s)
+        self.session.close()
+
+    def send(self, payload):
+        with self.cond:
+            if len(self.buffer) >= self.max_buffer:
+                self.buffer.popleft()
+                self.dropped_total += 1
+            self.buffer.append(payload)
+            self.enqueued_total += 1
+            self.cond.notify()
+
+    def _take_batch(self):
+        with self.cond:
+            while not self.buffer and not self.stopping:
+                self.cond.wait()
+        if not self.stopping:
+            # Give bursts (e.g. several phones in one frame) a moment to pile up.
+            # On shutdown we flush what's left without waiting.
+            time.sleep(self.flush_interval)
+
+        with self.cond:
+            batch = [self.buffer.popleft() for _ in range(min(self.max_batch, len(self.buffer)))]
+        return batch
+
+    def _coalesce(self, batch):
+        # Same object_class (and stream, when present) within one flush -> one alert
+        # carrying the highest confidence and how many times it fired
+        merged = {}
+        for payload in batch:
+            key = (payload.get("stream_id"), payload["object_class"])
+            if key in merged:
+                entry = merged[key]
+                entry["confidence"] = max(entry["confidence"], payload["confidence"])
+                entry["count"] += payload.get("count", 1)
+                self.coalesced_total += 1
+            else:
+                merged[key] = dict(payload, count=payload.get("count", 1))
+        return list(merged.values())
+
+    def _requeue(self, batch):
+        with self.cond:
+            for payload in reversed(batch):
+                if len(self.buffer) >= self.max_buffer:
+                    self.dropped_total += 1
+                    continue
+                self.buffer.appendleft(payload)
+
+    def _post(self, alerts):
+        response = self.session.post(self.url, json=alerts, timeout=self.timeout_s)
+        response.raise_for_status()
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                if self.stopping:
+                    return
+                continue
+
+            alerts = self._coalesce(batch)
+            start = time.perf_counter()
+            try:
+                self._post(alerts)
+                self.sent_total += len(alerts)
+                self.consecutive_failures = 0
+                if self.observer is not None:
+                    self.observer(time.perf_counter() - start, len(alerts), True)
+            except Exception as e:
+                if self.observer is not None:
+                    self.observer(time.perf_counter() - start, len(alerts), False)
+                self.failed_batches_total += 1
+                self.consecutive_failures += 1
+                if self.stopping:
+                    logger.warning(f"Dropping {len(alerts)} alerts on shutdown: {e}")
+                    return
+                logger.warning(f"Alert delivery failed ({len(alerts)} alerts), will retry: {e}")
+                self._requeue(alerts)
+                backoff = min(self.max_backoff_s, self.flush_interval * 2 ** self.consecutive_failures)
+                with self.cond:
+                    self.cond.wait_for(lambda: self.stopping, timeout=backoff)
+
+    def stats(self):
+        return {
+            "buffered": len(self.buffer),
+            "max_buffer": self.max_buffer,
+            "enqueued_total": self.enqueued_total,
+            "sent_total": self.sent_total,
+            "coalesced_total": self.coalesced_total,
+            "dropped_total": self.dropped_total,
+            "failed_batches_total": self.failed_batches_total,
+        }
@@ -0,0 +1,309 @@
+import os
+import json
+import zlib
+import gzip
+import time
+import logging
+import threading
+from collections import deque
+import numpy as np
+from backend.utils.detections import from_arrays
+
+logger = logging.getLogger("backend")
+
+# Finished segments are "audit-<UTC start>-<pid>-<process start>-<seq>.jsonl.gz";
+# the one being written carries an extra OPEN_SUFFIX, so readers never pick it
+# up half-done. The process start tells a reused PID (a restarted container's
+# PID 1) from the process that wrote the segment.
+SEGMENT_PREFIX = "audit-"
+SEGMENT_SUFFIX = ".jsonl.gz"
+OPEN_SUFFIX = ".open"
+
+
+def process_start(pid):
+    # Start time of a process in clock ticks since boot (Linux /proc), or None
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The command name (field 2) may contain spaces; starttime is field 22
+            return f.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+def writer_alive(pid, started):
+    # Is the process that opened a segment still running?
+    if pid == os.getpid():
+        return False  # an earlier life of this PID
+    ticks = process_start(pid)
+    if ticks is not None or os.path.isdir("/proc"):
+        return ticks == started
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def compact(dets):
+    # Detection array -> columns, a third of the size of the response's dicts
+    return {
+        "class_id": dets["class_id"].tolist(),
+        "score": np.round(dets["score"].astype(np.float64), 4).tolist(),
+        "box": dets["box"].tolist(),
+    }
+
+
+def expand(columns):
+    return from_arrays(columns["box"], columns["score"], columns["class_id"])
+
+
+class AuditLog:
+    # Structured per-request records (stream, model, stage timings, detections)
+    # written to rotated, gzip-compressed JSONL segments from a background
+    # thread. record() only appends to an in-memory buffer, so request handling
+    # never waits on the disk. The writer wakes up every flush_interval_ms,
+    # serializes what piled up and appends it to the open segment as one gzip
+    # member (concatenated members are still one valid gzip file). A segment is
+    # finished once it reaches segment_bytes or segment_max_age_s, and the
+    # oldest finished segments are deleted while the directory holds more than
+    # max_bytes. If the buffer fills up (disk too slow) the oldest records are
+    # dropped and counted, like AlertDispatcher does with alerts.
+
+    def __init__(self, directory, segment_bytes=64 << 20, max_bytes=1 << 30, segment_max_age_s=60,
+                 max_buffer=10000, max_batch=2000, flush_interval_ms=1000, compresslevel=6):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.segment_max_age_s = segment_max_age_s
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval_ms / 1000
+        self.compresslevel = compresslevel
+
+        self.buffer = deque()
+        self.max_buffer = max_buffer
+        self.cond = threading.Condition()
+        self.thread = None
+        self.stopping = False
+
+        self.file = None
+        self.path = None
+        self.opened_at = 0.0
+        self.seq = 0
+        self.started = None  # process_start of this process (a random nonce without /proc)
+
+        # Metrics
+        self.enqueued_total = 0
+        self.written_total = 0
+        self.dropped_total = 0
+        self.write_errors_total = 0
+        self.bytes_written_total = 0
+        self.segments_total = 0
+        self.deleted_segments_total = 0
+        self.disk_bytes = 0
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.started = process_start(os.getpid()) or os.urandom(4).hex()
+        self._recover()
+        self._enforce_cap()
+        self.stopping = False
+        self.thread = threading.Thread(target=self._run, name="audit-log", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout_s=5.0):
+        # The writer flushes what's buffered and finishes its segment before exiting
+        with self.cond:
+            self.stopping = True
+            self.cond.notify()
+        if self.thread:
+            self.thread.join(timeout_s)
+
+    def record(self, entry):
+        # entry: a JSON-able dict; "detections" may be a detection array, it is
+        # compacted on the writer thread
+        entry.setdefault("ts", time.time())
+        with self.cond:
+            if len(self.buffer) >= self.max_buffer:
+                self.buffer.popleft()
+                self.dropped_total += 1
+            self.buffer.append(entry)
+            self.enqueued_total += 1
+
+    def _take_batch(self):
+        with self.cond:
+            if not self.stopping:
+                self.cond.wait(self.flush_interval)
+            return [self.buffer.popleft() for _ in range(min(self.max_batch, len(self.buffer)))]
+
+    def _encode(self, batch):
+        lines = []
+        for entry in batch:
+            dets = entry.get("detections")
+            if isinstance(dets, np.ndarray):
+                entry = dict(entry, detections=compact(dets))
+            lines.append(json.dumps(entry, separators=(",", ":")))
+        lines.append("")
+        # One gzip member per batch
+        return gzip.compress("\n".join(lines).encode(), compresslevel=self.compresslevel)
+
+    def _open(self):
+        started = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+        name = f"{SEGMENT_PREFIX}{started}-{os.getpid()}-{self.started}-{self.seq:04d}{SEGMENT_SUFFIX}"
+        self.seq += 1
+        self.path = os.path.join(self.directory, name)
+        self.file = open(self.path + OPEN_SUFFIX, "ab")
+        self.opened_at = time.monotonic()
+
+    def _finish(self):
+        if self.file is None:
+            return
+        self.file.close()
+        os.replace(self.path + OPEN_SUFFIX, self.path)
+        self.file = None
+        self.segments_total += 1
+        self._enforce_cap()
+
+    def _write(self, batch):
+        data = self._encode(batch)
+        if self.file is None:
+            self._open()
+        self.file.write(data)
+        self.file.flush()
+        self.written_total += len(batch)
+        self.bytes_written_total += len(data)
+        if self.file.tell() >= self.segment_bytes:
+            self._finish()
+
+    def _segments(self):
+        # (name, size) of this directory's segments, oldest first; several
+        # uvicorn workers can share one directory
+        segments = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.startswith(SEGMENT_PREFIX):
+                    try:
+                        segments.append((entry.name, entry.stat().st_size))
+                    except FileNotFoundError:
+                        pass  # deleted by another worker meanwhile
+        return sorted(segments)
+
+    def _enforce_cap(self):
+        segments = self._segments()
+        total = sum(size for _, size in segments)
+        for name, size in segments:
+            if total <= self.max_bytes:
+                break
+            if not name.endswith(SEGMENT_SUFFIX):
+                continue  # still being written
+            try:
+                os.remove(os.path.join(self.directory, name))
+                self.deleted_segments_total += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.disk_bytes = total
+
+    def _recover(self):
+        # Open segments left behind by a process that died: everything up to
+        # its last complete gzip member is readable, so finish them
+        for name, _ in self._segments():
+            if not name.endswith(OPEN_SUFFIX):
+                continue
+            try:
+                _, _, pid, started, _ = name[:-len(SEGMENT_SUFFIX + OPEN_SUFFIX)].split("-")
+                if writer_alive(int(pid), started):
+                    continue  # a live sibling worker's segment
+            except ValueError:
+                pass  # not a name we write: finish it
+            path = os.path.join(self.directory, name)
+            try:
+                os.replace(path, path[:-len(OPEN_SUFFIX)])
+            except FileNotFoundError:
+                pass
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            try:
+                if batch:
+                    self._write(batch)
+                done = self.stopping and not self.buffer
+                if self.file is not None and (done or time.monotonic() - self.opened_at >= self.segment_max_age_s):
+                    self._finish()
+            except Exception as e:
+                # Never take the server down over the audit log: drop the batch
+                self.write_errors_total += 1
+                logger.warning(f"Audit log write failed ({len(batch)} records dropped): {e}")
+                if self.file is not None:
+                    try:
+                        self._finish()
+                    except Exception:
+                        self.file = None
+            if self.stopping and not self.buffer:
+                return
+
+    def stats(self):
+        return {
+            "buffered": len(self.buffer),
+            "max_buffer": self.max_buffer,
+            "enqueued_total": self.enqueued_total,
+            "written_total": self.written_total,
+            "dropped_total": self.dropped_total,
+            "write_errors_total": self.write_errors_total,
+            "bytes_written_total": self.bytes_written_total,
+            "segments_total": self.segments_total,
+            "deleted_segments_total": self.deleted_segments_total,
+            "disk_bytes": self.disk_bytes,
+        }
+
+
+def read_segment(path):
+    # Records of one segment; a truncated last member (a process killed
+    # mid-write) ends the segment instead of failing the read
+    with open(path, "rb") as f:
+        data = f.read()
+    lines = []
+    while data:
+        d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            chunk = d.decompress(data)
+        except zlib.error:
+            break
+        if not d.eof:
+            break
+        lines.extend(chunk.splitlines())
+        data = d.unused_data
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(entry.get("detections"), dict):
+            entry["detections"] = expand(entry["detections"])
+        yield entry
+
+
+def segment_paths(directory, follow=False, poll_s=1.0):
+    # Every finished segment in the directory, oldest first. With follow, keeps
+    # picking up new segments as the server finishes them.
+    seen = set()
+    while True:
+        names = sorted(n for n in os.listdir(directory)
+                       if n.startswith(SEGMENT_PREFIX) and n.endswith(SEGMENT_SUFFIX) and n not in seen)
+        for name in names:
+            seen.add(name)
+            yield os.path.join(directory, name)
+        if not follow:
+            return
+        time.sleep(poll_s)
+
+
+def read_audit(directory, follow=False, poll_s=1.0):
+    # Records of every finished segment, with "detections" as detection arrays
+    for path in segment_paths(directory, follow, poll_s):
+        try:
+            yield from read_segment(path)
+        except FileNotFoundError:
+            pass  # rotated away by the size cap
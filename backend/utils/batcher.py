@@ -0,0 +1,147 @@
+import asyncio
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("backend")
+
+
+class BatchScheduler:
+    # Collects concurrent /predict requests into one model call.
+    # A batch is flushed when it reaches max_batch_size or when the oldest
+    # request has waited max_wait_ms, whichever comes first.
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=10, workers=1):
+        self.run_batch = run_batch  # fn(version, [img, ...], [person_boxes, ...]) -> [detections, ...]
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        # Batches run on these threads, never on the event loop. With workers > 1
+        # the next batch is collected while the previous one is still running.
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+        self.slots = None
+        self.queue = None
+        self.task = None
+        self.running = set()
+
+        # Metrics
+        self.requests_total = 0
+        self.batches_total = 0
+        self.failed_batches_total = 0
+        self.last_batch_size = 0
+        self.last_batch_ms = 0.0
+        self.batch_size_counts = {}
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.slots = asyncio.Semaphore(self.workers)
+        self.task = asyncio.create_task(self._worker())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown(wait=False)
+
+    async def submit(self, version, img, person_boxes=None):
+        # Returns (detections, timings) where timings has queue_ms / inference_ms / batch_size.
+        # person_boxes: the stream's last person boxes, for the v2 cascade
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((version, img, person_boxes, future, time.perf_counter()))
+        return await future
+
+    async def submit_many(self, version, imgs):
+        # Queued back to back, so they fill whole batches without waiting.
+        # Returns one (detections, timings) per image, or the exception of
+        # the batch it was in.
+        loop = asyncio.get_running_loop()
+        enqueued = time.perf_counter()
+        futures = []
+        for img in imgs:
+            future = loop.create_future()
+            self.queue.put_nowait((version, img, None, future, enqueued))
+            futures.append(future)
+        return await asyncio.gather(*futures, return_exceptions=True)
+
+    async def _collect(self):
+        # Block for the first request, then keep filling until full or timed out
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _worker(self):
+        while True:
+            batch = await self._collect()
+
+            # A model switch can land mid-batch, so group by version
+            groups = {}
+            for version, img, person_boxes, future, enqueued in batch:
+                groups.setdefault(version, []).append((img, person_boxes, future, enqueued))
+
+            for version, items in groups.items():
+                await self.slots.acquire()
+                task = asyncio.create_task(self._run_group(version, items))
+                self.running.add(task)
+                task.add_done_callback(self.running.discard)
+
+    async def _run_group(self, version, items):
+        loop = asyncio.get_running_loop()
+        imgs = [img for img, _, _, _ in items]
+        person_boxes = [boxes for _, boxes, _, _ in items]
+        start = time.perf_counter()
+        try:
+            results = await loop.run_in_executor(self.executor, self.run_batch, version, imgs, person_boxes)
+        except Exception as e:
+            logger.error(f"Batch inference failed: {e}")
+            self.failed_batches_total += 1
+            for _, _, future, _ in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.slots.release()
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._record(len(items), elapsed_ms)
+        for (_, _, future, enqueued), detections in zip(items, results):
+            # Caller may have gone away (client disconnect)
+            if not future.done():
+                future.set_result((detections, {
+                    "queue_ms": (start - enqueued) * 1000,
+                    "inference_ms": elapsed_ms,
+                    "batch_size": len(items),
+                }))
+
+    def _record(self, size, elapsed_ms):
+        self.requests_total += size
+        self.batches_total += 1
+        self.last_batch_size = size
+        self.last_batch_ms = elapsed_ms
+        self.batch_size_counts[size] = self.batch_size_counts.get(size, 0) + 1
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "workers": self.workers,
+            "batches_running": len(self.running),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "requests_total": self.requests_total,
+            "batches_total": self.batches_total,
+            "failed_batches_total": self.failed_batches_total,
+            "avg_batch_size": self.requests_total / self.batches_total if self.batches_total else 0,
+            "last_batch_size": self.last_batch_size,
+            "last_batch_ms": self.last_batch_ms,
+            "batch_size_counts": self.batch_size_counts,
+        }
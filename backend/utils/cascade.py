@@ -0,0 +1,99 @@
+import numpy as np
+
+# Crop input sizes are multiples of the YOLO stride
+STRIDE = 32
+
+
+class RoiCascade:
+    # Settings and geometry for cascaded v2 inference (ModelManager._predict_cascade).
+    # Stage 1 finds the people: a full-frame pass at person_size (people are
+    # large, so a small input is enough), or the person boxes the stream had
+    # on its previous frame. Stage 2 runs the detector only on the regions
+    # around them, each expanded by roi_margin and letterboxed into a
+    # roi_size-or-smaller input, so small objects in a student's hands get
+    # more model pixels than in a 640 pass over the whole frame.
+    # Needs a model exported with dynamic input size (dynamic=True).
+
+    def __init__(self, person_size=320, roi_size=480, min_roi_size=160, roi_margin=0.2,
+                 person_class=0, person_score=0.5, merge_iou=0.4):
+        self.person_size = person_size
+        self.roi_size = roi_size
+        self.min_roi_size = min_roi_size
+        self.roi_margin = roi_margin
+        self.person_class = person_class
+        self.person_score = person_score
+        self.merge_iou = merge_iou
+
+        # Metrics
+        self.frames_total = 0
+        self.person_passes_total = 0
+        self.hinted_frames_total = 0
+        self.empty_frames_total = 0
+        self.rois_total = 0
+        self.roi_pixels_total = 0
+        self.frame_pixels_total = 0
+
+    def person_boxes(self, detections):
+        # [K, 4] x, y, w, h of the confident people in one detection array
+        keep = (detections["class_id"] == self.person_class) & (detections["score"] >= self.person_score)
+        return detections["box"][keep]
+
+    def rois(self, person_boxes, width, height):
+        # Person boxes -> [K, 4] x0, y0, x1, y1 crops inside the frame. Each box
+        # grows by roi_margin of its size per side (hands, desk, a phone held
+        # out); crops that then overlap are merged, so no pixel runs twice
+        boxes = np.asarray(person_boxes, dtype=np.float64).reshape(-1, 4)
+        if not len(boxes):
+            return np.empty((0, 4), dtype=np.int64)
+        margin = boxes[:, 2:] * self.roi_margin
+        x0y0 = np.clip(boxes[:, :2] - margin, 0, None)
+        x1y1 = np.minimum(boxes[:, :2] + boxes[:, 2:] + margin, [width, height])
+        rois = np.concatenate([np.floor(x0y0), np.ceil(x1y1)], axis=1).astype(np.int64)
+        rois = rois[(rois[:, 2] > rois[:, 0]) & (rois[:, 3] > rois[:, 1])]
+
+        # A handful of people per frame at most, so pairwise merging is cheap
+        i = 0
+        while i < len(rois):
+            a = rois[i]
+            overlap = (rois[:, 0] < a[2]) & (rois[:, 2] > a[0]) & (rois[:, 1] < a[3]) & (rois[:, 3] > a[1])
+            overlap[i] = False
+            if not overlap.any():
+                i += 1
+                continue
+            group = np.vstack([a, rois[overlap]])
+            union = np.concatenate([group[:, :2].min(axis=0), group[:, 2:].max(axis=0)])
+            overlap[i] = True
+            # The union may now touch crops already checked, so start over
+            rois = np.vstack([rois[~overlap], union])
+            i = 0
+        return rois
+
+    def input_size(self, roi):
+        # Native resolution rounded up to the stride, between min_roi_size and
+        # roi_size: a small crop is never blown up past what the model needs
+        long_side = max(roi[2] - roi[0], roi[3] - roi[1])
+        size = -(-long_side // STRIDE) * STRIDE
+        return int(min(self.roi_size, max(self.min_roi_size, size)))
+
+    def record(self, width, height, rois, person_pass):
+        self.frames_total += 1
+        self.person_passes_total += int(person_pass)
+        self.hinted_frames_total += int(not person_pass)
+        self.empty_frames_total += int(not len(rois))
+        self.rois_total += len(rois)
+        self.frame_pixels_total += width * height
+        self.roi_pixels_total += int(((rois[:, 2] - rois[:, 0]) * (rois[:, 3] - rois[:, 1])).sum())
+
+    def stats(self):
+        return {
+            "person_size": self.person_size,
+            "roi_size": self.roi_size,
+            "roi_margin": self.roi_margin,
+            "frames_total": self.frames_total,
+            "person_passes_total": self.person_passes_total,
+            "hinted_frames_total": self.hinted_frames_total,
+            "empty_frames_total": self.empty_frames_total,
+            "rois_total": self.rois_total,
+            # Share of the frame area the detector actually looked at
+            "roi_area_fraction": self.roi_pixels_total / self.frame_pixels_total if self.frame_pixels_total else 0.0,
+        }
@@ -0,0 +1,55 @@
+import logging
+import threading
+
+logger = logging.getLogger("backend")
+
+
+class ConfigWatcher:
+    # Watches a small text config file (e.g. config/current_model.txt) from a
+    # background thread and calls on_change(value) when its content changes.
+    # Only the file's mtime is checked each interval; the file is read only
+    # when that changes, so request handlers never touch the filesystem.
+
+    def __init__(self, path, on_change, interval_s=1.0):
+        self.path = path
+        self.on_change = on_change
+        self.interval_s = interval_s
+        self.last_mtime = None
+        self.last_value = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def read(self):
+        # Current value, also used once at startup to seed the state
+        try:
+            self.last_mtime = self.path.stat().st_mtime_ns
+            self.last_value = self.path.read_text().strip()
+        except FileNotFoundError:
+            self.last_mtime = None
+            self.last_value = None
+        return self.last_value
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="config-watcher", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval_s):
+            try:
+                mtime = self.path.stat().st_mtime_ns
+            except FileNotFoundError:
+                continue
+            if mtime == self.last_mtime:
+                continue
+
+            previous = self.last_value
+            value = self.read()
+            if value and value != previous:
+                try:
+                    self.on_change(value)
+                except Exception as e:
+                    logger.error(f"Config change to {value!r} failed: {e}")
+                    self.last_value = previous
@@ -0,0 +1,119 @@
+import numpy as np
+import cv2
+
+# Uploads bigger than this, or with more pixels, are refused before decoding
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+MAX_IMAGE_PIXELS = 8192 * 8192
+
+# libjpeg can scale by 1/2, 1/4 and 1/8 in the DCT domain while decoding,
+# which is much cheaper than a full decode followed by cv2.resize
+REDUCED_MODES = {8: cv2.IMREAD_REDUCED_COLOR_8, 4: cv2.IMREAD_REDUCED_COLOR_4, 2: cv2.IMREAD_REDUCED_COLOR_2}
+
+# JPEG start-of-frame markers (baseline, progressive, lossless, arithmetic...)
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class ImageError(ValueError):
+    # An upload that isn't a usable image: the client's fault (400), unlike
+    # other ValueErrors raised while serving it
+    pass
+
+
+def _jpeg_size(data):
+    # Walks the marker segments up to the first SOF; returns (width, height) or None
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker == 0xD8 or 0xD0 <= marker <= 0xD7:  # no length field
+            i += 2
+            continue
+        if marker == 0xDA:  # start of scan before any frame header
+            return None
+        length = int.from_bytes(data[i + 2:i + 4], "big")
+        if marker in SOF_MARKERS:
+            if i + 9 > len(data):
+                return None
+            height = int.from_bytes(data[i + 5:i + 7], "big")
+            width = int.from_bytes(data[i + 7:i + 9], "big")
+            return width, height
+        i += 2 + length
+    return None
+
+
+def image_info(data):
+    # (format, width, height) from the header alone, without decoding.
+    # Raises ImageError for payloads that can't be a usable image, so they are
+    # turned away before any decode or model work. width/height are None for
+    # formats whose header isn't parsed here (BMP, WebP).
+    if not data:
+        raise ImageError("Empty image")
+    if len(data) > MAX_IMAGE_BYTES:
+        raise ImageError(f"Image too large ({len(data)} bytes > {MAX_IMAGE_BYTES})")
+
+    if data[:3] == b"\xff\xd8\xff":
+        size = _jpeg_size(data)
+        if size is None:
+            raise ImageError("Corrupt JPEG header")
+        fmt, (width, height) = "jpeg", size
+    elif data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        fmt = "png"
+        width, height = int.from_bytes(data[16:20], "big"), int.from_bytes(data[20:24], "big")
+    elif data[:2] == b"BM" or (data[:4] == b"RIFF" and data[8:12] == b"WEBP"):
+        return ("bmp" if data[:2] == b"BM" else "webp"), None, None
+    else:
+        raise ImageError("Unsupported image format (expected JPEG, PNG, BMP or WebP)")
+
+    if width == 0 or height == 0:
+        raise ImageError("Image has no pixels")
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ImageError(f"Image too large ({width}x{height})")
+    return fmt, width, height
+
+
+def reduction_factor(width, height, min_long=0, min_short=0):
+    # Largest libjpeg scale (8, 4, 2) that keeps the decoded frame at least
+    # min_long on its long side and min_short on its short side, i.e. never
+    # smaller than what the model's resize would produce anyway
+    long_side, short_side = max(width, height), min(width, height)
+    for factor in REDUCED_MODES:
+        if long_side // factor >= min_long and short_side // factor >= min_short:
+            return factor
+    return 1
+
+
+def decode_scaled(data, min_long=0, min_short=0, reduce=True):
+    # Returns (img, (scale_x, scale_y)): multiply boxes found on img by the
+    # scales to get original-image coordinates. img is None if decoding fails.
+    fmt, width, height = image_info(data)
+    factor = reduction_factor(width, height, min_long, min_short) if reduce and fmt == "jpeg" else 1
+
+    nparr = np.frombuffer(data, np.uint8)
+    try:
+        img = cv2.imdecode(nparr, REDUCED_MODES.get(factor, cv2.IMREAD_COLOR))
+    except cv2.error:
+        img = None
+    if img is None:
+        return None, (1.0, 1.0)
+    if factor == 1:
+        return img, (1.0, 1.0)
+    # EXIF rotation may have swapped the axes; libjpeg rounds the reduced
+    # size up, so use the real ratio
+    if (img.shape[1] > img.shape[0]) != (width > height) and width != height:
+        width, height = height, width
+    return img, (width / img.shape[1], height / img.shape[0])
+
+
+def rescale_detections(detections, scale):
+    # Boxes ([x, y, w, h]) of a detection array from a reduced decode back to
+    # original-image pixels
+    sx, sy = scale
+    if sx == 1.0 and sy == 1.0:
+        return detections
+    detections = detections.copy()
+    detections["box"] = (detections["box"] * np.array([sx, sy, sx, sy])).astype(np.int32)
+    return detections
@@ -0,0 +1,125 @@
+import json
+import struct
+import numpy as np
+
+COCO_CLASSES = [
+    "person", "bicycle", "car", "motorcycle", "airplane", "bus", "train", "truck", "boat", "traffic light",
+    "fire hydrant", "stop sign", "parking meter", "bench", "bird", "cat", "dog", "horse", "sheep", "cow",
+    "elephant", "bear", "zebra", "giraffe", "backpack", "umbrella", "handbag", "tie", "suitcase", "frisbee",
+    "skis", "snowboard", "sports ball", "kite", "baseball bat", "baseball glove", "skateboard", "surfboard",
+    "tennis racket", "bottle", "wine glass", "cup", "fork", "knife", "spoon", "bowl", "banana", "apple",
+    "sandwich", "orange", "broccoli", "carrot", "hot dog", "pizza", "donut", "cake", "chair", "couch",
+    "potted plant", "bed", "dining table", "toilet", "tv", "laptop", "mouse", "remote", "keyboard", "cell phone",
+    "microwave", "oven", "toaster", "sink", "refrigerator", "book", "clock", "vase", "scissors", "teddy bear",
+    "hair drier", "toothbrush"
+]
+
+# SSD ids past the 80 COCO names are reported as "unknown"
+CLASS_NAMES = COCO_CLASSES + ["unknown"]
+UNKNOWN_CLASS = len(COCO_CLASSES)
+CLASS_IDS = {name: i for i, name in enumerate(CLASS_NAMES)}
+_NAME_ARRAY = np.array(CLASS_NAMES, dtype=object)
+
+# One frame's detections: a packed (22 bytes per detection) little-endian
+# record array. Box is [x, y, w, h] in original-image pixels.
+DETECTION_DTYPE = np.dtype([("class_id", "<i2"), ("score", "<f4"), ("box", "<i4", (4,))])
+
+# Response encodings, picked from the Accept header; JSON unless asked otherwise
+MEDIA_JSON = "application/json"
+MEDIA_BINARY = "application/x-detections"
+MEDIA_MSGPACK = "application/msgpack"
+
+
+def from_arrays(boxes, scores, class_ids):
+    dets = np.empty(len(scores), dtype=DETECTION_DTYPE)
+    dets["class_id"] = class_ids
+    dets["score"] = scores
+    dets["box"] = np.asarray(boxes).reshape(-1, 4)
+    return dets
+
+
+def class_ids(names):
+    return np.array([CLASS_IDS[name] for name in names], dtype=np.int16)
+
+
+def class_names(dets):
+    # Python str per detection (object array, vectorized lookup)
+    return _NAME_ARRAY[dets["class_id"]]
+
+
+def to_dicts(dets):
+    # The JSON shape clients have always received
+    return [
+        {"class": name, "score": score, "box": box}
+        for name, score, box in zip(class_names(dets).tolist(), dets["score"].tolist(), dets["box"].tolist())
+    ]
+
+
+def negotiate(accept):
+    # Highest-q supported media type in an Accept header; JSON by default
+    best, best_q = MEDIA_JSON, 0.0
+    for part in (accept or "").split(","):
+        fields = part.strip().split(";")
+        media = fields[0].strip().lower()
+        q = 1.0
+        for param in fields[1:]:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media in (MEDIA_JSON, MEDIA_BINARY, MEDIA_MSGPACK) and q > best_q:
+            if media == MEDIA_MSGPACK and not _has_msgpack():
+                continue
+            best, best_q = media, q
+    return best
+
+
+def _has_msgpack():
+    try:
+        import msgpack  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def encode(payload, frames, media):
+    # payload: the response fields other than detections; frames: one
+    # detection array per image (None for an image that failed).
+    #   binary:  uint32 header length | JSON header | records of every frame, back to back.
+    #            The header has the payload plus "counts" (records per frame, -1 = failed)
+    #            and "dtype", so np.frombuffer can read the records without copying.
+    #            class_id indexes CLASS_NAMES (served at /classes).
+    #   msgpack: payload plus "detections", one columnar {class_id, score, box} per frame.
+    if media == MEDIA_BINARY:
+        header = dict(payload, counts=[-1 if f is None else len(f) for f in frames], dtype=DETECTION_DTYPE.descr)
+        header_bytes = json.dumps(header).encode()
+        return b"".join([struct.pack("<I", len(header_bytes)), header_bytes] +
+                        [f.tobytes() for f in frames if f is not None])
+    if media == MEDIA_MSGPACK:
+        import msgpack
+        return msgpack.packb(dict(payload, detections=[
+            None if f is None else {
+                "class_id": f["class_id"].tolist(),
+                "score": f["score"].tolist(),
+                "box": f["box"].ravel().tolist(),
+            }
+            for f in frames
+        ]))
+    raise ValueError(f"Unsupported media type: {media}")
+
+
+def decode_binary(body):
+    # Client side of MEDIA_BINARY: returns (header, [detection array or None per frame])
+    (length,) = struct.unpack_from("<I", body)
+    header = json.loads(body[4:4 + length])
+    records = np.frombuffer(body, dtype=DETECTION_DTYPE, offset=4 + length)
+    frames, offset = [], 0
+    for count in header["counts"]:
+        if count < 0:
+            frames.append(None)
+            continue
+        frames.append(records[offset:offset + count])
+        offset += count
+    return header, frames
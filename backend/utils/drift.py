@@ -0,0 +1,325 @@
+import json
+import math
+import time
+from collections import deque
+import numpy as np
+from backend.utils.detections import class_names, to_dicts
+
+# Fixed bins, so histograms from any window (or any process) can be compared
+CONFIDENCE_EDGES = np.linspace(0.0, 1.0, 21)
+# sqrt(box area) in pixels, log-spaced: 4px .. 2048px
+BOX_SIZE_EDGES = np.concatenate([[0.0], np.geomspace(4, 2048, 19), [np.inf]])
+# Detections per frame: 0, 1, ..., 19, 20+
+DETECTION_COUNT_EDGES = np.concatenate([np.arange(21), [np.inf]])
+OTHER_CLASS = "other"  # every class the baseline never saw
+
+PSI_THRESHOLD = 0.2
+P_VALUE_THRESHOLD = 0.01
+
+
+def records_to_arrays(records):
+    # records: frame results, each {"detections": [{"class", "score", "box"}, ...]}
+    # or a detection array (utils/detections.py), as the server observes them.
+    # Returns (classes, scores, box sizes, detections per frame) as flat arrays.
+    frames = [r.get("detections") for r in records]
+    if frames and all(isinstance(f, np.ndarray) for f in frames):
+        per_frame = np.array([len(f) for f in frames], dtype=np.int64)
+        dets = np.concatenate(frames)
+        boxes = dets["box"].astype(np.float64)
+        sizes = np.sqrt(np.clip(boxes[:, 2], 0, None) * np.clip(boxes[:, 3], 0, None))
+        return class_names(dets), dets["score"].astype(np.float64), sizes, per_frame
+    records = [{"detections": to_dicts(f)} if isinstance(f, np.ndarray) else r for r, f in zip(records, frames)]
+    per_frame = np.fromiter((len(r.get("detections") or []) for r in records), dtype=np.int64, count=len(records))
+    detections = [d for r in records for d in (r.get("detections") or [])]
+    classes = np.array([d["class"] for d in detections], dtype=object)
+    scores = np.fromiter((d["score"] for d in detections), dtype=np.float64, count=len(detections))
+    boxes = np.array([d["box"] for d in detections], dtype=np.float64).reshape(-1, 4)
+    sizes = np.sqrt(np.clip(boxes[:, 2], 0, None) * np.clip(boxes[:, 3], 0, None))
+    return classes, scores, sizes, per_frame
+
+
+class Histograms:
+    # Counts for one set of frames. Adding frames is a handful of bincount /
+    # searchsorted calls, so memory and cost never depend on how many frames
+    # have been seen. With open_vocabulary, unseen class names get their own
+    # bin (used while building a baseline) instead of landing in OTHER_CLASS.
+
+    def __init__(self, class_names, open_vocabulary=False):
+        self.class_names = list(class_names)
+        if OTHER_CLASS not in self.class_names:
+            self.class_names.append(OTHER_CLASS)
+        self.class_index = {name: i for i, name in enumerate(self.class_names)}
+        self.other = self.class_index[OTHER_CLASS]
+        self.open_vocabulary = open_vocabulary
+        self.classes = np.zeros(len(self.class_names), dtype=np.int64)
+        self.confidence = np.zeros(len(CONFIDENCE_EDGES) - 1, dtype=np.int64)
+        self.box_size = np.zeros(len(BOX_SIZE_EDGES) - 1, dtype=np.int64)
+        self.detection_count = np.zeros(len(DETECTION_COUNT_EDGES) - 1, dtype=np.int64)
+        self.frames = 0
+
+    def add(self, classes, scores, sizes, per_frame):
+        if len(classes):
+            # Map the few distinct names once, then index the whole array
+            names, inverse = np.unique(classes, return_inverse=True)
+            if self.open_vocabulary:
+                self._extend(name for name in names if name not in self.class_index)
+            lookup = np.array([self.class_index.get(name, self.other) for name in names], dtype=np.int64)
+            self.classes += np.bincount(lookup[inverse], minlength=len(self.classes))
+        self.confidence += _bin(scores, CONFIDENCE_EDGES)
+        self.box_size += _bin(sizes, BOX_SIZE_EDGES)
+        self.detection_count += _bin(per_frame, DETECTION_COUNT_EDGES)
+        self.frames += len(per_frame)
+
+    def _extend(self, new_names):
+        for name in new_names:
+            self.class_index[name] = len(self.class_names)
+            self.class_names.append(name)
+        self.classes = np.pad(self.classes, (0, len(self.class_names) - len(self.classes)))
+
+    def add_records(self, records):
+        self.add(*records_to_arrays(records))
+
+    def features(self):
+        return {
+            "classes": self.classes,
+            "confidence": self.confidence,
+            "box_size": self.box_size,
+            "detection_count": self.detection_count,
+        }
+
+    def __iadd__(self, other):
+        for name, counts in other.features().items():
+            getattr(self, name)[:] += counts
+        self.frames += other.frames
+        return self
+
+    def __isub__(self, other):
+        for name, counts in other.features().items():
+            getattr(self, name)[:] -= counts
+        self.frames -= other.frames
+        return self
+
+    def to_dict(self):
+        return {
+            "frames": self.frames,
+            "class_names": self.class_names,
+            "histograms": {name: counts.tolist() for name, counts in self.features().items()},
+            "edges": {
+                "confidence": CONFIDENCE_EDGES.tolist(),
+                "box_size": BOX_SIZE_EDGES[1:-1].tolist(),
+                "detection_count": DETECTION_COUNT_EDGES[:-1].tolist(),
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        hist = cls(data["class_names"])
+        for name, counts in data["histograms"].items():
+            getattr(hist, name)[:] = counts
+        hist.frames = data["frames"]
+        return hist
+
+
+def _bin(values, edges):
+    # Histogram over fixed edges; values past the last edge land in the last bin
+    idx = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 2)
+    return np.bincount(idx, minlength=len(edges) - 1)
+
+
+def build_baseline(records_chunks, model_version=None):
+    # records_chunks: iterable of record lists, e.g. chunks of a JSONL log
+    hist = Histograms([], open_vocabulary=True)
+    for records in records_chunks:
+        hist.add_records(records)
+    baseline = hist.to_dict()
+    baseline["model_version"] = model_version
+    return baseline
+
+
+def save_baseline(baseline, path):
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=4)
+
+
+def load_baseline(path):
+    with open(path) as f:
+        data = json.load(f)
+    baseline = Histograms.from_dict(data)
+    baseline.model_version = data.get("model_version")
+    return baseline
+
+
+# --- STATISTICAL TESTS (binned; no scipy needed) ---
+
+def psi(expected, actual, eps=1e-4):
+    # Population stability index: < 0.1 stable, 0.1 - 0.2 moderate, > 0.2 shifted
+    e = np.maximum(expected / max(expected.sum(), 1), eps)
+    a = np.maximum(actual / max(actual.sum(), 1), eps)
+    return float(np.sum((a - e) * np.log(a / e)))
+
+
+def ks_binned(expected, actual):
+    # Two-sample Kolmogorov-Smirnov on histograms over the same ordered bins.
+    # Binning can only lower the statistic, so this is conservative.
+    n, m = expected.sum(), actual.sum()
+    if n == 0 or m == 0:
+        return None, None
+    stat = float(np.max(np.abs(np.cumsum(expected) / n - np.cumsum(actual) / m)))
+    en = math.sqrt(n * m / (n + m))
+    lam = (en + 0.12 + 0.11 / en) * stat
+    # Kolmogorov distribution tail
+    p = 2 * sum((-1) ** (k - 1) * math.exp(-2 * k * k * lam * lam) for k in range(1, 101))
+    return stat, float(min(max(p, 0.0), 1.0))
+
+
+def chi_square(expected, actual, min_expected=5):
+    # Goodness of fit of the actual counts to the baseline proportions.
+    # Bins with too few expected counts are pooled so the test stays valid.
+    total = actual.sum()
+    if total == 0 or expected.sum() == 0:
+        return None, None, 0
+    exp = expected / expected.sum() * total
+    small = exp < min_expected
+    if small.any():
+        exp = np.append(exp[~small], exp[small].sum())
+        act = np.append(actual[~small], actual[small].sum())
+    else:
+        act = actual
+    keep = exp > 0
+    exp, act = exp[keep], act[keep]
+    dof = len(exp) - 1
+    if dof < 1:
+        return 0.0, 1.0, 0
+    stat = float(np.sum((act - exp) ** 2 / exp))
+    return stat, _chi2_sf(stat, dof), dof
+
+
+def _chi2_sf(x, dof):
+    # P(X > x) for chi-square(dof) = regularized upper incomplete gamma Q(dof/2, x/2)
+    a, x = dof / 2, x / 2
+    if x <= 0:
+        return 1.0
+    if x < a + 1:
+        # Series for P, then Q = 1 - P
+        term = total = 1.0 / a
+        for n in range(1, 500):
+            term *= x / (a + n)
+            total += term
+            if term < total * 1e-12:
+                break
+        return max(0.0, 1.0 - total * math.exp(-x + a * math.log(x) - math.lgamma(a)))
+    # Continued fraction for Q (Lentz)
+    b = x + 1 - a
+    c = 1 / 1e-300
+    d = 1 / b
+    h = d
+    for i in range(1, 500):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = 1e-300 if abs(d) < 1e-300 else d
+        c = b + an / c
+        c = 1e-300 if abs(c) < 1e-300 else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-12:
+            break
+    return min(1.0, math.exp(-x + a * math.log(x) - math.lgamma(a)) * h)
+
+
+def compare(baseline, window, psi_threshold=PSI_THRESHOLD, p_threshold=P_VALUE_THRESHOLD):
+    # Baseline vs window, per feature. A feature drifts when its PSI crosses the
+    # threshold or its test rejects "same distribution".
+    report = {"frames": window.frames, "baseline_frames": baseline.frames, "features": {}}
+    drifted = []
+    for name, expected in baseline.features().items():
+        actual = window.features()[name]
+        result = {"psi": psi(expected, actual)}
+        if name == "classes":
+            result["chi2"], result["p_value"], result["dof"] = chi_square(expected, actual)
+        else:
+            result["ks"], result["p_value"] = ks_binned(expected, actual)
+        result["drift"] = bool(
+            actual.sum() > 0 and (result["psi"] > psi_threshold
+                                  or (result["p_value"] is not None and result["p_value"] < p_threshold))
+        )
+        if result["drift"]:
+            drifted.append(name)
+        report["features"][name] = result
+
+    if baseline.classes[baseline.other] == 0 and window.classes[window.other] > 0:
+        report["unexpected_class_detections"] = int(window.classes[window.other])
+    report["drifted"] = drifted
+    return report
+
+
+class DriftMonitor:
+    # Sliding window over the most recent frames, compared against a baseline.
+    # The window is `buckets` sub-histograms of `bucket_frames` frames each; a
+    # running sum is kept, so sliding costs one subtraction per bucket and the
+    # memory is buckets x bins no matter how many frames stream through.
+    # observe() only buffers; frames are binned in vectorized chunks.
+
+    def __init__(self, baseline, bucket_frames=500, buckets=10, chunk_frames=256,
+                 psi_threshold=PSI_THRESHOLD, p_threshold=P_VALUE_THRESHOLD):
+        self.baseline = baseline
+        self.bucket_frames = bucket_frames
+        self.chunk_frames = chunk_frames
+        self.psi_threshold = psi_threshold
+        self.p_threshold = p_threshold
+
+        self.buckets = deque(maxlen=buckets)
+        self.window = Histograms(baseline.class_names)
+        self.current = Histograms(baseline.class_names)
+        self.pending = []
+
+        # Metrics
+        self.frames_total = 0
+        self.last_report = None
+        self.last_report_at = None
+
+    def observe(self, detections):
+        # detections of one frame: a detection array, or the dicts /predict returns
+        self.pending.append({"detections": detections})
+        if len(self.pending) >= self.chunk_frames:
+            self.flush()
+
+    def observe_records(self, records):
+        self.pending.extend(records)
+        if len(self.pending) >= self.chunk_frames:
+            self.flush()
+
+    def flush(self):
+        records, self.pending = self.pending, []
+        while records:
+            # Fill the current bucket exactly, so buckets stay bucket_frames each
+            room = self.bucket_frames - self.current.frames
+            chunk, records = records[:room], records[room:]
+            hist = Histograms(self.baseline.class_names)
+            hist.add_records(chunk)
+            self.current += hist
+            self.window += hist
+            self.frames_total += hist.frames
+            if self.current.frames >= self.bucket_frames:
+                self._roll()
+
+    def _roll(self):
+        if len(self.buckets) == self.buckets.maxlen:
+            self.window -= self.buckets[0]
+        self.buckets.append(self.current)
+        self.current = Histograms(self.baseline.class_names)
+
+    def report(self):
+        self.flush()
+        self.last_report = compare(self.baseline, self.window, self.psi_threshold, self.p_threshold)
+        self.last_report_at = time.time()
+        return self.last_report
+
+    def stats(self):
+        stats = {"frames_total": self.frames_total, "window_frames": self.window.frames}
+        if self.last_report:
+            for name, result in self.last_report["features"].items():
+                stats[f"{name}_psi"] = result["psi"]
+            stats["drifted_features"] = len(self.last_report["drifted"])
+        return stats
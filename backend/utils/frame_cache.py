@@ -0,0 +1,93 @@
+import time
+import numpy as np
+import cv2
+
+# Change detector input: the frame shrunk to SIGNATURE_SIZE x SIGNATURE_SIZE grey.
+# At 640x480 each cell averages a ~20x15 pixel block, which smooths sensor
+# noise while a phone or a hand still covers several cells.
+SIGNATURE_SIZE = 32
+
+
+def frame_signature(img, size=SIGNATURE_SIZE):
+    # INTER_AREA on the colour frame first, so the grey conversion only
+    # touches size*size pixels
+    small = cv2.resize(img, (size, size), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+
+
+class CachedResult:
+    __slots__ = ("version", "signature", "detections", "computed_at", "frames")
+
+    def __init__(self, version, signature, detections):
+        self.version = version
+        self.signature = signature  # frame the detections were computed on
+        self.detections = detections
+        self.computed_at = time.monotonic()
+        self.frames = 0  # frames answered from this result since
+
+
+class FrameCache:
+    # Reuses a stream's last detections while its camera shows the same scene.
+    # A frame counts as unchanged when fewer than changed_fraction of its
+    # signature cells differ from the last *inferred* frame by more than
+    # pixel_delta grey levels. Comparing against the inferred frame (not the
+    # previous one) means slow drift still adds up to a miss. Every
+    # max_frames frames or max_age_s seconds a real inference is forced anyway.
+
+    def __init__(self, pixel_delta=12, changed_fraction=0.005, max_frames=15, max_age_s=1.0):
+        self.pixel_delta = pixel_delta
+        self.changed_fraction = changed_fraction
+        self.max_frames = max_frames
+        self.max_age_s = max_age_s
+
+        # Metrics
+        self.hits_total = 0
+        self.misses_total = 0
+        self.forced_total = 0
+
+    def lookup(self, session, version, signature):
+        # Cached detections for this frame, or None if it has to be inferred
+        cached = session.cache
+        if cached is None or cached.version != version or signature is None:
+            self.misses_total += 1
+            return None
+
+        if cached.frames >= self.max_frames or time.monotonic() - cached.computed_at >= self.max_age_s:
+            self.forced_total += 1
+            self.misses_total += 1
+            return None
+
+        if not self._unchanged(cached, signature):
+            self.misses_total += 1
+            return None
+
+        cached.frames += 1
+        self.hits_total += 1
+        return cached.detections
+
+    def _unchanged(self, cached, signature):
+        changed = np.count_nonzero(np.abs(signature - cached.signature) > self.pixel_delta)
+        return changed <= self.changed_fraction * signature.size
+
+    def unchanged(self, session, signature):
+        # Same scene as the stream's last inferred frame (no counters touched),
+        # e.g. for a forced refresh of a camera that hasn't moved
+        cached = session.cache
+        return cached is not None and signature is not None and self._unchanged(cached, signature)
+
+    def store(self, session, version, signature, detections):
+        if signature is not None:
+            session.cache = CachedResult(version, signature, detections)
+
+    def stats(self):
+        lookups = self.hits_total + self.misses_total
+        return {
+            "hits_total": self.hits_total,
+            "misses_total": self.misses_total,
+            "forced_refresh_total": self.forced_total,
+            "hit_rate": self.hits_total / lookups if lookups else 0.0,
+            "pixel_delta": self.pixel_delta,
+            "changed_fraction": self.changed_fraction,
+            "max_frames": self.max_frames,
+            "max_age_s": self.max_age_s,
+        }
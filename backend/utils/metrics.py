@@ -0,0 +1,64 @@
+from prometheus_client import Counter, Histogram, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+
+# Buckets sized for a CPU pipeline: sub-ms decode/NMS up to multi-second stalls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1,
+                   0.15, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Stages: read, decode, queue, preprocess, model_run, postprocess, alert_dispatch
+STAGE_SECONDS = Histogram(
+    "backend_stage_seconds", "Time spent in each stage of the inference pipeline",
+    ["stage", "model"], buckets=LATENCY_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "backend_request_seconds", "End-to-end latency per frame",
+    ["endpoint", "model"], buckets=LATENCY_BUCKETS,
+)
+DETECTIONS = Counter("backend_detections", "Detections returned to clients", ["model", "class"])
+ALERTS = Counter("backend_alerts", "Alerts sent on by the detection rules (after dedup / rate limiting)", ["type"])
+ALERTS_SUPPRESSED = Counter("backend_alerts_suppressed", "Alerts dropped by dedup / rate limiting",
+                            ["type", "reason"])
+ALERTS_DELIVERED = Counter("backend_alerts_delivered", "Alerts delivered to the alert service", ["outcome"])
+ERRORS = Counter("backend_errors", "Failed requests / background operations", ["stage"])
+
+
+def observe_stage(stage, model, seconds):
+    STAGE_SECONDS.labels(stage=stage, model=model).observe(seconds)
+
+
+def observe_alert_delivery(seconds, alerts, ok):
+    # AlertDispatcher observer: one call per POST to the alert service
+    STAGE_SECONDS.labels(stage="alert_dispatch", model="").observe(seconds)
+    ALERTS_DELIVERED.labels(outcome="sent" if ok else "failed").inc(alerts)
+
+
+class StatsCollector:
+    # Publishes the plain stats() dicts the scheduler, worker pool, dispatcher
+    # etc. already keep, read at scrape time: keys ending in _total become
+    # counters, every other number a gauge. Nested dicts are skipped.
+
+    def __init__(self, sources):
+        self.sources = sources  # {"scheduler": scheduler.stats, ...}
+
+    def describe(self):
+        # Without it, registering would collect (call every source) right away
+        return []
+
+    def collect(self):
+        for prefix, stats in self.sources.items():
+            for key, value in stats().items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                if key.endswith("_total"):
+                    yield CounterMetricFamily(f"backend_{prefix}_{key[:-len('_total')]}", f"{prefix} {key}", value=value)
+                else:
+                    yield GaugeMetricFamily(f"backend_{prefix}_{key}", f"{prefix} {key}", value=value)
+
+
+def register_stats(sources):
+    REGISTRY.register(StatsCollector(sources))
+
+
+def render():
+    # (body, content type) for the /metrics endpoint
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,440 @@
+import os
+import json
+import queue
+import socket
+import struct
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from backend.utils.detections import DETECTION_DTYPE
+
+logger = logging.getLogger("backend")
+
+# One process (ModelHost) owns the loaded models; every uvicorn worker talks to
+# it through a RemoteModelManager. Pixels and detections never go through the
+# socket: each worker owns a shared-memory segment of `slots` slots, and a
+# slot holds one batch's frames (input region) and the detection records
+# computed from them (output region). The socket only carries small
+# struct-packed messages saying where things are.
+#
+# Message: op (uint8) | request id (uint32) | body
+#   OP_CONTROL  body = JSON (hello, activate, preload, stats)
+#   OP_PREDICT  body = version (2 bytes) | slot (uint16) | frames (uint16)
+#               | per frame: offset, height, width, channels, person boxes (uint32 x 5)
+#               | person boxes of every frame as float32 x, y, w, h
+#               | with slot INLINE_SLOT: the pixels themselves (a frame bigger
+#                 than a slot), offsets counted from here; results come back inline
+#   OP_JSON     reply to OP_CONTROL, JSON
+#   OP_RESULT   reply to OP_PREDICT: ok (bool) | inline (bool) | detections per frame (uint32 each)
+#               | stage timings (uint16 length + JSON), records in the slot's output region
+#               (or appended here, if they didn't fit); on failure the rest is the error message
+OP_CONTROL = 1
+OP_PREDICT = 2
+OP_JSON = 3
+OP_RESULT = 4
+
+HEADER = struct.Struct("<BI")
+PREDICT = struct.Struct("<2sHH")
+FRAME = struct.Struct("<IIIII")
+RESULT = struct.Struct("<??")
+INLINE_SLOT = 0xFFFF
+
+
+def _attach(name):
+    # The host only borrows a worker's segment, so it stays out of the
+    # resource tracker where it can. Before Python 3.13 attaching registers
+    # the name too; under backend/serve.py host and workers share the
+    # launcher's tracker, where that is a no-op (unregistering here would
+    # drop the worker's own registration).
+    try:
+        return SharedMemory(name, track=False)
+    except TypeError:
+        return SharedMemory(name)
+
+
+class ModelHost:
+    # Serves one ModelManager to many worker processes over a Unix socket.
+    # One thread per connected worker reads requests; batches run on a pool
+    # of `threads`, so batches from different workers run side by side (the
+    # preprocess buffers are per thread, sessions are thread-safe).
+
+    def __init__(self, model_manager, socket_path, threads=1):
+        self.model_manager = model_manager
+        self.socket_path = socket_path
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="host-inference")
+        self.threads = threads
+        # Stage timings of the batch running on each thread, sent back with its
+        # result so the worker's /metrics still has them
+        self.local = threading.local()
+        model_manager.observer = self._observe
+
+        # Metrics
+        self.connections = 0
+        self.batches_total = 0
+        self.frames_total = 0
+        self.failed_batches_total = 0
+        self.inline_results_total = 0
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        listener = Listener(self.socket_path, family="AF_UNIX")
+        logger.info(f"Model host listening on {self.socket_path} ({self.threads} inference threads)")
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        self.connections += 1
+        send_lock = threading.Lock()
+        worker = {"shm": None}
+        try:
+            while True:
+                msg = conn.recv_bytes()
+                op, request_id = HEADER.unpack_from(msg)
+                if op == OP_PREDICT:
+                    self.executor.submit(self._predict, conn, send_lock, worker, request_id, msg)
+                else:
+                    reply = self._control(worker, json.loads(msg[HEADER.size:]))
+                    with send_lock:
+                        conn.send_bytes(HEADER.pack(OP_JSON, request_id) + json.dumps(reply).encode())
+        except (EOFError, OSError):
+            pass
+        finally:
+            self.connections -= 1
+            conn.close()
+            if worker["shm"] is not None:
+                try:
+                    worker["shm"].close()
+                except BufferError:
+                    pass  # a batch still holds views; the mapping goes with it
+
+    def _observe(self, stage, version, seconds):
+        timings = getattr(self.local, "timings", None)
+        if timings is not None:
+            timings.append((stage, seconds))
+
+    def _control(self, worker, request):
+        op = request["op"]
+        try:
+            if op == "hello":
+                # A worker (re)connected: map its segment
+                if worker["shm"] is not None:
+                    worker["shm"].close()
+                worker.update(shm=_attach(request["shm"]), input_bytes=request["input_bytes"],
+                              output_bytes=request["output_bytes"])
+                # Static model info, cached by the worker so it never asks again
+                return {"ok": True, "pid": os.getpid(),
+                        "min_decode_size": {v: self.model_manager.min_decode_size(v) for v in ("v1", "v2")}}
+            if op == "activate":
+                self.model_manager.activate(request["version"])
+                return {"ok": True, "model_info": self.model_manager.model_info[request["version"]]}
+            if op == "preload":
+                self.model_manager.preload(request["versions"])
+                return {"ok": True, "model_info": self.model_manager.model_info}
+            if op == "stats":
+                return {"ok": True, "stats": dict(self.model_manager.stats(), host=self.stats())}
+            return {"ok": False, "error": f"Unknown op: {op}"}
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+
+    def _predict(self, conn, send_lock, worker, request_id, msg):
+        version, slot, count = PREDICT.unpack_from(msg, HEADER.size)
+        version = version.decode()
+        offset = HEADER.size + PREDICT.size
+        frames = [FRAME.unpack_from(msg, offset + i * FRAME.size) for i in range(count)]
+        hints_at = offset + count * FRAME.size
+        total_boxes = sum(frame[4] for frame in frames)
+        hints = np.frombuffer(msg, dtype=np.float32, count=total_boxes * 4, offset=hints_at).reshape(-1, 4)
+        if slot == INLINE_SLOT:
+            # Pixels came with the message
+            buf, base, output_bytes = msg, hints_at + hints.nbytes, 0
+        else:
+            buf, base = worker["shm"].buf, slot * (worker["input_bytes"] + worker["output_bytes"])
+            output_bytes = worker["output_bytes"]
+
+        try:
+            # Views straight into the worker's slot: no copy until preprocessing
+            imgs, person_boxes, used = [], [], 0
+            for frame_offset, h, w, c, boxes in frames:
+                imgs.append(np.ndarray((h, w, c), dtype=np.uint8, buffer=buf, offset=base + frame_offset))
+                person_boxes.append(hints[used:used + boxes] if boxes else None)
+                used += boxes
+            self.model_manager.load_model(version)
+            self.local.timings = []
+            results = self.model_manager.predict_batch(version, imgs, person_boxes)
+            timings = json.dumps(self.local.timings).encode()
+            del imgs
+
+            counts = [len(r) for r in results]
+            records = np.concatenate(results) if results else np.empty(0, dtype=DETECTION_DTYPE)
+            inline = slot == INLINE_SLOT or records.nbytes > output_bytes
+            if inline:
+                self.inline_results_total += 1
+                tail = records.tobytes()
+            else:
+                out = np.ndarray(len(records), dtype=DETECTION_DTYPE, buffer=buf,
+                                 offset=base + worker["input_bytes"])
+                out[:] = records
+                tail = b""
+            reply = (RESULT.pack(True, inline) + struct.pack(f"<{count}I", *counts)
+                     + struct.pack("<H", len(timings)) + timings + tail)
+            self.batches_total += 1
+            self.frames_total += count
+        except Exception as e:
+            logger.error(f"Host batch failed: {e}")
+            self.failed_batches_total += 1
+            reply = RESULT.pack(False, False) + str(e).encode()
+        finally:
+            self.local.timings = None
+
+        try:
+            with send_lock:
+                conn.send_bytes(HEADER.pack(OP_RESULT, request_id) + reply)
+        except OSError:
+            pass  # worker went away
+
+    def stats(self):
+        return {
+            "pid": os.getpid(),
+            "threads": self.threads,
+            "connections": self.connections,
+            "batches_total": self.batches_total,
+            "frames_total": self.frames_total,
+            "failed_batches_total": self.failed_batches_total,
+            "inline_results_total": self.inline_results_total,
+        }
+
+
+class RemoteModelManager:
+    # Stands in for ModelManager inside a uvicorn worker when the models live
+    # in a ModelHost: same calls (activate, preload, predict_batch, stats,
+    # min_decode_size...), but no framework imports and no weights here.
+    # Frames are copied once into this worker's shared-memory slot; batches
+    # bigger than a slot go over in several requests, and a single frame
+    # bigger than a slot goes inline through the socket.
+    # Static host info (min decode sizes) is fetched once at
+    # connect, so the event loop never waits on the host for it.
+    # A host that stops answering without dropping the socket is given up on
+    # after request_timeout_s: the connection is torn down, every waiting
+    # request fails with ConnectionError and the next one reconnects.
+
+    def __init__(self, socket_path, slots=2, slot_bytes=8 * 2**20, output_bytes=2**20, connect_timeout_s=60,
+                 request_timeout_s=120, observer=None):
+        self.socket_path = socket_path
+        # observer(stage, version, seconds), fed with the host's stage timings
+        self.observer = observer
+        self.slots = slots
+        self.input_bytes = slot_bytes
+        self.output_bytes = output_bytes
+        self.connect_timeout_s = connect_timeout_s
+        self.request_timeout_s = request_timeout_s
+        self.shm = SharedMemory(create=True, size=slots * (slot_bytes + output_bytes))
+        self.free_slots = queue.Queue()
+        for slot in range(slots):
+            self.free_slots.put(slot)
+
+        self.conn = None
+        self.connect_lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.pending = {}  # request id -> Future
+        self.next_id = 0
+        self.host = {}
+
+        self.model_info = {}
+        self.active_version = None
+        self.cascade = None  # runs in the host
+
+        # Metrics
+        self.inline_frames_total = 0
+        self.timeouts_total = 0
+
+    @property
+    def loaded_versions(self):
+        return list(self.model_info)
+
+    def _connect(self):
+        with self.connect_lock:
+            if self.conn is not None:
+                return
+            deadline = time.monotonic() + self.connect_timeout_s
+            while True:
+                try:
+                    conn = Client(self.socket_path, family="AF_UNIX")
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    # The host may still be starting
+                    if time.monotonic() > deadline:
+                        raise ConnectionError(f"Model host not reachable at {self.socket_path}")
+                    time.sleep(0.1)
+            self.conn = conn
+            threading.Thread(target=self._read_replies, args=(conn,), daemon=True).start()
+        self.host = self._control({"op": "hello", "shm": self.shm.name, "input_bytes": self.input_bytes,
+                                   "output_bytes": self.output_bytes})
+        logger.info(f"Connected to model host (pid {self.host['pid']}) at {self.socket_path}")
+
+    def _read_replies(self, conn):
+        try:
+            while True:
+                msg = conn.recv_bytes()
+                op, request_id = HEADER.unpack_from(msg)
+                future = self.pending.pop(request_id, None)
+                if future is not None:
+                    future.set_result(msg[HEADER.size:])
+        except (EOFError, OSError) as e:
+            logger.error(f"Lost connection to the model host: {e}")
+            with self.connect_lock:
+                if self.conn is conn:
+                    self.conn = None
+            conn.close()
+            for request_id in list(self.pending):
+                future = self.pending.pop(request_id, None)
+                if future is not None:
+                    future.set_exception(ConnectionError("Model host connection lost"))
+
+    def _request(self, op, body):
+        if self.conn is None:
+            self._connect()
+        future = Future()
+        with self.send_lock:
+            self.next_id = (self.next_id + 1) % 2**32
+            request_id = self.next_id
+            self.pending[request_id] = future
+            conn = self.conn
+            try:
+                conn.send_bytes(HEADER.pack(op, request_id) + body)
+            except (OSError, AttributeError) as e:
+                self.pending.pop(request_id, None)
+                raise ConnectionError(f"Model host connection lost: {e}")
+        try:
+            return future.result(self.request_timeout_s)
+        except FutureTimeoutError:
+            self.pending.pop(request_id, None)
+            self.timeouts_total += 1
+            logger.error(f"Model host did not answer within {self.request_timeout_s}s, reconnecting")
+            self._disconnect(conn)
+            raise ConnectionError(f"Model host did not answer within {self.request_timeout_s}s")
+
+    def _disconnect(self, conn):
+        # Shut the socket down rather than close it: the reader thread wakes up
+        # with EOF, fails the other pending requests, clears self.conn and
+        # closes it, so the next request reconnects
+        try:
+            with socket.socket(fileno=os.dup(conn.fileno())) as sock:
+                sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _control(self, request):
+        reply = json.loads(self._request(OP_CONTROL, json.dumps(request).encode()))
+        if not reply["ok"]:
+            raise RuntimeError(reply["error"])
+        return reply
+
+    def load_model(self, version):
+        # The host loads on demand
+        if self.conn is None:
+            self._connect()
+
+    def activate(self, version):
+        reply = self._control({"op": "activate", "version": version})
+        self.model_info[version] = reply["model_info"]
+        previous = self.active_version
+        self.active_version = version
+        if previous != version:
+            logger.info(f"Active model switched {previous} -> {version} (model host)")
+
+    def preload(self, versions):
+        try:
+            self.model_info.update(self._control({"op": "preload", "versions": versions})["model_info"])
+        except (RuntimeError, ConnectionError) as e:
+            logger.error(f"Preloading models {versions} failed: {e}")
+
+    @property
+    def connected(self):
+        return bool(self.host)
+
+    def min_decode_size(self, version):
+        # Cached from the host's hello (warm-up connects, off the event loop)
+        if not self.host:
+            raise ConnectionError("Model host not connected yet")
+        return tuple(self.host["min_decode_size"][version])
+
+    def stats(self):
+        stats = self._control({"op": "stats"})["stats"]
+        stats["remote"] = {"socket": self.socket_path, "slots": self.slots, "slot_bytes": self.input_bytes,
+                           "output_bytes": self.output_bytes, "inline_frames_total": self.inline_frames_total,
+                           "timeouts_total": self.timeouts_total}
+        return stats
+
+    def predict(self, version, img, person_boxes=None):
+        return self.predict_batch(version, [img], [person_boxes])[0]
+
+    def predict_batch(self, version, imgs, person_boxes=None):
+        person_boxes = person_boxes or [None] * len(imgs)
+        results, start = [], 0
+        while start < len(imgs):
+            # As many frames as fit in one slot
+            end, size = start, 0
+            while end < len(imgs) and (end == start or size + imgs[end].nbytes <= self.input_bytes):
+                size += imgs[end].nbytes
+                end += 1
+            # A lone frame bigger than a slot (image_info allows up to 8192 px a side)
+            inline = size > self.input_bytes
+            if inline:
+                self.inline_frames_total += 1
+            results.extend(self._predict_slot(version, imgs[start:end], person_boxes[start:end], inline))
+            start = end
+        return results
+
+    def _predict_slot(self, version, imgs, person_boxes, inline=False):
+        slot = INLINE_SLOT if inline else self.free_slots.get()
+        try:
+            base = 0 if inline else slot * (self.input_bytes + self.output_bytes)
+            frames, hints, offset = [], [], 0
+            for img, boxes in zip(imgs, person_boxes):
+                h, w = img.shape[:2]
+                c = img.shape[2] if img.ndim == 3 else 1
+                if not inline:
+                    np.ndarray(img.shape, dtype=np.uint8, buffer=self.shm.buf, offset=base + offset)[...] = img
+                boxes = np.zeros((0, 4), dtype=np.float32) if boxes is None else np.asarray(boxes, np.float32).reshape(-1, 4)
+                frames.append(FRAME.pack(offset, h, w, c, len(boxes)))
+                hints.append(boxes.tobytes())
+                offset += img.nbytes
+
+            body = PREDICT.pack(version.encode(), slot, len(imgs)) + b"".join(frames) + b"".join(hints)
+            if inline:
+                body += b"".join(np.ascontiguousarray(img).tobytes() for img in imgs)
+            reply = self._request(OP_PREDICT, body)
+            ok, inline_result = RESULT.unpack_from(reply)
+            if not ok:
+                raise RuntimeError(reply[RESULT.size:].decode())
+            counts = struct.unpack_from(f"<{len(imgs)}I", reply, RESULT.size)
+            total = sum(counts)
+            offset = RESULT.size + 4 * len(imgs)
+            (length,) = struct.unpack_from("<H", reply, offset)
+            timings = json.loads(reply[offset + 2:offset + 2 + length])
+            if inline_result:
+                records = np.frombuffer(reply, dtype=DETECTION_DTYPE, count=total, offset=offset + 2 + length).copy()
+            else:
+                # Copied out, since the slot is reused as soon as it's released
+                records = np.frombuffer(self.shm.buf, dtype=DETECTION_DTYPE, count=total,
+                                        offset=base + self.input_bytes).copy()
+        finally:
+            if not inline:
+                self.free_slots.put(slot)
+        if self.observer is not None:
+            for stage, seconds in timings:
+                self.observer(stage, version, seconds)
+        bounds = np.cumsum([0] + list(counts))
+        return [records[bounds[i]:bounds[i + 1]] for i in range(len(imgs))]
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+        self.shm.close()
+        self.shm.unlink()
@@ -1,176 +1,349 @@
+import os
+import time
+import threading
 import numpy as np
 import cv2
 import logging
 from pathlib import Path
-import tensorflow as tf
-import onnxruntime as ort
+from backend.utils.postprocess import decode_yolo
+from backend.utils.preprocess import YoloPreprocessor, SsdPreprocessor
+from backend.utils.runtime import RuntimeProfile, framework, IMPORT_SECONDS
+from backend.utils.detections import COCO_CLASSES, UNKNOWN_CLASS, from_arrays
 
 
 logger = logging.getLogger("backend")
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-COCO_CLASSES = [
-    "person", "bicycle", "car", "motorcycle", "airplane", "bus", "train", "truck", "boat", "traffic light",
-    "fire hydrant", "stop sign", "parking meter", "bench", "bird", "cat", "dog", "horse", "sheep", "cow",
-    "elephant", "bear", "zebra", "giraffe", "backpack", "umbrella", "handbag", "tie", "suitcase", "frisbee",
-    "skis", "snowboard", "sports ball", "kite", "baseball bat", "baseball glove", "skateboard", "surfboard",
-    "tennis racket", "bottle", "wine glass", "cup", "fork", "knife", "spoon", "bowl", "banana", "apple",
-    "sandwich", "orange", "broccoli", "carrot", "hot dog", "pizza", "donut", "cake", "chair", "couch",
-    "potted plant", "bed", "dining table", "toilet", "tv", "laptop", "mouse", "remote", "keyboard", "cell phone",
-    "microwave", "oven", "toaster", "sink", "refrigerator", "book", "clock", "vase", "scissors", "teddy bear",
-    "hair drier", "toothbrush"
-]
+MODEL_VERSIONS = ["v1", "v2"]
+# Imported lazily, when the first model of that version loads
+FRAMEWORKS = {"v1": "tensorflow", "v2": "onnxruntime"}
+
+# Interchangeable v2 models (files in models/v2/): same YOLOv8 output head, so
+# the same pre/postprocessing. int8 files come from utils/quantize.py, the
+# smaller architectures from `yolo export` (see docker/backend.Dockerfile).
+YOLO_VARIANTS = {
+    "fp32": "yolov8m.onnx",
+    "int8_dynamic": "yolov8m_int8.onnx",
+    "int8_static": "yolov8m_int8_static.onnx",
+    "yolov8s": "yolov8s.onnx",
+    "yolov8n": "yolov8n.onnx",
+}
+
+
+def _rss_bytes():
+    # Resident set size of this process (Linux only)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
 
 class ModelManager:
-    def __init__(self):
-        self.loaded_version = None
-        self.model = None
-        self.session = None
+    # Registry of resident models. Several versions can be loaded at once;
+    # switching between resident versions is just a pointer swap, so requests
+    # never wait on a reload.
+
+    def __init__(self, letterbox=True, observer=None, yolo_variant="fp32", runtime=None, cascade=None):
+        # observer(stage, version, seconds) receives preprocess / model_run /
+        # postprocess timings for every batch (used for /metrics)
+        self.observer = observer
+        # Thread counts / session options for TF and ORT (see utils/runtime.py)
+        self.runtime = runtime or RuntimeProfile()
+        if yolo_variant not in YOLO_VARIANTS:
+            raise ValueError(f"Invalid YOLO variant: {yolo_variant} (expected one of {list(YOLO_VARIANTS)})")
+        self.yolo_variant = yolo_variant
+        # Preprocessing buffers are reused per inference thread
+        self.yolo_preprocess = YoloPreprocessor(size=640, letterbox=letterbox)
+        self.ssd_preprocess = SsdPreprocessor(size=300)
+        # Cascaded v2 inference (utils/cascade.py): person pass, then crops only
+        self.cascade = cascade
+        if cascade is not None:
+            self.person_preprocess = YoloPreprocessor(size=cascade.person_size, letterbox=True)
+            self.roi_preprocess = {}  # crop input size -> preprocessor
+        self.models = {}        # version -> TF model (v1) or ONNX session (v2)
+        self.model_info = {}    # version -> load time, memory, warm-up stats
+        self.active_version = None
+        self.lock = threading.Lock()  # serializes loads, not predictions
+
+    @property
+    def loaded_versions(self):
+        return list(self.models)
 
     def load_model(self, version):
-        if self.loaded_version == version:
+        # Make sure a version is resident and warmed up (no-op if it already is)
+        if version in self.models:
             return
+        if version not in MODEL_VERSIONS:
+            raise ValueError("Invalid model version")
+
+        with self.lock:
+            if version in self.models:
+                return
+
+            rss_before = _rss_bytes()
+            imported = FRAMEWORKS[version] not in IMPORT_SECONDS
+            start = time.perf_counter()
+            framework(FRAMEWORKS[version])
+            import_s = time.perf_counter() - start if imported else 0.0
+
+            start = time.perf_counter()
+            if version == "v1":
+                model = self._load_tf_model()
+                logger.info("Loaded baseline TensorFlow SSD MobileNet v2 model")
+            else:
+                model = self._load_yolo_onnx()
+                logger.info(f"Loaded improved YOLOv8 ONNX model ({self.yolo_variant}: {YOLO_VARIANTS[self.yolo_variant]})")
+                if self.cascade is not None and not self._dynamic_input(model):
+                    logger.warning("Cascade disabled: the v2 model has a fixed input size (export with dynamic=True)")
+                    self.cascade = None
+            load_s = time.perf_counter() - start
+
+            warmup_s = self._warm_up(version, model)
+            rss_after = _rss_bytes()
 
+            self.model_info[version] = {
+                "import_s": import_s,
+                "load_s": load_s,
+                "warmup_s": warmup_s,
+                # RSS delta includes framework import/arena growth on first load
+                "memory_bytes": rss_after - rss_before if rss_before is not None else None,
+                "loaded_at": time.time(),
+            }
+            if version == "v2":
+                self.model_info[version]["variant"] = self.yolo_variant
+            # Publish only once fully warmed up
+            self.models[version] = model
+
+    def _warm_up(self, version, model, runs=2):
+        # Dummy inferences so the first real request doesn't pay for
+        # lazy graph init / memory arena growth
+        dummy = np.zeros((480, 640, 3), dtype=np.uint8)
+        start = time.perf_counter()
+        for _ in range(runs):
+            self._run(version, model, [dummy])
+            if version == "v2" and self.cascade is not None:
+                self._predict_cascade(model, [dummy], [np.array([[160, 60, 320, 360]])])
+        return time.perf_counter() - start
+
+    def min_decode_size(self, version):
+        # (long side, short side) a frame can be shrunk to at decode time while
+        # the model's own resize is still a downscale: SSD stretches to
+        # 300x300, YOLO letterboxes the long side to 640 (or stretches to 640x640)
         if version == "v1":
-            self.model = self._load_tf_model()
-            self.session = None
-            self.loaded_version = "v1"
-            logger.info("Loaded baseline TensorFlow SSD MobileNet v2 model")
+            return (self.ssd_preprocess.size, self.ssd_preprocess.size)
+        size = self.yolo_preprocess.size
+        return (size, 0) if self.yolo_preprocess.letterbox else (size, size)
 
-        elif version == "v2":
-            self.session = self._load_yolo_onnx()
-            self.model = None
-            self.loaded_version = "v2"
-            logger.info("Loaded improved YOLOv8n ONNX model")
-        else:
-            raise ValueError("Invalid model version")
+    def activate(self, version):
+        # Load if needed, then switch atomically
+        self.load_model(version)
+        previous = self.active_version
+        self.active_version = version
+        if previous != version:
+            logger.info(f"Active model switched {previous} -> {version}")
+
+    def preload(self, versions):
+        # A version that fails here is logged and left to load lazily on first use
+        for version in versions:
+            try:
+                self.load_model(version)
+            except Exception as e:
+                logger.error(f"Preloading model {version} failed: {e}")
+
+    def unload(self, version):
+        if version == self.active_version:
+            raise ValueError("Cannot unload the active model")
+        with self.lock:
+            self.models.pop(version, None)
+            self.model_info.pop(version, None)
+
+    def stats(self):
+        return {
+            "active_version": self.active_version,
+            "resident": {v: dict(self.model_info[v]) for v in self.models},
+            "process_rss_bytes": _rss_bytes(),
+            "runtime": self.runtime.stats(),
+            "cascade": self.cascade.stats() if self.cascade is not None else None,
+        }
 
     def _load_tf_model(self):
         # Use absolute path
         model_path = BASE_DIR / "models" / "v1"
-        return tf.saved_model.load(str(model_path))
+        self.runtime.configure_tf()
+        return framework("tensorflow").saved_model.load(str(model_path))
 
     def _load_yolo_onnx(self):
-        # Load the Quantized (Int8) model
-        model_path = BASE_DIR / "models" / "v2" / "yolov8m.onnx"
-        
-        # Enable CPU specific optimizations
-        sess_options = ort.SessionOptions()
-        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
-        
-        return ort.InferenceSession(str(model_path), sess_options)
+        # fp32 by default; YOLO_VARIANTS lists the quantized / smaller options
+        model_path = BASE_DIR / "models" / "v2" / YOLO_VARIANTS[self.yolo_variant]
+        if not model_path.exists():
+            raise FileNotFoundError(f"YOLO variant {self.yolo_variant} not found at {model_path}")
+
+        # CPU optimizations + thread limits; the optimized graph is cached on disk if configured
+        return self.runtime.create_session(model_path)
+
+    def predict(self, version, img, person_boxes=None):
+        return self.predict_batch(version, [img], [person_boxes])[0]
 
-    def predict(self, version, img):
+    def predict_batch(self, version, imgs, person_boxes=None):
+        # Runs all images through the model as one batched tensor and
+        # returns one detection list per input image. With the cascade on,
+        # person_boxes[i] (x, y, w, h in imgs[i] pixels, e.g. the stream's
+        # previous frame) lets image i skip the person pass.
+        model = self.models.get(version)
+        if model is None:
+            raise ValueError(f"Model {version} is not loaded")
+        if version == "v2" and self.cascade is not None:
+            return self._predict_cascade(model, imgs, person_boxes or [None] * len(imgs))
+        return self._run(version, model, imgs)
+
+    def _observe(self, stage, version, start):
+        now = time.perf_counter()
+        if self.observer is not None:
+            self.observer(stage, version, now - start)
+        return now
+
+    def _run(self, version, model, imgs):
         if version == "v1":
-            return self._predict_ssd(img)
+            return self._predict_ssd(model, imgs)
         elif version == "v2":
-            return self._predict_yolo(img)
+            return self._predict_yolo(model, imgs)
         else:
             raise ValueError("Invalid version")
 
-    def _predict_ssd(self, img):
-        # Resize to 300x300 expected by SSD MobileNet
-        img_resized = cv2.resize(img, (300, 300))
-        input_tensor = tf.convert_to_tensor(img_resized, dtype=tf.uint8)
-        input_tensor = tf.expand_dims(input_tensor, 0)
+    def _predict_ssd(self, model, imgs):
+        # Resize to 300x300 expected by SSD MobileNet, into a reused [N, 300, 300, 3] buffer
+        t = time.perf_counter()
+        batch = self.ssd_preprocess(imgs)
+        input_tensor = framework("tensorflow").convert_to_tensor(batch)
+        t = self._observe("preprocess", "v1", t)
         
         # Get the serving signature
-        infer = self.model.signatures["serving_default"]
+        infer = model.signatures["serving_default"]
         outputs = infer(input_tensor)
 
-        boxes = outputs['detection_boxes'][0].numpy()
-        scores = outputs['detection_scores'][0].numpy()
-        classes = outputs['detection_classes'][0].numpy().astype(int)
+        all_boxes = outputs['detection_boxes'].numpy()
+        all_scores = outputs['detection_scores'].numpy()
+        all_classes = outputs['detection_classes'].numpy().astype(int)
+        t = self._observe("model_run", "v1", t)
+
+        # One structured array per image (see utils/detections.py)
+        results = []
+        for n, img in enumerate(imgs):
+            height, width, _ = img.shape
+            keep = all_scores[n] >= 0.5
 
-        height, width, _ = img.shape
-        detections = []
-        for i in range(len(scores)):
-            if scores[i] < 0.5:
-                continue
-            
             # TF boxes are [ymin, xmin, ymax, xmax] normalized
-            ymin, xmin, ymax, xmax = boxes[i]
-            box = [xmin * width, ymin * height, (xmax - xmin) * width, (ymax - ymin) * height]
+            ymin, xmin, ymax, xmax = all_boxes[n][keep].T
+            boxes = np.stack([xmin * width, ymin * height, (xmax - xmin) * width, (ymax - ymin) * height], axis=1)
 
-            class_idx = classes[i] - 1
-            if class_idx < len(COCO_CLASSES):
-                label = COCO_CLASSES[class_idx]
-            else:
-                label = "unknown"
-
-            detections.append({
-                "class": label,
-                "score": float(scores[i]),
-                "box": [int(b) for b in box]
-            })
-        return detections
-
-    def _predict_yolo(self, img):
-        # FIX 1: Convert BGR to RGB (YOLO expects RGB)
-        # OpenCV loads images as BGR by default, which confuses the model colors
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-        # Preprocessing
-        original_h, original_w, _ = img.shape
-        img_resized = cv2.resize(img, (640, 640))
-        img_input = img_resized.transpose(2, 0, 1) # HWC -> CHW
-        img_input = img_input[np.newaxis, :, :, :] / 255.0 # Normalize 0-1
-        img_input = img_input.astype(np.float32)
-
-        # Inference
-        input_name = self.session.get_inputs()[0].name
-        outputs = self.session.run(None, {input_name: img_input})[0]
-        
-        # YOLOv8 Output Shape: (1, 84, 8400) -> Transpose to (8400, 84)
-        predictions = np.transpose(outputs[0])
-        
-        boxes = []
-        confidences = []
-        class_ids = []
-
-        # Parse Predictions
-        for pred in predictions:
-            class_scores = pred[4:] # Classes start at index 4
-            class_id = np.argmax(class_scores)
-            confidence = class_scores[class_id]
-
-            # FIX 2: Lower threshold to 0.25 (Quantized models are less confident)
-            if confidence > 0.25:
-                # YOLO box: [cx, cy, w, h] (normalized to 640x640)
-                cx, cy, w, h = pred[0], pred[1], pred[2], pred[3]
-
-                # Scale back to original image size
-                x_scale = original_w / 640
-                y_scale = original_h / 640
-                
-                width = w * x_scale
-                height = h * y_scale
-                left = (cx - w/2) * x_scale
-                top = (cy - h/2) * y_scale
-
-                boxes.append([int(left), int(top), int(width), int(height)])
-                confidences.append(float(confidence))
-                class_ids.append(int(class_id))
-
-        # Apply Non-Maximum Suppression (NMS) using OpenCV
-        indices = cv2.dnn.NMSBoxes(boxes, confidences, 0.5, 0.4)
-
-        final_detections = []
-        
-        # FIX 3: Robust NMS Tuple Handling (Prevents 500 Crash)
-        if len(indices) > 0:
-            if isinstance(indices, tuple):
-                indices = indices[0]
-            if hasattr(indices, 'flatten'):
-                 indices = indices.flatten()
-
-            for i in indices:
-                idx = int(i)
-                final_detections.append({
-                    "class": COCO_CLASSES[class_ids[idx]], 
-                    "score": confidences[idx],
-                    "box": boxes[idx]
-                })
-
-        return final_detections
\ No newline at end of file
+            class_idx = all_classes[n][keep] - 1
+            class_idx = np.where(class_idx < len(COCO_CLASSES), class_idx, UNKNOWN_CLASS)
+            results.append(from_arrays(boxes.astype(np.int32), all_scores[n][keep], class_idx))
+        self._observe("postprocess", "v1", t)
+        return results
+
+    def _run_onnx(self, session, batch):
+        # IO binding hands ORT our preprocessed buffer directly instead of
+        # copying it into a fresh input tensor on every run
+        binding = session.io_binding()
+        binding.bind_cpu_input(session.get_inputs()[0].name, batch)
+        binding.bind_output(session.get_outputs()[0].name)
+        session.run_with_iobinding(binding)
+        return binding.copy_outputs_to_cpu()[0]
+
+    def _dynamic_input(self, session):
+        # dynamic=True exports name the height / width axes instead of fixing them
+        return not all(isinstance(dim, int) for dim in session.get_inputs()[0].shape[2:])
+
+    def _infer_yolo(self, session, batch):
+        # Models exported without dynamic=True have a fixed batch of 1,
+        # so fall back to one run per image for those
+        if session.get_inputs()[0].shape[0] == 1 and len(batch) > 1:
+            return np.concatenate([self._run_onnx(session, batch[i:i + 1]) for i in range(len(batch))])
+        return self._run_onnx(session, batch)
+
+    def _predict_yolo(self, session, imgs, preprocess=None, stage=""):
+        # FIX 1: Convert BGR to RGB (YOLO expects RGB) - done inside the preprocessor,
+        # together with letterbox resize and 0-1 normalization -> [N, 3, 640, 640]
+        t = time.perf_counter()
+        batch, transforms = (preprocess or self.yolo_preprocess)(imgs)
+        t = self._observe(stage + "preprocess", "v2", t)
+
+        outputs = self._infer_yolo(session, batch)
+        t = self._observe(stage + "model_run", "v2", t)
+
+        results = []
+        for output, img, transform in zip(outputs, imgs, transforms):
+            original_h, original_w, _ = img.shape
+
+            # YOLOv8 Output Shape: (84, 8400) per image. Class max, threshold, rescale and
+            # class-aware NMS all run as array ops (see utils/postprocess.py)
+            # 0.25 is the Ultralytics objectness floor; score_threshold=0.5 is what
+            # actually filters, for every variant (compare with scripts/bench_variants.py)
+            boxes, confidences, class_ids = decode_yolo(
+                output, original_w, original_h,
+                conf_threshold=0.25, score_threshold=0.5, iou_threshold=0.4,
+                letterbox=transform
+            )
+
+            results.append(from_arrays(boxes, confidences, class_ids))
+
+        self._observe(stage + "postprocess", "v2", t)
+        return results
+
+    def _predict_cascade(self, session, imgs, person_boxes):
+        cascade = self.cascade
+
+        # Stage 1: a small full-frame pass for the frames that came without person boxes
+        need = [i for i, boxes in enumerate(person_boxes) if boxes is None or not len(boxes)]
+        coarse = {}
+        if need:
+            found = self._predict_yolo(session, [imgs[i] for i in need], self.person_preprocess, "person_")
+            coarse = dict(zip(need, found))
+
+        # Stage 2: the detector on the regions around each person, grouped by
+        # input size so every size is one batched run
+        t = time.perf_counter()
+        crops = {}  # input size -> [(image index, x0, y0, crop)]
+        for i, img in enumerate(imgs):
+            h, w = img.shape[:2]
+            boxes = cascade.person_boxes(coarse[i]) if i in coarse else person_boxes[i]
+            rois = cascade.rois(boxes, w, h)
+            cascade.record(w, h, rois, i in coarse)
+            for roi in rois.tolist():
+                x0, y0, x1, y1 = roi
+                crops.setdefault(cascade.input_size(roi), []).append((i, x0, y0, img[y0:y1, x0:x1]))
+
+        parts = [[] for _ in imgs]
+        for size, items in crops.items():
+            preprocess = self.roi_preprocess.get(size)
+            if preprocess is None:
+                preprocess = self.roi_preprocess.setdefault(size, YoloPreprocessor(size=size, letterbox=True))
+            batch, transforms = preprocess([crop for _, _, _, crop in items])
+            t = self._observe("roi_preprocess", "v2", t)
+            outputs = self._infer_yolo(session, batch)
+            t = self._observe("roi_model_run", "v2", t)
+
+            for (i, x0, y0, crop), output, transform in zip(items, outputs, transforms):
+                boxes, confidences, class_ids = decode_yolo(
+                    output, crop.shape[1], crop.shape[0],
+                    conf_threshold=0.25, score_threshold=0.5, iou_threshold=0.4,
+                    letterbox=transform
+                )
+                # Crop -> frame coordinates
+                boxes[:, :2] += np.array([x0, y0], dtype=np.int32)
+                parts[i].append((boxes, confidences, class_ids))
+            t = self._observe("roi_postprocess", "v2", t)
+
+        results = []
+        for i, found in enumerate(parts):
+            if not found:
+                # Nobody in the frame: what the person pass saw is the answer
+                results.append(coarse.get(i, from_arrays(np.empty((0, 4)), np.empty(0), np.empty(0))))
+                continue
+            # Merged crops never overlap, so there are no duplicates to suppress
+            boxes, confidences, class_ids = (np.concatenate(column) for column in zip(*found))
+            results.append(from_arrays(boxes, confidences, class_ids))
+        return results
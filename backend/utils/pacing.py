@@ -0,0 +1,107 @@
+import math
+import time
+
+# Upload widths clients step down through as the server gets busier
+WIDTHS = (640, 480, 320)
+
+
+class FramePacer:
+    # Recommends each stream how often to send a frame and how wide it should
+    # be, so a busy server slows every client down a little instead of letting
+    # the queue (and everyone's latency) grow.
+    #
+    # Load is tracked with O(1) running estimates: the rate of frames reaching
+    # inference (exponentially decayed count over rate_window_s), the model
+    # cost per frame and the queue wait (EWMAs). From those:
+    #   utilization = frames/s x seconds per frame / inference workers
+    #   scale       = how much slower everyone has to send for utilization to
+    #                 fall back to target_utilization and the queue wait under
+    #                 queue_budget_ms (never below 1)
+    # A stream's interval is min_interval_ms (idle_interval_ms once its scene
+    # has been still for idle_after_frames frames) times scale. Past the
+    # width_steps scales, the upload width drops a step down WIDTHS; the steps
+    # have hysteresis so the width doesn't flap around a threshold.
+
+    def __init__(self, workers=1, min_interval_ms=66, idle_interval_ms=500, max_interval_ms=2000,
+                 target_utilization=0.8, queue_budget_ms=100, idle_after_frames=10,
+                 width_steps=(1.5, 3.0), hysteresis=0.8, rate_window_s=2.0, smoothing=0.2):
+        self.workers = workers
+        self.min_interval_ms = min_interval_ms
+        self.idle_interval_ms = idle_interval_ms
+        self.max_interval_ms = max_interval_ms
+        self.target_utilization = target_utilization
+        self.queue_budget_ms = queue_budget_ms
+        self.idle_after_frames = idle_after_frames
+        self.width_steps = width_steps
+        self.hysteresis = hysteresis
+        self.rate_window_s = rate_window_s
+        self.smoothing = smoothing
+
+        self.rate = 0.0          # inference frames per second
+        self.rate_at = time.monotonic()
+        self.frame_ms = 0.0      # model time per frame
+        self.queue_ms = 0.0      # time frames wait for a batch
+        self.level = 0           # index into WIDTHS
+
+        # Metrics
+        self.recommendations_total = 0
+        self.idle_recommendations_total = 0
+
+    def _decayed_rate(self, now):
+        return self.rate * math.exp(-(now - self.rate_at) / self.rate_window_s)
+
+    def observe(self, batch_info):
+        # One frame that went through inference (frame cache hits cost no model time)
+        now = time.monotonic()
+        self.rate = self._decayed_rate(now) + 1 / self.rate_window_s
+        self.rate_at = now
+        frame_ms = batch_info["inference_ms"] / max(1, batch_info["batch_size"])
+        self.frame_ms += self.smoothing * (frame_ms - self.frame_ms)
+        self.queue_ms += self.smoothing * (batch_info["queue_ms"] - self.queue_ms)
+
+    def utilization(self):
+        return self._decayed_rate(time.monotonic()) * self.frame_ms / 1000 / self.workers
+
+    def scale(self, admission=0.0):
+        # admission: share of the request slots in use (WorkerPool pending / max_pending)
+        scale = max(1.0, self.utilization() / self.target_utilization, self.queue_ms / self.queue_budget_ms)
+        if admission > 0.5:
+            # Close to shedding requests: back off hard
+            scale *= 1 + 2 * (admission - 0.5)
+        return scale
+
+    def _width_level(self, scale):
+        # Step down at width_steps, back up only once well below them
+        while self.level < len(self.width_steps) and scale >= self.width_steps[self.level]:
+            self.level += 1
+        while self.level > 0 and scale < self.width_steps[self.level - 1] * self.hysteresis:
+            self.level -= 1
+        return self.level
+
+    def recommend(self, session=None, admission=0.0, model_width=WIDTHS[0]):
+        # {"interval_ms", "max_width"} for the stream's next frame. model_width
+        # is what the model resizes to: the ladder starts at the narrowest
+        # width that still covers it, wider uploads are wasted bandwidth
+        scale = self.scale(admission)
+        idle = session is not None and session.still_frames >= self.idle_after_frames
+        base = self.idle_interval_ms if idle else self.min_interval_ms
+        interval = min(self.max_interval_ms, base * scale)
+
+        start = max([i for i, w in enumerate(WIDTHS) if w >= model_width], default=0)
+        width = WIDTHS[min(start + self._width_level(scale), len(WIDTHS) - 1)]
+
+        self.recommendations_total += 1
+        self.idle_recommendations_total += int(idle)
+        return {"interval_ms": int(round(interval / 10) * 10), "max_width": width}
+
+    def stats(self):
+        return {
+            "inference_fps": self._decayed_rate(time.monotonic()),
+            "frame_ms": self.frame_ms,
+            "queue_ms": self.queue_ms,
+            "utilization": self.utilization(),
+            "scale": self.scale(),
+            "width_step": self.level,
+            "recommendations_total": self.recommendations_total,
+            "idle_recommendations_total": self.idle_recommendations_total,
+        }
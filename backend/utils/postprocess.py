@@ -0,0 +1,80 @@
+import numpy as np
+
+# YOLOv8 was exported at a fixed 640x640 input
+YOLO_INPUT_SIZE = 640
+
+
+def nms(boxes, scores, iou_threshold, class_ids=None):
+    # Greedy NMS over [x, y, w, h] boxes, same semantics as cv2.dnn.NMSBoxes:
+    # highest score first, drop anything with IoU > threshold against a kept box.
+    # The Python loop runs once per *kept* box, not once per candidate.
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    boxes = boxes.astype(np.float64)
+    if class_ids is not None:
+        # Class-aware: shift every class into its own coordinate range so
+        # boxes of different classes can never overlap. The range is the real
+        # extent of the corners: x1 / y1 are often negative after decoding
+        # and letterbox unpadding.
+        offset = (boxes[:, :2] + boxes[:, 2:]).max() - boxes[:, :2].min() + 1
+        boxes = boxes.copy()
+        boxes[:, :2] += class_ids[:, None] * offset
+
+    x1 = boxes[:, 0]
+    y1 = boxes[:, 1]
+    x2 = x1 + boxes[:, 2]
+    y2 = y1 + boxes[:, 3]
+    areas = boxes[:, 2] * boxes[:, 3]
+
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+
+        inter_w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        inter_h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = inter_w * inter_h
+        union = areas[i] + areas[rest] - inter
+        iou = np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+        order = rest[iou <= iou_threshold]
+
+    return np.asarray(keep, dtype=np.int64)
+
+
+def decode_yolo(output, original_w, original_h, conf_threshold=0.25,
+                score_threshold=0.5, iou_threshold=0.4, class_agnostic=False, letterbox=None):
+    # Decode one raw YOLOv8 output of shape (84, 8400) into
+    # (boxes [N, 4] int32 as x, y, w, h in original pixels, scores [N] float32, class_ids [N] int64).
+    # letterbox=(gain, pad_x, pad_y) undoes an aspect-preserving resize;
+    # without it the input is assumed to have been stretched to 640x640.
+    predictions = output.T  # (8400, 84), a view - no copy
+
+    class_scores = predictions[:, 4:]
+    class_ids = class_scores.argmax(axis=1)
+    confidences = class_scores[np.arange(len(class_ids)), class_ids]
+
+    # Both thresholds are applied up front so NMS only sees real candidates
+    mask = (confidences > conf_threshold) & (confidences > score_threshold)
+    candidates = predictions[mask, :4]
+    confidences = confidences[mask]
+    class_ids = class_ids[mask]
+
+    # YOLO box: [cx, cy, w, h] in 640x640 -> [left, top, w, h] in original pixels
+    candidates = candidates.astype(np.float64)
+    if letterbox is not None:
+        gain, pad_x, pad_y = letterbox
+        scale = np.array([1 / gain, 1 / gain])
+        offset = np.array([pad_x, pad_y], dtype=np.float64)
+    else:
+        scale = np.array([original_w / YOLO_INPUT_SIZE, original_h / YOLO_INPUT_SIZE], dtype=np.float64)
+        offset = 0
+    top_left = (candidates[:, :2] - candidates[:, 2:] / 2 - offset) * scale
+    sizes = candidates[:, 2:] * scale
+    boxes = np.trunc(np.concatenate([top_left, sizes], axis=1)).astype(np.int32)
+
+    keep = nms(boxes, confidences, iou_threshold, None if class_agnostic else class_ids)
+    return boxes[keep], confidences[keep], class_ids[keep]
@@ -0,0 +1,78 @@
+import threading
+import numpy as np
+import cv2
+
+# Ultralytics pads letterboxed images with grey 114
+LETTERBOX_FILL = 114
+
+
+def letterbox_params(h, w, size):
+    # Aspect-preserving fit of an h x w image into size x size.
+    # Returns (gain, pad_x, pad_y, new_w, new_h)
+    gain = min(size / h, size / w)
+    new_w, new_h = int(round(w * gain)), int(round(h * gain))
+    pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+    return gain, pad_x, pad_y, new_w, new_h
+
+
+class YoloPreprocessor:
+    # Writes frames straight into a reusable float32 N x 3 x size x size buffer.
+    # Per image: one cv2.resize into a preallocated uint8 canvas, then one pass
+    # per channel that swaps BGR -> RGB, casts and divides by 255 directly into
+    # the NCHW slot. No per-frame float64 or full-size temporaries.
+    # Buffers are per thread, so each inference worker owns its own.
+
+    def __init__(self, size=640, letterbox=True):
+        self.size = size
+        self.letterbox = letterbox
+        self.local = threading.local()
+
+    def _buffers(self, n):
+        local = self.local
+        if getattr(local, "batch", None) is None or local.batch.shape[0] < n:
+            local.batch = np.empty((n, 3, self.size, self.size), dtype=np.float32)
+            local.canvas = np.full((self.size, self.size, 3), LETTERBOX_FILL, dtype=np.uint8)
+        return local.batch[:n], local.canvas
+
+    def __call__(self, imgs):
+        # Returns (batch [N, 3, size, size] float32 view, per-image (gain, pad_x, pad_y)).
+        # The batch is only valid until this thread's next call.
+        batch, canvas = self._buffers(len(imgs))
+        transforms = []
+        for n, img in enumerate(imgs):
+            h, w = img.shape[:2]
+            if self.letterbox:
+                gain, pad_x, pad_y, new_w, new_h = letterbox_params(h, w, self.size)
+                # Re-grey only the border strips; the resize overwrites the rest
+                canvas[:pad_y] = LETTERBOX_FILL
+                canvas[pad_y + new_h:] = LETTERBOX_FILL
+                canvas[:, :pad_x] = LETTERBOX_FILL
+                canvas[:, pad_x + new_w:] = LETTERBOX_FILL
+                cv2.resize(img, (new_w, new_h), dst=canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w])
+                transforms.append((gain, pad_x, pad_y))
+            else:
+                cv2.resize(img, (self.size, self.size), dst=canvas)
+                transforms.append(None)
+
+            # Fused BGR -> RGB + HWC -> CHW + normalize
+            for c in range(3):
+                np.divide(canvas[:, :, 2 - c], np.float32(255), out=batch[n, c], dtype=np.float32)
+        return batch, transforms
+
+
+class SsdPreprocessor:
+    # Resizes frames into a reusable uint8 N x size x size x 3 buffer.
+    # SSD MobileNet takes uint8 as-is: no color conversion or normalization.
+
+    def __init__(self, size=300):
+        self.size = size
+        self.local = threading.local()
+
+    def __call__(self, imgs):
+        local = self.local
+        if getattr(local, "batch", None) is None or local.batch.shape[0] < len(imgs):
+            local.batch = np.empty((len(imgs), self.size, self.size, 3), dtype=np.uint8)
+        batch = local.batch[:len(imgs)]
+        for n, img in enumerate(imgs):
+            cv2.resize(img, (self.size, self.size), dst=batch[n])
+        return batch
@@ -0,0 +1,222 @@
+import os
+import sys
+import time
+import hashlib
+import logging
+import importlib
+import platform
+from pathlib import Path
+
+logger = logging.getLogger("backend")
+
+EXECUTION_MODES = {
+    "sequential": "ORT_SEQUENTIAL",
+    "parallel": "ORT_PARALLEL",
+}
+
+# Seconds each framework took to import, filled in on first use
+IMPORT_SECONDS = {}
+
+
+def framework(name):
+    # tensorflow / onnxruntime are imported on first use only, so a pod serving
+    # just v2 never pays for the TF import (several seconds) before it's ready
+    module = sys.modules.get(name)
+    if module is None:
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        IMPORT_SECONDS[name] = time.perf_counter() - start
+        logger.info(f"Imported {name} in {IMPORT_SECONDS[name]:.2f}s")
+    return module
+
+
+def process_uptime_s():
+    # Seconds since this process was started (Linux only), i.e. including the
+    # interpreter, uvicorn and module imports before any of our code ran
+    try:
+        with open("/proc/self/stat") as f:
+            # Field 22 is the start time in clock ticks after boot; the command
+            # name (field 2) may contain spaces, so split after its ")"
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def cpu_budget():
+    # CPUs this process may really use: the cgroup CPU quota (Kubernetes
+    # limits.cpu) if there is one, capped by the affinity mask.
+    # Returns (cpus, source).
+    try:
+        cpus, source = float(len(os.sched_getaffinity(0))), "affinity"
+    except AttributeError:
+        cpus, source = float(os.cpu_count() or 1), "cpu_count"
+
+    quota = None
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            value, period = f.read().split()
+        if value != "max":
+            quota = int(value) / int(period)
+    except (OSError, ValueError):
+        # cgroup v1: quota of -1 means unlimited
+        for base in ("/sys/fs/cgroup/cpu", "/sys/fs/cgroup/cpu,cpuacct"):
+            try:
+                with open(f"{base}/cpu.cfs_quota_us") as f:
+                    value = int(f.read())
+                with open(f"{base}/cpu.cfs_period_us") as f:
+                    period = int(f.read())
+            except (OSError, ValueError):
+                continue
+            if value > 0:
+                quota = value / period
+            break
+
+    if quota is not None and quota < cpus:
+        return quota, "cgroup"
+    return cpus, source
+
+
+def _cpu_fingerprint():
+    # Optimized graphs at ORT_ENABLE_ALL may use layouts specific to the CPU's
+    # vector width, so a cached graph is only reused on the same kind of CPU
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith(("flags", "Features")):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+
+class RuntimeProfile:
+    # Threading and session settings for the inference frameworks.
+    # The CPU budget is split between the server's worker processes, so N
+    # uvicorn workers in a pod limited to C cores each get C / N intra-op
+    # threads instead of every session spawning one thread per host core.
+    # Anything passed explicitly wins over the detected defaults.
+
+    def __init__(self, processes=1, intra_op_threads=None, inter_op_threads=1, execution_mode="sequential",
+                 cpu_arena=True, allow_spinning=None, optimized_cache_dir=None,
+                 tf_intra_op_threads=None, tf_inter_op_threads=None):
+        if execution_mode not in EXECUTION_MODES:
+            raise ValueError(f"Invalid execution mode: {execution_mode} (expected one of {list(EXECUTION_MODES)})")
+        self.cpus, self.cpu_source = cpu_budget()
+        self.processes = max(1, processes)
+        self.intra_op_threads = intra_op_threads or max(1, int(self.cpus // self.processes))
+        self.inter_op_threads = inter_op_threads
+        self.execution_mode = execution_mode
+        self.cpu_arena = cpu_arena
+        # Idle ORT threads spin by default; under a CFS quota that spinning is
+        # billed as CPU time and gets the pod throttled, so it's off there
+        self.allow_spinning = self.cpu_source != "cgroup" if allow_spinning is None else allow_spinning
+        self.optimized_cache_dir = Path(optimized_cache_dir) if optimized_cache_dir else None
+        self.tf_intra_op_threads = tf_intra_op_threads or self.intra_op_threads
+        self.tf_inter_op_threads = tf_inter_op_threads or inter_op_threads
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @classmethod
+    def from_env(cls, processes=1):
+        def env_int(name):
+            value = os.getenv(name, "")
+            return int(value) if value else None
+
+        spinning = os.getenv("ORT_ALLOW_SPINNING", "")
+        return cls(
+            processes=processes,
+            intra_op_threads=env_int("ORT_INTRA_OP_THREADS"),
+            inter_op_threads=env_int("ORT_INTER_OP_THREADS") or 1,
+            execution_mode=os.getenv("ORT_EXECUTION_MODE", "sequential"),
+            cpu_arena=os.getenv("ORT_CPU_ARENA", "1") == "1",
+            allow_spinning=spinning == "1" if spinning else None,
+            optimized_cache_dir=os.getenv("ORT_OPTIMIZED_CACHE_DIR", ""),
+            tf_intra_op_threads=env_int("TF_INTRA_OP_THREADS"),
+            tf_inter_op_threads=env_int("TF_INTER_OP_THREADS"),
+        )
+
+    def session_options(self):
+        ort = framework("onnxruntime")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = self.intra_op_threads
+        options.inter_op_num_threads = self.inter_op_threads
+        options.execution_mode = getattr(ort.ExecutionMode, EXECUTION_MODES[self.execution_mode])
+        options.enable_cpu_mem_arena = self.cpu_arena
+        options.add_session_config_entry("session.intra_op.allow_spinning", "1" if self.allow_spinning else "0")
+        return options
+
+    def _cache_path(self, model_path):
+        # Keyed on the source file, the ORT version and the CPU, so a new model,
+        # an ORT upgrade or a different node type never reuses a stale graph
+        stat = os.stat(model_path)
+        key = "|".join([str(Path(model_path).resolve()), str(stat.st_size), str(stat.st_mtime_ns),
+                        framework("onnxruntime").__version__, _cpu_fingerprint()])
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+        return self.optimized_cache_dir / f"{Path(model_path).stem}.{digest}.ort.onnx"
+
+    def create_session(self, model_path):
+        # With a cache dir, the first start serializes the optimized graph and
+        # later starts load it with optimization switched off
+        ort = framework("onnxruntime")
+        model_path = str(model_path)
+        if self.optimized_cache_dir is None:
+            return ort.InferenceSession(model_path, self.session_options())
+
+        cached = self._cache_path(model_path)
+        if cached.exists():
+            options = self.session_options()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+            try:
+                session = ort.InferenceSession(str(cached), options)
+                self.cache_hits += 1
+                return session
+            except Exception as e:
+                logger.warning(f"Discarding unreadable optimized model {cached}: {e}")
+                cached.unlink(missing_ok=True)
+
+        self.cache_misses += 1
+        options = self.session_options()
+        tmp = cached.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            self.optimized_cache_dir.mkdir(parents=True, exist_ok=True)
+            options.optimized_model_filepath = str(tmp)
+            session = ort.InferenceSession(model_path, options)
+            # Atomic, so concurrent workers never read a half-written file
+            os.replace(tmp, cached)
+            logger.info(f"Saved optimized model to {cached}")
+            return session
+        except OSError as e:
+            logger.warning(f"Optimized model cache unavailable ({e}), loading without it")
+            tmp.unlink(missing_ok=True)
+            return ort.InferenceSession(model_path, self.session_options())
+
+    def configure_tf(self):
+        # Must run before TensorFlow creates its runtime (i.e. before the first model load)
+        tf = framework("tensorflow")
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(self.tf_intra_op_threads)
+            tf.config.threading.set_inter_op_parallelism_threads(self.tf_inter_op_threads)
+        except RuntimeError as e:
+            logger.warning(f"TensorFlow thread limits not applied: {e}")
+
+    def stats(self):
+        return {
+            "cpus": self.cpus,
+            "cpu_source": self.cpu_source,
+            "processes": self.processes,
+            "intra_op_threads": self.intra_op_threads,
+            "inter_op_threads": self.inter_op_threads,
+            "execution_mode": self.execution_mode,
+            "cpu_arena": self.cpu_arena,
+            "allow_spinning": self.allow_spinning,
+            "tf_intra_op_threads": self.tf_intra_op_threads,
+            "tf_inter_op_threads": self.tf_inter_op_threads,
+            "optimized_cache_dir": str(self.optimized_cache_dir) if self.optimized_cache_dir else None,
+            "optimized_cache_hits": self.cache_hits,
+            "optimized_cache_misses": self.cache_misses,
+        }
@@ -0,0 +1,158 @@
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+def iou_matrix(a, b):
+    # Pairwise IoU between [N, 4] and [M, 4] boxes in [x, y, w, h] -> [N, M]
+    a = a.astype(np.float64)
+    b = b.astype(np.float64)
+    ax2, ay2 = a[:, 0] + a[:, 2], a[:, 1] + a[:, 3]
+    bx2, by2 = b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+
+    inter_w = np.clip(np.minimum(ax2[:, None], bx2[None, :]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    inter_h = np.clip(np.minimum(ay2[:, None], by2[None, :]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = inter_w * inter_h
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def centers(boxes):
+    boxes = boxes.astype(np.float64)
+    return boxes[:, :2] + boxes[:, 2:] / 2
+
+
+class PersonTracker:
+    # Tracks every person in one stream across frames.
+    # Tracks are matched to detections by IoU first, then by centroid distance
+    # for fast movers whose boxes no longer overlap. All pairwise scores are
+    # computed as one matrix; the greedy assignment loops at most
+    # min(tracks, detections) times.
+
+    def __init__(self, min_iou=0.3, max_match_distance=200, max_misses=5):
+        self.min_iou = min_iou
+        self.max_match_distance = max_match_distance
+        self.max_misses = max_misses
+
+        self.boxes = np.empty((0, 4), dtype=np.float64)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.misses = np.empty(0, dtype=np.int64)
+        self.next_id = 0
+        self.seen_person = False
+
+    def _match(self, boxes):
+        # Returns (track_idx, det_idx) index arrays of matched pairs
+        if len(self.boxes) == 0 or len(boxes) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+
+        iou = iou_matrix(self.boxes, boxes)
+        dist = np.linalg.norm(centers(self.boxes)[:, None, :] - centers(boxes)[None, :, :], axis=2)
+
+        # IoU matches always beat distance-only matches
+        score = np.where(iou >= self.min_iou, 1 + iou,
+                         np.where(dist <= self.max_match_distance, 1 - dist / self.max_match_distance, -1))
+
+        track_idx, det_idx = [], []
+        for _ in range(min(score.shape)):
+            t, d = np.unravel_index(np.argmax(score), score.shape)
+            if score[t, d] < 0:
+                break
+            track_idx.append(t)
+            det_idx.append(d)
+            score[t, :] = -1
+            score[:, d] = -1
+        return np.asarray(track_idx, dtype=np.int64), np.asarray(det_idx, dtype=np.int64)
+
+    def update(self, boxes):
+        # boxes: [N, 4] person boxes for this frame.
+        # Returns (track_ids, displacement) for tracks matched this frame,
+        # displacement being how far each centroid moved in pixels.
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        if len(boxes):
+            self.seen_person = True
+
+        track_idx, det_idx = self._match(boxes)
+        displacement = np.linalg.norm(centers(self.boxes[track_idx]) - centers(boxes[det_idx]), axis=1)
+        matched_ids = self.ids[track_idx]
+
+        # Matched tracks take the new box; the rest age out
+        self.boxes[track_idx] = boxes[det_idx]
+        self.misses += 1
+        self.misses[track_idx] = 0
+
+        # Unmatched detections start new tracks
+        new = np.setdiff1d(np.arange(len(boxes)), det_idx)
+        if len(new):
+            self.boxes = np.concatenate([self.boxes, boxes[new]])
+            self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + len(new))])
+            self.misses = np.concatenate([self.misses, np.zeros(len(new), dtype=np.int64)])
+            self.next_id += len(new)
+
+        alive = self.misses <= self.max_misses
+        self.boxes, self.ids, self.misses = self.boxes[alive], self.ids[alive], self.misses[alive]
+
+        return matched_ids, displacement
+
+
+class StreamSession:
+    def __init__(self, stream_id, tracker):
+        self.stream_id = stream_id
+        self.tracker = tracker
+        self.created_at = time.monotonic()
+        self.last_seen = self.created_at
+        self.frames = 0
+        self.cache = None  # FrameCache's last inferred result for this stream
+        self.person_boxes = None  # v2 cascade: person boxes of the last inferred frame
+        self.still_frames = 0  # consecutive frames answered from the frame cache (FramePacer)
+
+
+class StreamSessions:
+    # Per-client state keyed by stream ID, bounded two ways: sessions idle for
+    # longer than ttl_s are evicted, and past max_sessions the least recently
+    # used one goes. OrderedDict keeps LRU order, so both checks only ever
+    # look at the oldest entries.
+
+    def __init__(self, new_tracker, ttl_s=300, max_sessions=1000):
+        self.new_tracker = new_tracker
+        self.ttl_s = ttl_s
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.evicted_total = 0
+
+    def get(self, stream_id):
+        now = time.monotonic()
+        self._evict(now)
+
+        session = self.sessions.get(stream_id)
+        if session is None:
+            session = StreamSession(stream_id, self.new_tracker())
+            self.sessions[stream_id] = session
+            if len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.evicted_total += 1
+        else:
+            self.sessions.move_to_end(stream_id)
+
+        session.last_seen = now
+        session.frames += 1
+        return session
+
+    def _evict(self, now):
+        while self.sessions:
+            oldest = next(iter(self.sessions.values()))
+            if now - oldest.last_seen <= self.ttl_s:
+                break
+            self.sessions.popitem(last=False)
+            self.evicted_total += 1
+
+    def clear(self):
+        self.sessions.clear()
+
+    def stats(self):
+        return {
+            "active": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            "ttl_s": self.ttl_s,
+            "evicted_total": self.evicted_total,
+        }
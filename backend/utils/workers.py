@@ -0,0 +1,90 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from backend.utils.frame_cache import frame_signature
+from backend.utils.decode import decode_scaled
+
+logger = logging.getLogger("backend")
+
+
+def pack_images(images):
+    # Binary /predict_batch body: every image as a 4-byte big-endian length + its bytes
+    return b"".join(len(image).to_bytes(4, "big") + image for image in images)
+
+
+def unpack_images(body):
+    images, offset = [], 0
+    while offset < len(body):
+        if offset + 4 > len(body):
+            raise ValueError("Truncated image batch")
+        size = int.from_bytes(body[offset:offset + 4], "big")
+        offset += 4
+        if size == 0 or offset + size > len(body):
+            raise ValueError(f"Truncated image batch (image {len(images)})")
+        images.append(body[offset:offset + size])
+        offset += size
+    return images
+
+
+def decode_and_sign(image_bytes, sign=True, min_size=(0, 0), reduce=True):
+    # Module level so it can be shipped to a process pool.
+    # Decode (at reduced resolution when the frame is much bigger than
+    # min_size = (long side, short side), see utils/decode.py) plus the frame
+    # cache's change-detector signature, in one pool trip.
+    # Returns (img, signature, scale); img is None if the bytes aren't an image.
+    img, scale = decode_scaled(image_bytes, *min_size, reduce=reduce)
+    if img is None or not sign:
+        return img, None, scale
+    return img, frame_signature(img), scale
+
+
+class WorkerPool:
+    # Runs CPU-bound request work (JPEG decode etc.) off the event loop and
+    # caps how many requests may be in flight at once. When the cap is hit,
+    # admit() returns False and the caller should answer 503 + Retry-After
+    # straight away instead of letting the request sit until it times out.
+
+    def __init__(self, kind="thread", workers=2, max_pending=64, retry_after_s=1):
+        if kind == "process":
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+        elif kind == "thread":
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="decode")
+        else:
+            raise ValueError(f"Invalid worker pool kind: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retry_after_s = retry_after_s
+
+        # Only touched from the event loop thread, so plain ints are safe
+        self.pending = 0
+        self.admitted_total = 0
+        self.rejected_total = 0
+
+    def admit(self, n=1):
+        # n: slots the request takes (one per image for /predict_batch), all or none
+        if self.pending + n > self.max_pending:
+            self.rejected_total += 1
+            return False
+        self.pending += n
+        self.admitted_total += 1
+        return True
+
+    def release(self, n=1):
+        self.pending -= n
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "admitted_total": self.admitted_total,
+            "rejected_total": self.rejected_total,
+        }
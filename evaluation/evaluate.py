@@ -0,0 +1,417 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import threading
+import numpy as np
+import cv2
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Allow running from the repo root or from evaluation/
+EVAL_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(EVAL_DIR))
+
+# Configuration
+TEST_DIR = os.path.join(EVAL_DIR, "test_images")
+RESULTS_DIR = os.path.join(EVAL_DIR, "results")
+CACHE_DIR = os.path.join(EVAL_DIR, ".cache")
+API_URL = "http://localhost:8000"
+IMAGE_EXTS = (".jpg", ".png", ".jpeg")
+SHARD_SIZE = 256  # images per results file; also how much work a crash can lose
+
+
+def list_images(test_dir, limit=None):
+    names = sorted(f for f in os.listdir(test_dir) if f.lower().endswith(IMAGE_EXTS))
+    return [os.path.join(test_dir, name) for name in names[:limit]]
+
+
+class ImageCache:
+    # Decoded images kept as .npy next to the results, keyed by path, size and
+    # mtime, so later runs memory-map them instead of decoding JPEGs again
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _key(self, path):
+        st = os.stat(path)
+        return hashlib.sha1(f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest()
+
+    def load(self, path):
+        if not self.cache_dir:
+            return cv2.imread(path)
+        cached = os.path.join(self.cache_dir, self._key(path) + ".npy")
+        if os.path.exists(cached):
+            return np.load(cached, mmap_mode="r")
+        img = cv2.imread(path)
+        if img is not None:
+            tmp = f"{cached}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, img)
+            os.replace(tmp, cached)
+        return img
+
+
+class InProcessRunner:
+    # Calls ModelManager.predict_batch directly: no server, no HTTP, no batcher.
+    # latency_ms is the time the whole batch took, i.e. what each image waited.
+
+    name = "inprocess"
+
+    def __init__(self, cache, letterbox=True, yolo_variant="fp32"):
+        from backend.utils.model_loader import ModelManager
+        from backend.utils.detections import to_dicts
+        self.to_dicts = to_dicts
+        self.cache = cache
+        self.model_manager = ModelManager(letterbox=letterbox, yolo_variant=yolo_variant)
+
+    def prepare(self, version):
+        self.model_manager.load_model(version)
+
+    def run(self, version, paths):
+        rows = []
+        images, valid = [], []
+        for path in paths:
+            img = self.cache.load(path)
+            if img is None:
+                rows.append((path, "unreadable", np.nan, np.nan, []))
+            else:
+                images.append(img)
+                valid.append(path)
+        if not images:
+            return rows
+
+        start = time.perf_counter()
+        try:
+            results = self.model_manager.predict_batch(version, images)
+        except Exception as e:
+            return rows + [(path, f"error: {e}", np.nan, np.nan, []) for path in valid]
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        return rows + [(path, "ok", elapsed_ms, np.nan, self.to_dicts(dets)) for path, dets in zip(valid, results)]
+
+
+class HttpRunner:
+    # Posts images to a running backend: one per /predict call, or several per
+    # /predict_batch call when batch_size > 1. latency_ms is measured by the
+    # client and server_latency_ms is what the server reported, both per
+    # request divided by its images.
+
+    name = "http"
+
+    def __init__(self, url, timeout_s=30):
+        import requests
+        self.requests = requests
+        self.url = url.rstrip("/")
+        self.timeout_s = timeout_s
+        self.local = threading.local()
+
+    def _session(self):
+        if getattr(self.local, "session", None) is None:
+            self.local.session = self.requests.Session()
+        return self.local.session
+
+    def prepare(self, version):
+        # /predict always uses the server's active model
+        response = self._session().post(f"{self.url}/switch_model", params={"version": version}, timeout=self.timeout_s)
+        response.raise_for_status()
+
+    def run(self, version, paths):
+        if len(paths) > 1:
+            return self._run_batch(version, paths)
+        rows = []
+        for path in paths:
+            with open(path, "rb") as f:
+                body = f.read()
+            start = time.perf_counter()
+            try:
+                response = self._session().post(
+                    f"{self.url}/predict", files={"file": (os.path.basename(path), body, "image/jpeg")},
+                    timeout=self.timeout_s,
+                )
+                latency_ms = (time.perf_counter() - start) * 1000
+                result = response.json()
+            except Exception as e:
+                rows.append((path, f"error: {e}", np.nan, np.nan, []))
+                continue
+            if response.status_code != 200 or "error" in result:
+                rows.append((path, f"error: {result.get('error', response.status_code)}", latency_ms, np.nan, []))
+            elif result.get("model") != version:
+                rows.append((path, f"error: served by {result.get('model')}", latency_ms, np.nan, []))
+            else:
+                rows.append((path, "ok", latency_ms, result["latency_ms"], result["detections"]))
+        return rows
+
+    def _run_batch(self, version, paths):
+        files = []
+        for path in paths:
+            with open(path, "rb") as f:
+                files.append(("files", (os.path.basename(path), f.read(), "image/jpeg")))
+        start = time.perf_counter()
+        try:
+            response = self._session().post(f"{self.url}/predict_batch", files=files, timeout=self.timeout_s)
+            latency_ms = (time.perf_counter() - start) * 1000 / len(paths)
+            result = response.json()
+        except Exception as e:
+            return [(path, f"error: {e}", np.nan, np.nan, []) for path in paths]
+        if response.status_code != 200 or "error" in result:
+            error = f"error: {result.get('error', response.status_code)}"
+            return [(path, error, latency_ms, np.nan, []) for path in paths]
+        if result.get("model") != version:
+            return [(path, f"error: served by {result.get('model')}", latency_ms, np.nan, []) for path in paths]
+
+        server_latency_ms = result["latency_ms"] / len(paths)
+        rows = []
+        for path, item in zip(paths, result["results"]):
+            if "error" in item:
+                rows.append((path, f"error: {item['error']}", latency_ms, np.nan, []))
+            else:
+                rows.append((path, "ok", latency_ms, server_latency_ms, item["detections"]))
+        return rows
+
+
+class ResultStore:
+    # Per-image results for one (run, version) as numbered .npz shards of
+    # columns. Image columns: image, status, latency_ms, server_latency_ms,
+    # detections. Detection columns (one row per box): det_image (index into
+    # the image columns), det_class, det_score, det_box.
+    # A finished shard is never rewritten, which is what makes runs resumable.
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.meta_path = os.path.join(directory, "meta.json")
+
+    def shards(self):
+        return sorted(f for f in os.listdir(self.directory) if f.startswith("part-") and f.endswith(".npz"))
+
+    def done_images(self):
+        done = set()
+        for shard in self.shards():
+            with np.load(os.path.join(self.directory, shard)) as data:
+                done.update(data["image"].tolist())
+        return done
+
+    def write(self, rows):
+        det_image, det_class, det_score, det_box = [], [], [], []
+        for i, (_, _, _, _, detections) in enumerate(rows):
+            for det in detections:
+                det_image.append(i)
+                det_class.append(det["class"])
+                det_score.append(det["score"])
+                det_box.append(det["box"])
+
+        shard = os.path.join(self.directory, f"part-{len(self.shards()):05d}.npz")
+        tmp = shard + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                image=np.array([os.path.basename(r[0]) for r in rows]),
+                status=np.array([r[1] for r in rows]),
+                latency_ms=np.array([r[2] for r in rows], dtype=np.float64),
+                server_latency_ms=np.array([r[3] for r in rows], dtype=np.float64),
+                detections=np.array([len(r[4]) for r in rows], dtype=np.int32),
+                det_image=np.array(det_image, dtype=np.int32),
+                det_class=np.array(det_class, dtype=str),
+                det_score=np.array(det_score, dtype=np.float32),
+                det_box=np.array(det_box, dtype=np.int32).reshape(-1, 4),
+            )
+        os.replace(tmp, shard)
+
+    def load(self):
+        columns = {}
+        offset = 0
+        for shard in self.shards():
+            with np.load(os.path.join(self.directory, shard)) as data:
+                for key in data.files:
+                    # det_image points into its own shard; rebase onto the concatenation
+                    value = data[key] + offset if key == "det_image" else data[key]
+                    columns.setdefault(key, []).append(value)
+                offset += len(data["image"])
+        return {key: np.concatenate(parts) for key, parts in columns.items()}
+
+    def read_meta(self):
+        if not os.path.exists(self.meta_path):
+            return {"elapsed_s": 0.0, "images": 0}
+        with open(self.meta_path) as f:
+            return json.load(f)
+
+    def write_meta(self, meta):
+        # Rewritten after every shard, so replaced atomically like one
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f, indent=4)
+        os.replace(tmp, self.meta_path)
+
+
+def evaluate_version(runner, version, images, store, workers, batch_size):
+    done = store.done_images()
+    todo = [path for path in images if os.path.basename(path) not in done]
+    if done:
+        print(f"[{version}] resuming: {len(done)} done, {len(todo)} to go")
+    if not todo:
+        return
+
+    runner.prepare(version)
+    meta = store.read_meta()
+    meta.update(version=version, runner=runner.name, workers=workers, batch_size=batch_size)
+    elapsed_before, images_before = meta["elapsed_s"], meta["images"]
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    pending, finished = [], 0
+
+    def flush(rows):
+        # The meta follows every shard, so a crashed or interrupted run still
+        # resumes with the right progress and timing. Throughput is summed
+        # over resumed sessions, so it stays comparable.
+        nonlocal finished
+        store.write(rows)
+        finished += len(rows)
+        meta["elapsed_s"] = elapsed_before + time.perf_counter() - start
+        meta["images"] = images_before + finished
+        store.write_meta(meta)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(runner.run, version, batch) for batch in batches]
+        for future in as_completed(futures):
+            pending.extend(future.result())
+            if len(pending) >= SHARD_SIZE:
+                flush(pending)
+                pending = []
+                print(f"[{version}] {len(done) + finished}/{len(images)} images")
+    if pending:
+        flush(pending)
+
+
+def summarize(columns, meta):
+    ok = columns["status"] == "ok"
+    latency = columns["latency_ms"][ok]
+    server_latency = columns["server_latency_ms"][ok]
+    server_latency = server_latency[~np.isnan(server_latency)]
+    classes, counts = np.unique(columns["det_class"], return_counts=True)
+    order = np.argsort(-counts, kind="stable")
+
+    def percentiles(values):
+        if len(values) == 0:
+            return None
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        return {"mean": float(values.mean()), "p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+    return {
+        "model_version": meta.get("version"),
+        "runner": meta.get("runner"),
+        "total_images": int(len(columns["status"])),
+        "failed_images": int((~ok).sum()),
+        "throughput_img_s": meta["images"] / meta["elapsed_s"] if meta["elapsed_s"] else None,
+        "latency_ms": percentiles(latency),
+        "server_latency_ms": percentiles(server_latency),
+        "total_detections": int(columns["detections"][ok].sum()),
+        "avg_detections": float(columns["detections"][ok].mean()) if ok.any() else 0.0,
+        "avg_confidence": float(columns["det_score"].mean()) if len(columns["det_score"]) else 0.0,
+        "class_counts": {str(classes[i]): int(counts[i]) for i in order},
+    }
+
+
+def legacy_metrics(summary):
+    # The shape baseline_metrics.json / improved_metrics.json always had
+    latency = summary["server_latency_ms"] or summary["latency_ms"] or {"mean": 0}
+    return {
+        "model_version": summary["model_version"],
+        "total_images": summary["total_images"] - summary["failed_images"],
+        "total_detections": summary["total_detections"],
+        "avg_confidence": summary["avg_confidence"],
+        "avg_latency_ms": latency["mean"],
+        "class_counts": summary["class_counts"],
+    }
+
+
+def print_comparison(summaries):
+    versions = list(summaries)
+
+    def fmt(value):
+        if value is None:
+            return "-"
+        return f"{value:.2f}" if isinstance(value, float) else str(value)
+
+    rows = [
+        ("images", lambda s: s["total_images"]),
+        ("failed", lambda s: s["failed_images"]),
+        ("throughput img/s", lambda s: s["throughput_img_s"]),
+        ("latency p50 ms", lambda s: s["latency_ms"] and s["latency_ms"]["p50"]),
+        ("latency p95 ms", lambda s: s["latency_ms"] and s["latency_ms"]["p95"]),
+        ("latency p99 ms", lambda s: s["latency_ms"] and s["latency_ms"]["p99"]),
+        ("server p50 ms", lambda s: s["server_latency_ms"] and s["server_latency_ms"]["p50"]),
+        ("detections", lambda s: s["total_detections"]),
+        ("avg detections", lambda s: s["avg_detections"]),
+        ("avg confidence", lambda s: s["avg_confidence"]),
+    ]
+    print(f"{'':<18}" + "".join(f"{v:>12}" for v in versions))
+    for label, get in rows:
+        print(f"{label:<18}" + "".join(f"{fmt(get(summaries[v])):>12}" for v in versions))
+
+    top = sorted({c for s in summaries.values() for c in list(s["class_counts"])[:10]})
+    print("\nclass counts")
+    for cls in top:
+        print(f"  {cls:<16}" + "".join(f"{summaries[v]['class_counts'].get(cls, 0):>12}" for v in versions))
+
+
+def run(versions, mode="inprocess", url=API_URL, test_dir=TEST_DIR, workers=2, batch_size=None,
+        run_name=None, limit=None, fresh=False, cache_dir=CACHE_DIR, letterbox=True, yolo_variant="fp32"):
+    # batch_size defaults to 4 in process and to 1 (plain /predict, per-request latency) over HTTP
+    if mode == "inprocess":
+        runner = InProcessRunner(ImageCache(cache_dir), letterbox=letterbox, yolo_variant=yolo_variant)
+        batch_size = batch_size or 4
+    elif mode == "http":
+        runner = HttpRunner(url)
+        batch_size = batch_size or 1
+    else:
+        raise ValueError(f"Invalid mode: {mode}")
+
+    run_dir = os.path.join(RESULTS_DIR, run_name or mode)
+    if fresh and os.path.exists(run_dir):
+        shutil.rmtree(run_dir)
+
+    images = list_images(test_dir, limit)
+    summaries = {}
+    for version in versions:
+        store = ResultStore(os.path.join(run_dir, version))
+        evaluate_version(runner, version, images, store, workers, batch_size)
+        summaries[version] = summarize(store.load(), store.read_meta())
+
+    with open(os.path.join(run_dir, "comparison.json"), "w") as f:
+        json.dump(summaries, f, indent=4)
+    return summaries, run_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate model versions side by side")
+    parser.add_argument("--versions", default="v1,v2")
+    parser.add_argument("--mode", choices=["inprocess", "http"], default="inprocess")
+    parser.add_argument("--url", default=API_URL, help="backend base URL for --mode http")
+    parser.add_argument("--test-dir", default=TEST_DIR)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="images per predict_batch call (inprocess, default 4) or /predict_batch request (http, default 1)")
+    parser.add_argument("--run-name", default=None, help="results/<run-name>; reuse it to resume")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--fresh", action="store_true", help="discard earlier results of this run")
+    parser.add_argument("--no-cache", action="store_true", help="don't cache decoded images")
+    parser.add_argument("--no-letterbox", action="store_true")
+    parser.add_argument("--yolo-variant", default="fp32", help="v2 model file to load (inprocess)")
+    args = parser.parse_args()
+
+    summaries, run_dir = run(
+        [v for v in args.versions.split(",") if v], mode=args.mode, url=args.url, test_dir=args.test_dir,
+        workers=args.workers, batch_size=args.batch_size, run_name=args.run_name, limit=args.limit,
+        fresh=args.fresh, cache_dir=None if args.no_cache else CACHE_DIR, letterbox=not args.no_letterbox,
+        yolo_variant=args.yolo_variant,
+    )
+    print_comparison(summaries)
+    print(f"\nResults in {run_dir}")
+
+
+if __name__ == "__main__":
+    main()
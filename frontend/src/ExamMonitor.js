@@ -19,21 +19,38 @@ function ExamMonitor() {
   const currentStaticImage = useRef(null);
   const lastDetections = useRef([]); 
   const isProcessingFrame = useRef(false);
+  // Identifies this webcam stream so the backend tracks movement per student
+  const streamId = useRef(Math.random().toString(36).slice(2));
+  // Webcam frames go over one WebSocket; the backend always answers for the newest frame
+  const wsRef = useRef(null);
+  const lastResultTime = useRef(0);
+  // The backend paces us: every response says when to send the next frame and
+  // how wide it may be (slower / smaller when it is busy or the scene is still)
+  const frameInterval = useRef(66);
+  const uploadWidth = useRef(640);
+  const uploadScale = useRef(1); // display px per uploaded px of the frames in flight
+  const uploadCanvas = useRef(null);
+
+  // Newest alert id we already have; each poll only asks for alerts after it
+  const lastAlertId = useRef(null);
+  const MAX_ALERTS_SHOWN = 50;
 
   useEffect(() => {
       const fetchAlerts = async () => {
           try {
-              const res = await fetch("http://localhost:8001/get_alerts");
+              const since = lastAlertId.current === null ? "" : `?since=${lastAlertId.current}`;
+              const res = await fetch(`http://localhost:8001/get_alerts${since}`);
               const data = await res.json();
-              setAlerts(data);
-
-              if (data && data.length > 0) {
-                  const latest = data[0]; 
-                  const alertType = latest.object_class === "SUSPICIOUS MOVEMENT" || latest.object_class === "STUDENT LEFT FRAME" 
-                                    ? "yellow" : "red";
-                  setViolationType(alertType);
-                  setTimeout(() => setViolationType(null), 1500);
-              }
+              if (!data || data.length === 0) return;
+
+              lastAlertId.current = data[0].id;
+              setAlerts(prev => [...data, ...prev].slice(0, MAX_ALERTS_SHOWN));
+
+              const latest = data[0]; 
+              const alertType = latest.object_class === "SUSPICIOUS MOVEMENT" || latest.object_class === "STUDENT LEFT FRAME" 
+                                ? "yellow" : "red";
+              setViolationType(alertType);
+              setTimeout(() => setViolationType(null), 1500);
           } catch (e) { }
       };
       const interval = setInterval(fetchAlerts, 1000);
@@ -62,6 +79,39 @@ function ExamMonitor() {
     }
   };
 
+  const applyPacing = (data) => {
+    if (!data || !data.pacing) return;
+    frameInterval.current = data.pacing.interval_ms;
+    uploadWidth.current = data.pacing.max_width;
+  };
+
+  // Boxes come back in the uploaded frame's pixels
+  const toDisplay = (detections) => {
+    const s = uploadScale.current;
+    if (!detections || s === 1) return detections;
+    return detections.map(d => ({ ...d, box: d.box.map(v => v * s) }));
+  };
+
+  const openStream = () => {
+    const ws = new WebSocket(`ws://localhost:8000/ws/predict?stream_id=${streamId.current}`);
+    ws.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      const now = performance.now();
+      if (lastResultTime.current) setFps(Math.round(1000 / (now - lastResultTime.current)));
+      lastResultTime.current = now;
+      lastDetections.current = toDisplay(data.detections);
+      applyPacing(data);
+    };
+    ws.onclose = () => { if (wsRef.current === ws) wsRef.current = null; };
+    wsRef.current = ws;
+  };
+
+  const closeStream = () => {
+    if (wsRef.current) wsRef.current.close();
+    wsRef.current = null;
+    lastResultTime.current = 0;
+  };
+
   const startWebcam = async () => {
     if (isWebcamActive) return;
     try {
@@ -75,6 +125,7 @@ function ExamMonitor() {
             currentStaticImage.current = null;
             lastDetections.current = [];
             isProcessingFrame.current = false;
+            openStream();
             loopDetection();
         };
       }
@@ -83,6 +134,7 @@ function ExamMonitor() {
 
   const stopWebcam = () => {
     isLooping.current = false;
+    closeStream();
     setIsWebcamActive(false);
     setFps(0);
     lastDetections.current = [];
@@ -124,28 +176,47 @@ function ExamMonitor() {
       const ctx = canvas.getContext("2d");
       ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
       if (lastDetections.current.length > 0) drawBoxes(lastDetections.current, ctx);
-      canvas.toBlob((blob) => { if(!blob) return; sendBlob(blob); }, 'image/jpeg');
+      // Upload at the width the backend asked for, never wider than the camera
+      let frame = canvas;
+      if (uploadWidth.current < video.videoWidth) {
+        frame = uploadCanvas.current || (uploadCanvas.current = document.createElement("canvas"));
+        frame.width = uploadWidth.current;
+        frame.height = Math.round(video.videoHeight * uploadWidth.current / video.videoWidth);
+        frame.getContext("2d").drawImage(video, 0, 0, frame.width, frame.height);
+      }
+      uploadScale.current = canvas.width / frame.width;
+      frame.toBlob((blob) => { if(!blob) return; sendBlob(blob); }, 'image/jpeg');
     } else { setTimeout(loopDetection, 100); }
   };
 
   const sendBlob = async (blob) => {
+      // Streaming path: fire and move on, results arrive via ws.onmessage
+      if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
+          wsRef.current.send(blob);
+          setTimeout(loopDetection, frameInterval.current);
+          return;
+      }
       isProcessingFrame.current = true;
       const formData = new FormData();
       formData.append("file", blob, "frame.jpg");
+      formData.append("stream_id", streamId.current);
       const startTime = performance.now();
       try {
         const res = await fetch("http://localhost:8000/predict", { method: "POST", body: formData });
+        const data = await res.json();
+        // 503s carry pacing too: back off as told instead of retrying at once
+        applyPacing(data);
         if (res.status === 200) {
-            const data = await res.json();
             setFps(Math.round(1000 / (performance.now() - startTime)));
-            lastDetections.current = data.detections;
+            lastDetections.current = toDisplay(data.detections);
             const ctx = canvasRef.current.getContext("2d");
-            drawBoxes(data.detections, ctx);
+            drawBoxes(lastDetections.current, ctx);
         }
       } catch (e) { } 
       finally {
         isProcessingFrame.current = false; 
-        if (isLooping.current) loopDetection(); 
+        const wait = Math.max(0, frameInterval.current - (performance.now() - startTime));
+        if (isLooping.current) setTimeout(loopDetection, wait);
       }
   }
 
@@ -155,6 +226,7 @@ function ExamMonitor() {
         const blob = await res.blob();
         const formData = new FormData();
         formData.append("file", blob, "frame.jpg");
+        formData.append("stream_id", streamId.current);
         const resAPI = await fetch("http://localhost:8000/predict", { method: "POST", body: formData });
         const data = await resAPI.json();
         lastDetections.current = data.detections;
@@ -201,7 +273,7 @@ function ExamMonitor() {
       <div className="security-panel">
         <div className="panel-title"><span>⚠️ INCIDENT LOG</span><button onClick={clearLogs} className="btn-xs">Clear</button></div>
         {alerts.length === 0 ? <div style={{color: '#475569', fontSize: '0.8rem'}}>System Secure.</div> : alerts.map((alert, i) => (
-                <div key={i} className={`alert-item ${alert.object_class.includes('MOVEMENT') ? 'yellow' : 'red'}`}>
+                <div key={alert.id ?? i} className={`alert-item ${alert.object_class.includes('MOVEMENT') ? 'yellow' : 'red'}`}>
                     <span className="alert-time">{alert.timestamp}</span><span className="alert-msg">{alert.object_class.toUpperCase()}</span>
                 </div>
         ))}
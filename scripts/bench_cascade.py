@@ -0,0 +1,155 @@
+import os
+import sys
+import time
+import json
+import argparse
+import numpy as np
+import cv2
+
+# Allow "python scripts/bench_cascade.py" from the repo root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from backend.utils.tracking import iou_matrix
+from backend.utils.detections import CLASS_IDS, class_ids
+from backend.utils.cascade import RoiCascade
+from bench_variants import load_images, MATCH_IOU
+
+# Configuration
+TEST_DIR = "evaluation/test_images"
+# Same list as BANNED_ITEMS in backend/app.py
+CONTRABAND = ["cell phone", "laptop", "mouse", "keyboard", "remote", "tv"]
+# COCO object sizes: sqrt(area) below 32 px is small, below 96 px medium
+SIZE_EDGES = {"small": 32, "medium": 96, "large": np.inf}
+
+
+def size_bucket(boxes):
+    side = np.sqrt(np.clip(boxes[:, 2], 0, None) * np.clip(boxes[:, 3], 0, None))
+    return np.searchsorted([SIZE_EDGES["small"], SIZE_EDGES["medium"]], side, side="right")
+
+
+def found(ref_ids, ref_boxes, cand_ids, cand_boxes):
+    # Which reference objects the candidate found (same class, IoU >= MATCH_IOU), greedy by IoU
+    hit = np.zeros(len(ref_ids), dtype=bool)
+    if not len(ref_ids) or not len(cand_ids):
+        return hit
+    iou = np.where(ref_ids[:, None] == cand_ids[None, :], iou_matrix(ref_boxes, cand_boxes), 0)
+    while iou.size and iou.max() >= MATCH_IOU:
+        r, c = np.unravel_index(np.argmax(iou), iou.shape)
+        hit[r] = True
+        iou[r, :] = 0
+        iou[:, c] = 0
+    return hit
+
+
+def recall_by_size(reference, candidate, classes=None):
+    # reference / candidate: name -> (class ids, boxes). Recall per size bucket,
+    # over every class or only `classes`
+    hits = {bucket: [0, 0] for bucket in SIZE_EDGES}
+    for name, (ref_ids, ref_boxes) in reference.items():
+        keep = np.isin(ref_ids, classes) if classes is not None else np.ones(len(ref_ids), dtype=bool)
+        ref_ids, ref_boxes = ref_ids[keep], ref_boxes[keep]
+        hit = found(ref_ids, ref_boxes, *candidate[name])
+        for i, bucket in enumerate(SIZE_EDGES):
+            in_bucket = size_bucket(ref_boxes) == i
+            hits[bucket][0] += int(hit[in_bucket].sum())
+            hits[bucket][1] += int(in_bucket.sum())
+    return {bucket: {"recall": found_n / total if total else None, "objects": total}
+            for bucket, (found_n, total) in hits.items()}
+
+
+def load_annotations(path, names):
+    # COCO instances JSON -> name -> (class ids, boxes) for the test images
+    with open(path) as f:
+        coco = json.load(f)
+    categories = {c["id"]: c["name"] for c in coco["categories"]}
+    image_ids = {img["id"]: img["file_name"] for img in coco["images"] if img["file_name"] in names}
+    truth = {name: ([], []) for name in names}
+    for ann in coco["annotations"]:
+        name = image_ids.get(ann["image_id"])
+        if name is None or ann.get("iscrowd") or categories[ann["category_id"]] not in CLASS_IDS:
+            continue
+        truth[name][0].append(CLASS_IDS[categories[ann["category_id"]]])
+        truth[name][1].append(ann["bbox"])
+    return {name: (np.array(ids, dtype=np.int16), np.array(boxes, dtype=np.float64).reshape(-1, 4))
+            for name, (ids, boxes) in truth.items()}
+
+
+def run(manager, names, images, hints=None):
+    # One frame at a time, as a webcam stream is served. Returns latencies and name -> (ids, boxes)
+    latencies, detections = [], {}
+    for i, (name, img) in enumerate(zip(names, images)):
+        start = time.perf_counter()
+        dets = manager.predict("v2", img, hints[i] if hints else None)
+        latencies.append((time.perf_counter() - start) * 1000)
+        detections[name] = (dets["class_id"], dets["box"])
+    return np.array(latencies), detections
+
+
+def main():
+    from backend.utils.model_loader import ModelManager
+
+    parser = argparse.ArgumentParser(description="Full-frame vs person-ROI cascaded v2 inference")
+    parser.add_argument("--test-dir", default=TEST_DIR)
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--variant", default="fp32", help="v2 model variant (see YOLO_VARIANTS)")
+    parser.add_argument("--person-size", type=int, default=320)
+    parser.add_argument("--roi-size", type=int, default=480)
+    parser.add_argument("--roi-margin", type=float, default=0.2)
+    parser.add_argument("--annotations", default=None,
+                        help="COCO instances JSON for the test images (e.g. instances_val2017.json); "
+                             "without it the full-frame detections are the reference")
+    args = parser.parse_args()
+
+    names, images = load_images(args.test_dir, args.limit)
+    names, images = zip(*[(n, img) for n, img in zip(names, images) if img is not None])
+    full = ModelManager(yolo_variant=args.variant)
+    full.load_model("v2")
+    cascade = RoiCascade(person_size=args.person_size, roi_size=args.roi_size, roi_margin=args.roi_margin)
+    cascaded = ModelManager(yolo_variant=args.variant, cascade=cascade)
+    cascaded.load_model("v2")
+    if cascaded.cascade is None:
+        print("The v2 model has a fixed input size; export it with dynamic=True to use the cascade")
+        sys.exit(1)
+
+    modes = {}
+    modes["full"] = run(full, names, images)
+    # Person pass on every frame
+    modes["cascade"] = run(cascaded, names, images)
+    # Person boxes handed in, as a stream's previous frame would (here: the full-frame ones)
+    person_id = CLASS_IDS["person"]
+    hints = [boxes[ids == person_id] for ids, boxes in (modes["full"][1][n] for n in names)]
+    modes["cascade_tracked"] = run(cascaded, names, images, hints)
+
+    if args.annotations:
+        reference, reference_name = load_annotations(args.annotations, set(names)), "annotations"
+    else:
+        reference, reference_name = modes["full"][1], "full"
+    contraband = class_ids(CONTRABAND)
+
+    report = {"reference": reference_name, "frames": len(names), "cascade": cascade.stats(), "modes": {}}
+    for mode, (latencies, detections) in modes.items():
+        report["modes"][mode] = {
+            "latency_ms_mean": float(latencies.mean()),
+            "latency_ms_p50": float(np.percentile(latencies, 50)),
+            "latency_ms_p95": float(np.percentile(latencies, 95)),
+            "recall_all": recall_by_size(reference, detections),
+            "recall_contraband": recall_by_size(reference, detections, contraband),
+        }
+    base = report["modes"]["full"]["latency_ms_mean"]
+    for result in report["modes"].values():
+        result["saved_ms"] = base - result["latency_ms_mean"]
+
+    def fmt(value):
+        return f"{value:.3f}" if value is not None else "-"
+
+    print(f"\nRecall against: {reference_name}")
+    print(f"{'mode':<17}{'mean ms':>9}{'p95 ms':>9}{'saved':>8}{'small':>8}{'medium':>8}{'large':>8}{'banned S':>10}")
+    for mode, r in report["modes"].items():
+        print(f"{mode:<17}{r['latency_ms_mean']:>9.1f}{r['latency_ms_p95']:>9.1f}{r['saved_ms']:>8.1f}"
+              + "".join(f"{fmt(r['recall_all'][b]['recall']):>8}" for b in SIZE_EDGES)
+              + f"{fmt(r['recall_contraband']['small']['recall']):>10}")
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import os
+import sys
+import time
+import json
+import numpy as np
+import cv2
+
+# Allow "python scripts/bench_decode.py" from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.utils.postprocess import decode_yolo
+
+# Configuration
+TEST_DIR = "evaluation/test_images"
+MODEL_PATH = "backend/models/v2/yolov8m.onnx"
+REPEATS = 5
+SYNTHETIC_OBJECTS = 12
+SYNTHETIC_CLUSTER = 25
+
+
+def legacy_decode(output, original_w, original_h, class_agnostic=True):
+    # Verbatim copy of the per-anchor loop _predict_yolo used before decode_yolo.
+    # class_agnostic=False runs cv2.dnn.NMSBoxes once per class instead, the
+    # reference for the class-aware NMS /predict uses.
+    predictions = np.transpose(output)
+
+    boxes = []
+    confidences = []
+    class_ids = []
+
+    for pred in predictions:
+        class_scores = pred[4:]
+        class_id = np.argmax(class_scores)
+        confidence = class_scores[class_id]
+
+        if confidence > 0.25:
+            cx, cy, w, h = pred[0], pred[1], pred[2], pred[3]
+
+            x_scale = original_w / 640
+            y_scale = original_h / 640
+
+            width = w * x_scale
+            height = h * y_scale
+            left = (cx - w/2) * x_scale
+            top = (cy - h/2) * y_scale
+
+            boxes.append([int(left), int(top), int(width), int(height)])
+            confidences.append(float(confidence))
+            class_ids.append(int(class_id))
+
+    if class_agnostic:
+        groups = [list(range(len(boxes)))]
+    else:
+        groups = [[i for i, c in enumerate(class_ids) if c == cls] for cls in sorted(set(class_ids))]
+
+    results = []
+    for group in groups:
+        indices = cv2.dnn.NMSBoxes([boxes[i] for i in group], [confidences[i] for i in group], 0.5, 0.4)
+        if len(indices) > 0:
+            if isinstance(indices, tuple):
+                indices = indices[0]
+            if hasattr(indices, 'flatten'):
+                indices = indices.flatten()
+            for i in indices:
+                idx = group[int(i)]
+                results.append((class_ids[idx], confidences[idx], boxes[idx]))
+    return results
+
+
+def vectorized_decode(output, original_w, original_h, class_agnostic):
+    boxes, scores, class_ids = decode_yolo(output, original_w, original_h, class_agnostic=class_agnostic)
+    return list(zip(class_ids.tolist(), scores.tolist(), boxes.tolist()))
+
+
+def load_raw_outputs():
+    # Real YOLOv8 outputs on the test set when the model is available,
+    # otherwise synthetic (84, 8400) tensors with a YOLO-like score distribution
+    # plus clusters of confident, overlapping anchors around a few objects, so
+    # thresholding and NMS have real work to do
+    images = sorted(f for f in os.listdir(TEST_DIR) if f.lower().endswith((".jpg", ".png", ".jpeg")))
+
+    if os.path.exists(MODEL_PATH):
+        import onnxruntime as ort
+        session = ort.InferenceSession(MODEL_PATH)
+        input_name = session.get_inputs()[0].name
+        frames = []
+        for name in images:
+            img = cv2.imread(os.path.join(TEST_DIR, name))
+            h, w, _ = img.shape
+            rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            x = cv2.resize(rgb, (640, 640)).transpose(2, 0, 1)[np.newaxis] / 255.0
+            output = session.run(None, {input_name: x.astype(np.float32)})[0][0]
+            frames.append((name, output, w, h))
+        return "model", frames
+
+    rng = np.random.default_rng(0)
+    frames = []
+    for name in images:
+        output = np.empty((84, 8400), dtype=np.float32)
+        output[0:2] = rng.uniform(0, 640, (2, 8400))
+        output[2:4] = rng.uniform(4, 320, (2, 8400))
+        output[4:] = rng.beta(0.2, 20.0, (80, 8400))
+        anchors = rng.permutation(8400)
+        for obj in range(SYNTHETIC_OBJECTS):
+            cluster = anchors[obj * SYNTHETIC_CLUSTER:(obj + 1) * SYNTHETIC_CLUSTER]
+            center = rng.uniform(40, 600, 2)
+            size = rng.uniform(30, 200, 2)
+            # A few objects share a class and overlap, so class-aware and
+            # class-agnostic NMS disagree
+            cls = rng.integers(0, 4)
+            output[0:2, cluster] = (center[:, None] + rng.normal(0, size[:, None] * 0.05, (2, len(cluster))))
+            output[2:4, cluster] = size[:, None] * rng.uniform(0.9, 1.1, (2, len(cluster)))
+            output[4 + cls, cluster] = rng.uniform(0.3, 0.95, len(cluster))
+            # Some anchors also score a second class
+            runner_up = cluster[rng.random(len(cluster)) < 0.3]
+            output[4 + (cls + 1) % 4, runner_up] = rng.uniform(0.55, 0.9, len(runner_up))
+        frames.append((name, output, 640, 480))
+    return "synthetic", frames
+
+
+def time_per_frame(fn, frames):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        for _, output, w, h in frames:
+            fn(output, w, h)
+    return (time.perf_counter() - start) * 1000 / (REPEATS * len(frames))
+
+
+def main():
+    source, frames = load_raw_outputs()
+    if not frames:
+        print(f"No images found in {TEST_DIR}.")
+        sys.exit(1)
+
+    # Parity: the vectorized path must match the old loop exactly, both with
+    # class-agnostic NMS and with the per-class NMS /predict uses
+    mismatches = []
+    detections = 0
+    for name, output, w, h in frames:
+        for class_agnostic in (True, False):
+            expected = legacy_decode(output, w, h, class_agnostic)
+            actual = vectorized_decode(output, w, h, class_agnostic)
+            detections += len(actual)
+            if sorted(expected) != sorted(actual):
+                mismatches.append(f"{name} ({'class-agnostic' if class_agnostic else 'class-aware'})")
+
+    report = {
+        "source": source,
+        "frames": len(frames),
+        "parity_detections": detections,
+        "parity_mismatches": mismatches,
+        "legacy_decode_ms_per_frame": time_per_frame(legacy_decode, frames),
+        "vectorized_decode_ms_per_frame": time_per_frame(
+            lambda o, w, h: decode_yolo(o, w, h), frames),
+    }
+    report["speedup"] = report["legacy_decode_ms_per_frame"] / report["vectorized_decode_ms_per_frame"]
+    print(json.dumps(report, indent=4))
+
+    if mismatches:
+        print(f"PARITY FAILED on {len(mismatches)} frame(s)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
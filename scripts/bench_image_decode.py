@@ -0,0 +1,144 @@
+import os
+import sys
+import time
+import json
+import argparse
+import numpy as np
+import cv2
+
+# Allow "python scripts/bench_image_decode.py" from the repo root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from backend.utils.decode import decode_scaled, rescale_detections
+from backend.utils.detections import to_dicts
+from backend.utils.preprocess import YoloPreprocessor, SsdPreprocessor
+from bench_variants import agreement
+
+# Configuration
+TEST_DIR = "evaluation/test_images"
+HD_SIZES = {"720p": (1280, 720), "1080p": (1920, 1080)}
+JPEG_QUALITY = 90
+REPEATS = 3
+
+# What each model resizes to, and the decode floor that implies (see ModelManager.min_decode_size)
+MODELS = {
+    "v2": (YoloPreprocessor(size=640, letterbox=True), (640, 0)),
+    "v1": (SsdPreprocessor(size=300), (300, 300)),
+}
+
+
+def load_sets(test_dir, limit):
+    # The test images as they are, plus the same scenes re-encoded as HD webcam frames
+    names = sorted(f for f in os.listdir(test_dir) if f.lower().endswith((".jpg", ".jpeg")))[:limit]
+    sets = {"test_images": []}
+    for name in names:
+        with open(os.path.join(test_dir, name), "rb") as f:
+            sets["test_images"].append((name, f.read()))
+    for label, size in HD_SIZES.items():
+        sets[label] = []
+        for name, data in sets["test_images"]:
+            img = cv2.resize(cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR), size,
+                             interpolation=cv2.INTER_CUBIC)
+            sets[label].append((name, cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])[1].tobytes()))
+    return sets
+
+
+def model_input(preprocess, img):
+    out = preprocess([img])
+    return (out[0] if isinstance(out, tuple) else out)[0].astype(np.float32)
+
+
+def psnr(a, b, peak):
+    mse = float(np.mean((a - b) ** 2))
+    return float("inf") if mse == 0 else 10 * np.log10(peak * peak / mse)
+
+
+def time_ms(fn, frames):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        for _, data in frames:
+            fn(data)
+    return (time.perf_counter() - start) * 1000 / (REPEATS * len(frames))
+
+
+def bench(frames, version, manager):
+    preprocess, min_size = MODELS[version]
+    peak = 1.0 if version == "v2" else 255.0
+
+    def full(data):
+        return model_input(preprocess, decode_scaled(data, reduce=False)[0])
+
+    def reduced(data):
+        return model_input(preprocess, decode_scaled(data, *min_size)[0])
+
+    factors, psnrs = [], []
+    full_dets, reduced_dets = {}, {}
+    for name, data in frames:
+        img_full, _ = decode_scaled(data, reduce=False)
+        img_small, scale = decode_scaled(data, *min_size)
+        factors.append(round(img_full.shape[1] / img_small.shape[1]))
+        psnrs.append(psnr(model_input(preprocess, img_full), model_input(preprocess, img_small), peak))
+        if manager is not None:
+            full_dets[name] = to_dicts(manager.predict(version, img_full))
+            reduced_dets[name] = to_dicts(rescale_detections(manager.predict(version, img_small), scale))
+
+    finite = [p for p in psnrs if np.isfinite(p)]
+    result = {
+        "frames": len(frames),
+        "decode_factors": {str(f): factors.count(f) for f in sorted(set(factors))},
+        "decode_ms_full": time_ms(lambda d: decode_scaled(d, reduce=False), frames),
+        "decode_ms_reduced": time_ms(lambda d: decode_scaled(d, *min_size), frames),
+        "decode_preprocess_ms_full": time_ms(full, frames),
+        "decode_preprocess_ms_reduced": time_ms(reduced, frames),
+        # How close the model's input tensor is to the full-decode one (inf = identical)
+        "input_psnr_db_min": min(psnrs),
+        "input_psnr_db_mean": float(np.mean(finite)) if finite else float("inf"),
+    }
+    result["saved_ms"] = result["decode_preprocess_ms_full"] - result["decode_preprocess_ms_reduced"]
+    if manager is not None:
+        # Detections on reduced frames (boxes mapped back) vs full frames
+        result["agreement"] = agreement(full_dets, reduced_dets)
+    return result
+
+
+def load_manager(version):
+    # Accuracy needs the real model; timing and input fidelity don't
+    try:
+        from backend.utils.model_loader import ModelManager
+        manager = ModelManager()
+        manager.load_model(version)
+        return manager
+    except Exception as e:
+        print(f"{version}: model unavailable ({e}), skipping detection agreement")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full vs reduced-resolution JPEG decode per model")
+    parser.add_argument("--test-dir", default=TEST_DIR)
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--versions", default="v2,v1")
+    args = parser.parse_args()
+
+    sets = load_sets(args.test_dir, args.limit)
+    if not sets["test_images"]:
+        print(f"No JPEG images found in {args.test_dir}.")
+        sys.exit(1)
+
+    report = {}
+    for version in [v for v in args.versions.split(",") if v]:
+        manager = load_manager(version)
+        report[version] = {label: bench(frames, version, manager) for label, frames in sets.items()}
+
+    print(f"\n{'model':<6}{'frames':<13}{'factor':>10}{'full ms':>9}{'reduced':>9}{'saved':>8}{'PSNR dB':>9}{'F1':>7}")
+    for version, groups in report.items():
+        for label, r in groups.items():
+            factor = ",".join(f"{f}x{n}" for f, n in r["decode_factors"].items())
+            f1 = f"{r['agreement']['f1']:.3f}" if "agreement" in r else "-"
+            print(f"{version:<6}{label:<13}{factor:>10}{r['decode_preprocess_ms_full']:>9.2f}"
+                  f"{r['decode_preprocess_ms_reduced']:>9.2f}{r['saved_ms']:>8.2f}{r['input_psnr_db_min']:>9.1f}{f1:>7}")
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import os
+import sys
+import time
+import json
+import tempfile
+import numpy as np
+
+# Allow "python scripts/bench_incident_store.py" from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from alert_service.incident_store import IncidentStore
+
+# Configuration
+HISTORY_SIZES = [1000, 10000, 100000, 500000]
+BATCH_SIZE = 100  # AlertDispatcher max_batch
+QUERY_REPEATS = 200
+CLASSES = ["cell phone", "book", "laptop", "SUSPICIOUS MOVEMENT", "STUDENT LEFT FRAME"]
+STREAMS = 200
+
+
+def make_batch(rng, n):
+    return [
+        {
+            "timestamp": time.strftime("%H:%M:%S"),
+            "object_class": CLASSES[rng.integers(len(CLASSES))],
+            "confidence": float(rng.random()),
+            "count": 1,
+            "stream_id": f"stream-{rng.integers(STREAMS)}",
+        }
+        for _ in range(n)
+    ]
+
+
+def timed_ms(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": float(np.percentile(samples, 50)), "p99_ms": float(np.percentile(samples, 99))}
+
+
+def main():
+    rng = np.random.default_rng(0)
+    report = []
+    with tempfile.TemporaryDirectory() as tmp:
+        store = IncidentStore(os.path.join(tmp, "alerts.db"), max_rows=max(HISTORY_SIZES))
+        for target in HISTORY_SIZES:
+            # Grow the history, timing the inserts on the way
+            start = time.perf_counter()
+            inserted = 0
+            while store.size < target:
+                inserted += len(store.append(make_batch(rng, BATCH_SIZE)))
+            fill_s = time.perf_counter() - start
+
+            newest = store.max_id
+            report.append({
+                "history": store.size,
+                "inserts_per_s": inserted / fill_s if inserted else None,
+                "append_batch": timed_ms(lambda: store.append(make_batch(rng, BATCH_SIZE)), 20),
+                # 1 Hz poller that is a few alerts behind
+                "poll_since": timed_ms(lambda: store.query(since=newest - 10), QUERY_REPEATS),
+                "page_before": timed_ms(lambda: store.query(before=newest // 2, limit=50), QUERY_REPEATS),
+                "by_stream": timed_ms(lambda: store.query(stream_id="stream-7", limit=50), QUERY_REPEATS),
+                "by_class": timed_ms(lambda: store.query(object_class="book", limit=50), QUERY_REPEATS),
+            })
+        store.close()
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import os
+import sys
+import time
+import json
+import signal
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+
+# Allow "python scripts/bench_model_host.py" from the repo root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Configuration
+TEST_DIR = "evaluation/test_images"
+DURATION_S = 20
+BASE_PORT = 8100
+
+
+def children(pid):
+    # pid and all its descendants (Linux /proc)
+    pids = [pid]
+    for p in pids:
+        try:
+            for task in os.listdir(f"/proc/{p}/task"):
+                with open(f"/proc/{p}/task/{task}/children") as f:
+                    pids.extend(int(c) for c in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def pss_mb(pid):
+    # Proportional set size: pages shared between processes (model host and
+    # workers, forked libraries) are split between them, so the sum over a
+    # process tree is what the pod really uses
+    total = 0
+    for p in children(pid):
+        try:
+            with open(f"/proc/{p}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Pss:"):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total / 1024
+
+
+def wait_ready(url, workers, timeout_s):
+    # Every worker answers /ready on its own; wait for a run of 200s
+    deadline = time.monotonic() + timeout_s
+    streak = 0
+    while time.monotonic() < deadline:
+        try:
+            streak = streak + 1 if requests.get(f"{url}/ready", timeout=2).status_code == 200 else 0
+        except requests.RequestException:
+            streak = 0
+        if streak >= workers * 4:
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def load(url, images, clients, duration):
+    def client(i):
+        session = requests.Session()
+        latencies, n = [], i
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            name, body = images[n % len(images)]
+            start = time.perf_counter()
+            response = session.post(f"{url}/predict", files={"file": (name, body, "image/jpeg")})
+            if response.status_code == 200:
+                latencies.append((time.perf_counter() - start) * 1000)
+            n += clients
+        return latencies
+
+    with ThreadPoolExecutor(clients) as pool:
+        latencies = np.concatenate([np.array(lat) for lat in pool.map(client, range(clients))])
+    return {
+        "throughput_img_s": len(latencies) / duration,
+        "latency_ms_p50": float(np.percentile(latencies, 50)) if len(latencies) else None,
+        "latency_ms_p95": float(np.percentile(latencies, 95)) if len(latencies) else None,
+    }
+
+
+def run(mode, workers, port, images, args):
+    env = dict(os.environ, MODEL_HOST="1" if mode == "host" else "0", WEB_CONCURRENCY=str(workers),
+               PORT=str(port), PRELOAD_MODELS=args.preload, MODEL_HOST_SOCKET=f"/tmp/bench_model_host_{port}.sock",
+               ALERT_SERVICE_URL="http://127.0.0.1:9/log_violation")
+    server = subprocess.Popen([sys.executable, "-m", "backend.serve"], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        start = time.perf_counter()
+        if not wait_ready(url, workers, args.timeout):
+            return {"mode": mode, "workers": workers, "error": "not ready"}
+        result = {"mode": mode, "workers": workers, "ready_s": time.perf_counter() - start,
+                  "idle_pss_mb": pss_mb(server.pid)}
+        result.update(load(url, images, args.clients_per_worker * workers, args.duration))
+        result["loaded_pss_mb"] = pss_mb(server.pid)
+        return result
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait(30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory and throughput vs uvicorn workers, with and without the model host")
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--modes", default="inprocess,host")
+    parser.add_argument("--preload", default="v2", help="PRELOAD_MODELS for the server")
+    parser.add_argument("--clients-per-worker", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=DURATION_S)
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for /ready")
+    parser.add_argument("--test-dir", default=TEST_DIR)
+    args = parser.parse_args()
+
+    test_dir = os.path.join(ROOT, args.test_dir)
+    names = sorted(f for f in os.listdir(test_dir) if f.lower().endswith((".jpg", ".jpeg")))
+    images = []
+    for name in names:
+        with open(os.path.join(test_dir, name), "rb") as f:
+            images.append((name, f.read()))
+
+    results, port = [], BASE_PORT
+    for mode in args.modes.split(","):
+        for workers in [int(w) for w in args.workers.split(",")]:
+            print(f"Running {mode} with {workers} worker(s)...")
+            results.append(run(mode, workers, port, images, args))
+            port += 1
+
+    print(f"\n{'mode':<11}{'workers':>8}{'PSS MB':>9}{'loaded':>9}{'img/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'ready s':>9}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['mode']:<11}{r['workers']:>8}  {r['error']}")
+            continue
+        print(f"{r['mode']:<11}{r['workers']:>8}{r['idle_pss_mb']:>9.0f}{r['loaded_pss_mb']:>9.0f}"
+              f"{r['throughput_img_s']:>8.1f}{r['latency_ms_p50'] or 0:>9.1f}{r['latency_ms_p95'] or 0:>9.1f}"
+              f"{r['ready_s']:>9.1f}")
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
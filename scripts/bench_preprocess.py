@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+import json
+import tracemalloc
+import numpy as np
+import cv2
+
+# Allow "python scripts/bench_preprocess.py" from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.utils.preprocess import YoloPreprocessor
+
+# Configuration
+TEST_DIR = "evaluation/test_images"
+HD_FRAMES = 20  # synthetic 1280x720 webcam frames added to the test set
+REPEATS = 5
+
+
+def legacy_preprocess(img):
+    # What _predict_yolo did per frame before YoloPreprocessor
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    img_resized = cv2.resize(img, (640, 640))
+    img_input = img_resized.transpose(2, 0, 1)
+    img_input = img_input[np.newaxis, :, :, :] / 255.0
+    return img_input.astype(np.float32)
+
+
+def load_frames():
+    images = sorted(f for f in os.listdir(TEST_DIR) if f.lower().endswith((".jpg", ".png", ".jpeg")))
+    frames = [cv2.imread(os.path.join(TEST_DIR, name)) for name in images]
+    rng = np.random.default_rng(0)
+    frames += [rng.integers(0, 256, (720, 1280, 3), dtype=np.uint8) for _ in range(HD_FRAMES)]
+    return frames
+
+
+def measure(fn, frames):
+    # Warm-up pass so one-off buffer allocation isn't counted per frame
+    for img in frames[:2]:
+        fn(img)
+
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        for img in frames:
+            fn(img)
+    us_per_frame = (time.perf_counter() - start) * 1e6 / (REPEATS * len(frames))
+
+    # Peak bytes allocated while preprocessing one frame (numpy + OpenCV outputs)
+    peaks = []
+    tracemalloc.start()
+    for img in frames:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn(img)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+
+    return {"us_per_frame": us_per_frame, "peak_bytes_per_frame": int(np.mean(peaks))}
+
+
+def main():
+    frames = load_frames()
+    letterbox = YoloPreprocessor(letterbox=True)
+    stretch = YoloPreprocessor(letterbox=False)
+
+    report = {
+        "frames": len(frames),
+        "legacy": measure(legacy_preprocess, frames),
+        "fused_stretch": measure(lambda img: stretch([img]), frames),
+        "fused_letterbox": measure(lambda img: letterbox([img]), frames),
+    }
+
+    # The stretch mode must produce exactly the old tensor
+    mismatches = sum(
+        not np.array_equal(legacy_preprocess(img)[0], stretch([img])[0][0]) for img in frames
+    )
+    report["stretch_parity_mismatches"] = mismatches
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
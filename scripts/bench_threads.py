@@ -0,0 +1,129 @@
+import os
+import sys
+import time
+import json
+import argparse
+import multiprocessing as mp
+import numpy as np
+import cv2
+
+# Allow "python scripts/bench_threads.py" from the repo root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from backend.utils.runtime import cpu_budget
+
+# Configuration
+TEST_DIR = "evaluation/test_images"
+IMAGES = 32
+DURATION_S = 20
+
+
+def load_images(test_dir, limit):
+    names = sorted(f for f in os.listdir(test_dir) if f.lower().endswith((".jpg", ".png", ".jpeg")))[:limit]
+    images = [cv2.imread(os.path.join(test_dir, name)) for name in names]
+    images = [img for img in images if img is not None]
+    if not images:
+        rng = np.random.default_rng(0)
+        images = [rng.integers(0, 256, (480, 640, 3), dtype=np.uint8) for _ in range(limit)]
+    return images
+
+
+def worker(cpus, threads, args, barrier, results):
+    # One simulated uvicorn worker: its own model copy, pinned to its share of the cores
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    from backend.utils.model_loader import ModelManager
+    from backend.utils.runtime import RuntimeProfile
+
+    images = load_images(args.test_dir, args.images)
+    manager = ModelManager(yolo_variant=args.variant, runtime=RuntimeProfile(intra_op_threads=threads))
+    manager.load_model(args.version)
+    barrier.wait()
+
+    latencies = []
+    done = 0
+    deadline = time.perf_counter() + args.duration
+    while time.perf_counter() < deadline:
+        batch = [images[(done + i) % len(images)] for i in range(args.batch)]
+        start = time.perf_counter()
+        manager.predict_batch(args.version, batch)
+        latencies.append((time.perf_counter() - start) * 1000)
+        done += args.batch
+    results.put((done, latencies))
+
+
+def run_combo(workers, threads, cores, args):
+    ctx = mp.get_context("spawn")  # fresh interpreters: no ORT/TF thread pools inherited
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    # Disjoint core sets when the host has enough cores, otherwise all share them
+    pin = workers * threads <= len(cores)
+    procs = []
+    for i in range(workers):
+        cpus = cores[i * threads:(i + 1) * threads] if pin else cores
+        procs.append(ctx.Process(target=worker, args=(cpus, threads, args, barrier, results)))
+    for p in procs:
+        p.start()
+    outputs = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    images = sum(done for done, _ in outputs)
+    latencies = np.concatenate([lat for _, lat in outputs])
+    return {
+        "workers": workers,
+        "threads": threads,
+        "cpus_used": workers * threads,
+        "throughput_img_s": images / args.duration,
+        "latency_ms_p50": float(np.percentile(latencies, 50)),
+        "latency_ms_p95": float(np.percentile(latencies, 95)),
+    }
+
+
+def combos(budget, spec):
+    # "2x2,4x1" -> [(2, 2), (4, 1)]; default: every split that uses the whole budget
+    if spec:
+        return [tuple(int(n) for n in item.split("x")) for item in spec.split(",")]
+    return [(w, budget // w) for w in range(1, budget + 1) if budget % w == 0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep worker processes x ORT/TF threads for a CPU budget")
+    parser.add_argument("--cores", type=int, default=None, help="core budget (default: cgroup quota / affinity)")
+    parser.add_argument("--combos", default="", help="explicit list, e.g. 1x4,2x2,4x1 (workers x threads)")
+    parser.add_argument("--version", choices=["v1", "v2"], default="v2")
+    parser.add_argument("--variant", default="fp32", help="v2 model variant (see YOLO_VARIANTS)")
+    parser.add_argument("--batch", type=int, default=1, help="images per inference call")
+    parser.add_argument("--duration", type=float, default=DURATION_S, help="seconds per combination")
+    parser.add_argument("--images", type=int, default=IMAGES)
+    parser.add_argument("--test-dir", default=TEST_DIR)
+    parser.add_argument("--max-p95-ms", type=float, default=None, help="latency bar for the recommendation")
+    args = parser.parse_args()
+
+    budget = args.cores or max(1, int(cpu_budget()[0]))
+    cores = sorted(os.sched_getaffinity(0))
+    print(f"Core budget: {budget} (visible cores: {len(cores)})")
+
+    results = []
+    for workers, threads in combos(budget, args.combos):
+        print(f"Running {workers} worker(s) x {threads} thread(s) for {args.duration:.0f}s...")
+        results.append(run_combo(workers, threads, cores, args))
+
+    print(f"\n{'workers':>8}{'threads':>9}{'img/s':>9}{'p50 ms':>9}{'p95 ms':>9}")
+    for r in results:
+        print(f"{r['workers']:>8}{r['threads']:>9}{r['throughput_img_s']:>9.1f}"
+              f"{r['latency_ms_p50']:>9.1f}{r['latency_ms_p95']:>9.1f}")
+
+    # Highest throughput among the combinations that meet the latency bar
+    eligible = [r for r in results if args.max_p95_ms is None or r["latency_ms_p95"] <= args.max_p95_ms]
+    recommended = max(eligible, key=lambda r: r["throughput_img_s"]) if eligible else None
+    if recommended:
+        print(f"\nRecommended for {budget} cores: WEB_CONCURRENCY={recommended['workers']} "
+              f"ORT_INTRA_OP_THREADS={recommended['threads']}")
+    else:
+        print(f"\nNo combination meets p95 <= {args.max_p95_ms} ms")
+    print(json.dumps({"cores": budget, "results": results, "recommended": recommended}, indent=4))
+
+
+if __name__ == "__main__":
+    main()
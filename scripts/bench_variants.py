@@ -0,0 +1,149 @@
+import os
+import sys
+import time
+import json
+import argparse
+import resource
+import subprocess
+import numpy as np
+import cv2
+
+# Allow "python scripts/bench_variants.py" from the repo root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from backend.utils.tracking import iou_matrix
+from backend.utils.detections import to_dicts
+
+# Configuration
+TEST_DIR = "evaluation/test_images"
+REFERENCE = "fp32"
+THROUGHPUT_BATCH = 8
+MATCH_IOU = 0.5
+
+
+def load_images(test_dir, limit):
+    names = sorted(f for f in os.listdir(test_dir) if f.lower().endswith((".jpg", ".png", ".jpeg")))[:limit]
+    return names, [cv2.imread(os.path.join(test_dir, name)) for name in names]
+
+
+def measure_variant(variant, test_dir, limit):
+    # Runs in its own process so load time and memory aren't skewed by the
+    # variants measured before it
+    from backend.utils.model_loader import ModelManager, YOLO_VARIANTS, BASE_DIR
+
+    names, images = load_images(test_dir, limit)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    manager = ModelManager(yolo_variant=variant)
+    manager.load_model("v2")
+    info = manager.model_info["v2"]
+
+    latencies, detections = [], []
+    for img in images:
+        start = time.perf_counter()
+        detections.append(to_dicts(manager.predict("v2", img)))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    for i in range(0, len(images), THROUGHPUT_BATCH):
+        manager.predict_batch("v2", images[i:i + THROUGHPUT_BATCH])
+    throughput = len(images) / (time.perf_counter() - start)
+
+    return {
+        "variant": variant,
+        "file_mb": os.path.getsize(BASE_DIR / "models" / "v2" / YOLO_VARIANTS[variant]) / 2**20,
+        "load_s": info["load_s"],
+        "warmup_s": info["warmup_s"],
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "model_rss_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024,
+        "latency_ms_p50": float(np.percentile(latencies, 50)),
+        "latency_ms_p95": float(np.percentile(latencies, 95)),
+        "throughput_img_s": throughput,
+        "detections": dict(zip(names, detections)),
+    }
+
+
+def agreement(reference, candidate):
+    # Detections of the candidate matched to fp32 ones (same class, IoU >= MATCH_IOU)
+    matched = total_ref = total_cand = 0
+    score_diffs = []
+    for name, ref in reference.items():
+        cand = candidate.get(name, [])
+        total_ref += len(ref)
+        total_cand += len(cand)
+        if not ref or not cand:
+            continue
+        iou = iou_matrix(np.array([d["box"] for d in ref]), np.array([d["box"] for d in cand]))
+        same_class = np.array([[r["class"] == c["class"] for c in cand] for r in ref])
+        iou = np.where(same_class, iou, 0)
+        while iou.size and iou.max() >= MATCH_IOU:
+            r, c = np.unravel_index(np.argmax(iou), iou.shape)
+            matched += 1
+            score_diffs.append(abs(ref[r]["score"] - cand[c]["score"]))
+            iou[r, :] = 0
+            iou[:, c] = 0
+
+    precision = matched / total_cand if total_cand else 1.0
+    recall = matched / total_ref if total_ref else 1.0
+    return {
+        "precision": precision,
+        "recall": recall,
+        "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        "mean_abs_score_diff": float(np.mean(score_diffs)) if score_diffs else None,
+        "detections": total_cand,
+    }
+
+
+def main():
+    from backend.utils.model_loader import YOLO_VARIANTS, BASE_DIR
+
+    parser = argparse.ArgumentParser(description="Latency / memory / agreement of every v2 model variant")
+    parser.add_argument("--test-dir", default=TEST_DIR)
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--min-f1", type=float, default=0.9, help="accuracy bar for the recommendation")
+    parser.add_argument("--variant", help=argparse.SUPPRESS)  # internal: measure one variant, print JSON
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(measure_variant(args.variant, args.test_dir, args.limit)))
+        return
+
+    available = [v for v, f in YOLO_VARIANTS.items() if (BASE_DIR / "models" / "v2" / f).exists()]
+    if REFERENCE not in available:
+        print(f"The {REFERENCE} model is required as the reference")
+        sys.exit(1)
+    print(f"Variants found: {available}")
+
+    results = {}
+    for variant in available:
+        cmd = [sys.executable, os.path.abspath(__file__), "--variant", variant, "--test-dir", args.test_dir]
+        if args.limit:
+            cmd += ["--limit", str(args.limit)]
+        out = subprocess.run(cmd, capture_output=True, text=True, cwd=ROOT)
+        if out.returncode != 0:
+            print(f"{variant} failed:\n{out.stderr[-2000:]}")
+            continue
+        results[variant] = json.loads(out.stdout.strip().splitlines()[-1])
+    if REFERENCE not in results:
+        sys.exit(1)
+
+    detections = {variant: result.pop("detections") for variant, result in results.items()}
+    for variant, result in results.items():
+        result["agreement"] = agreement(detections[REFERENCE], detections[variant]) if variant != REFERENCE else None
+
+    # Cheapest = lowest p50 latency among the variants that clear the accuracy bar
+    eligible = [v for v, r in results.items() if r["agreement"] is None or r["agreement"]["f1"] >= args.min_f1]
+    recommended = min(eligible, key=lambda v: results[v]["latency_ms_p50"])
+
+    print(f"\n{'variant':<14}{'file MB':>9}{'RSS MB':>9}{'load s':>8}{'p50 ms':>9}{'p95 ms':>9}{'img/s':>8}{'F1':>7}{'recall':>8}")
+    for variant, r in results.items():
+        a = r["agreement"] or {"f1": 1.0, "recall": 1.0}
+        print(f"{variant:<14}{r['file_mb']:>9.1f}{r['model_rss_mb']:>9.0f}{r['load_s']:>8.2f}"
+              f"{r['latency_ms_p50']:>9.1f}{r['latency_ms_p95']:>9.1f}{r['throughput_img_s']:>8.1f}"
+              f"{a['f1']:>7.3f}{a['recall']:>8.3f}")
+    print(f"\nRecommended (F1 vs {REFERENCE} >= {args.min_f1}): YOLO_VARIANT={recommended}")
+    print(json.dumps({"variants": results, "recommended": recommended}, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,118 +1,221 @@
 import os
+import sys
 import json
-import requests
 import time
-import sys  # <--- ADDED THIS (Required for sys.exit)
-from collections import Counter
+import argparse
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+# Allow "python scripts/drift_detection.py" from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.utils.drift import DriftMonitor, Histograms, build_baseline, save_baseline, load_baseline, records_to_arrays
+from backend.utils.audit import segment_paths, read_segment
 
 # Configuration
 TEST_DIR = "evaluation/test_images"
-PREDICT_URL = "http://localhost:8000/predict" 
-REFERENCE_FILE = "scripts/baseline_reference.json"
+PREDICT_URL = "http://localhost:8000/predict"
+REFERENCE_FILE = "scripts/baseline_reference.json"  # summary thresholds (used when there is no histogram baseline)
+BASELINE_FILE = "scripts/baseline_histograms.json"  # written by --build-baseline
+CHUNK_RECORDS = 10000  # records parsed and binned per step when reading a log
+WORKERS = 4
+BATCH_IMAGES = 16  # images per /predict_batch request
 
-def load_baseline():
-    if not os.path.exists(REFERENCE_FILE):
-        print(f"Error: Reference file {REFERENCE_FILE} not found.")
-        return None
-    with open(REFERENCE_FILE) as f:
-        return json.load(f)
 
-def run_inference(image_path):
+def run_inference(image_paths):
+    # One /predict_batch request; returns a {"detections": [...]} record per image that succeeded
     try:
-        with open(image_path, "rb") as f:
-            r = requests.post(PREDICT_URL, files={"file": (image_path, f, "image/jpeg")})
-            
-            # --- DEBUGGING CHANGE START ---
-            if r.status_code != 200:
-                print(f"FAILED: {image_path} | Status: {r.status_code} | Reason: {r.text}")
-                return None
-            # --- DEBUGGING CHANGE END ---
-            
-            return r.json()
+        files = []
+        for path in image_paths:
+            with open(path, "rb") as f:
+                files.append(("files", (os.path.basename(path), f.read(), "image/jpeg")))
+        r = requests.post(PREDICT_URL + "_batch", files=files)
+        if r.status_code != 200:
+            print(f"FAILED: {len(image_paths)} images | Status: {r.status_code} | Reason: {r.text}")
+            return []
+        records = []
+        for path, item in zip(image_paths, r.json()["results"]):
+            if "error" in item:
+                print(f"FAILED: {path} | Reason: {item['error']}")
+            else:
+                records.append(item)
+        return records
     except Exception as e:
-        print(f"Connection failed for {image_path}: {e}")
-        return None
-
-def detect_drift():
-    print("--- Starting Drift Detection Check ---")
-    baseline = load_baseline()
-    if not baseline: return
+        print(f"Connection failed for {len(image_paths)} images: {e}")
+        return []
 
-    all_conf = []
-    all_classes = []
-    all_det_counts = []
 
-    # Get images (limit to 20 for speed during check)
-    images = [f for f in os.listdir(TEST_DIR) if f.lower().endswith((".jpg", ".png", ".jpeg"))][:20]
-    
+def http_records(limit):
+    # Sends the test images to /predict_batch, a few requests in parallel; yields one chunk of results
+    images = sorted(f for f in os.listdir(TEST_DIR) if f.lower().endswith((".jpg", ".png", ".jpeg")))[:limit]
     if not images:
         print(f"No images found in {TEST_DIR}.")
         return
+    print(f"Checking {len(images)} images from {TEST_DIR} against baseline...")
+    paths = [os.path.join(TEST_DIR, name) for name in images]
+    batches = [paths[i:i + BATCH_IMAGES] for i in range(0, len(paths), BATCH_IMAGES)]
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        records = [record for batch in executor.map(run_inference, batches) for record in batch]
+    yield records
+
+
+def file_records(path, follow=False, poll_s=1.0):
+    # JSONL of frame results ({"detections": [...]}, e.g. /predict responses),
+    # read CHUNK_RECORDS lines at a time. With follow, keeps tailing the file.
+    with open(path) as f:
+        chunk = []
+        while True:
+            line = f.readline()
+            if not line:
+                if chunk:
+                    yield chunk
+                    chunk = []
+                if not follow:
+                    return
+                time.sleep(poll_s)
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and "detections" in record:
+                chunk.append(record)
+                if len(chunk) >= CHUNK_RECORDS:
+                    yield chunk
+                    chunk = []
+
+
+def audit_records(directory, follow=False, model=None):
+    # The backend's audit log (AUDIT_LOG_DIR): frames it already served, no
+    # re-inference. Only frames of `model` when given, failed requests skipped.
+    # Chunks end at segment boundaries too, so a followed log is binned as
+    # soon as the server finishes a segment.
+    for path in segment_paths(directory, follow=follow):
+        chunk = []
+        try:
+            for record in read_segment(path):
+                if "detections" not in record or (model is not None and record["model"] != model):
+                    continue
+                chunk.append(record)
+                if len(chunk) >= CHUNK_RECORDS:
+                    yield chunk
+                    chunk = []
+        except FileNotFoundError:
+            pass  # rotated away by the size cap
+        if chunk:
+            yield chunk
+
+
+def print_report(report):
+    print(f"\nWindow: {report['frames']} frames (baseline: {report['baseline_frames']})")
+    for name, result in report["features"].items():
+        test = f"chi2={result['chi2']:.1f} dof={result['dof']}" if "chi2" in result and result["chi2"] is not None \
+            else f"ks={result['ks']:.3f}" if result.get("ks") is not None else "-"
+        p = f"p={result['p_value']:.2g}" if result.get("p_value") is not None else ""
+        flag = "DRIFT" if result["drift"] else "ok"
+        print(f"  {name:<16} psi={result['psi']:.3f}  {test:<22} {p:<10} {flag}")
+    if report.get("unexpected_class_detections"):
+        print(f"  {report['unexpected_class_detections']} detections of classes the baseline never saw")
+
+
+def legacy_check(window, score_sum, reference):
+    # The original summary rules, for when only baseline_reference.json exists
+    detections = int(window.classes.sum())
+    if detections == 0:
+        return None
+    avg_conf = score_sum / detections
+    avg_det = detections / max(window.frames, 1)
+    print(f"Current Avg Confidence: {avg_conf:.2f} (Baseline: {reference['avg_confidence']})")
+    print(f"Current Avg Detections: {avg_det:.2f} (Baseline: {reference['avg_detections']})")
+
+    reasons = []
+    if avg_conf < (reference["avg_confidence"] - reference["min_confidence_drop"]):
+        reasons.append(f"Confidence drop detected ({avg_conf:.2f} < {reference['avg_confidence']})")
+    unexpected = [name for name, n in zip(window.class_names, window.classes)
+                  if n and name not in reference["expected_classes"]]
+    if unexpected:
+        reasons.append(f"Unexpected classes found: {unexpected}")
+    if abs(avg_det - reference["avg_detections"]) > 1.5:
+        reasons.append(f"Detection count shifted significantly ({avg_det:.2f} vs {reference['avg_detections']})")
+    return reasons
 
-    print(f"Checking {len(images)} sample images against baseline...")
-
-    for img in images:
-        path = os.path.join(TEST_DIR, img)
-        result = run_inference(path)
-        
-        if not result: continue
-
-        detections = result.get("detections", [])
-        
-        # --- DEBUGGING CHANGE: Print if empty ---
-        if not detections:
-            print(f"WARNING: Image {img} returned 0 detections.")
-        # ----------------------------------------
-
-        all_det_counts.append(len(detections))
-
-        for d in detections:
-            all_conf.append(d["score"])
-            all_classes.append(d["class"])
-
-    if not all_conf:
-        print("No detections made. Potential severe drift or broken model.")
-        sys.exit(1)  # <--- ADDED THIS: Fail if model is broken
-
-    # Compute Current Metrics
-    avg_conf = sum(all_conf) / len(all_conf)
-    avg_det = sum(all_det_counts) / len(all_det_counts)
-
-    class_counts = Counter(all_classes)
-    total_detected = sum(class_counts.values())
-    
-    print(f"Current Avg Confidence: {avg_conf:.2f} (Baseline: {baseline['avg_confidence']})")
-    print(f"Current Avg Detections: {avg_det:.2f} (Baseline: {baseline['avg_detections']})")
-
-    # --- Check Rules ---
-    drift_reasons = []
-
-    # 1. Confidence Drop
-    if avg_conf < (baseline["avg_confidence"] - baseline["min_confidence_drop"]):
-        drift_reasons.append(f"Confidence drop detected ({avg_conf:.2f} < {baseline['avg_confidence']})")
 
-    # 2. Unexpected Classes
-    unexpected = [cls for cls in class_counts if cls not in baseline["expected_classes"]]
-    if unexpected:
-        drift_reasons.append(f"Unexpected classes found: {unexpected}")
+def detect_drift(chunks, args):
+    if args.build_baseline:
+        baseline = build_baseline(chunks, model_version=args.model_version)
+        save_baseline(baseline, args.build_baseline)
+        print(f"Baseline of {baseline['frames']} frames written to {args.build_baseline}")
+        return
 
-    # 3. Detection Count Shift
-    if abs(avg_det - baseline["avg_detections"]) > 1.5:
-        drift_reasons.append(f"Detection count shifted significantly ({avg_det:.2f} vs {baseline['avg_detections']})")
+    if os.path.exists(args.baseline):
+        monitor = DriftMonitor(load_baseline(args.baseline), bucket_frames=args.bucket_frames, buckets=args.buckets)
+        reported = 0
+        for records in chunks:
+            monitor.observe_records(records)
+            # When following a log, report every --report-every frames
+            if args.follow and monitor.frames_total + len(monitor.pending) - reported >= args.report_every:
+                reported = monitor.frames_total + len(monitor.pending)
+                print_report(monitor.report())
+        report = monitor.report()
+        print_report(report)
+        if monitor.window.classes.sum() == 0:
+            print("No detections made. Potential severe drift or broken model.")
+            sys.exit(1)
+        reasons = [f"{name} distribution shifted" for name in report["drifted"]]
+    else:
+        # No histogram baseline yet: the old mean-based rules, still in constant memory
+        print(f"{args.baseline} not found, using summary thresholds from {REFERENCE_FILE}")
+        with open(REFERENCE_FILE) as f:
+            reference = json.load(f)
+        window = Histograms([], open_vocabulary=True)
+        score_sum = 0.0
+        for records in chunks:
+            # Dict or array detections (audit log)
+            arrays = records_to_arrays(records)
+            window.add(*arrays)
+            score_sum += float(arrays[1].sum())
+        reasons = legacy_check(window, score_sum, reference)
+        if reasons is None:
+            print("No detections made. Potential severe drift or broken model.")
+            sys.exit(1)
 
     # Final Decision
-    if drift_reasons:
+    if reasons:
         print("\n DRIFT DETECTED! ")
-        for reason in drift_reasons:
+        for reason in reasons:
             print(f" - {reason}")
-        
-        # # <--- CRITICAL ADDITION START --->
-        # print("Stopping Pipeline due to Quality Gate Failure.")
-        # sys.exit(1) 
-        # # <--- CRITICAL ADDITION END --->
-        
+        if args.fail_on_drift:
+            print("Stopping Pipeline due to Quality Gate Failure.")
+            sys.exit(1)
     else:
         print("\nSystem Healthy. No drift detected.")
 
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare detection distributions against a baseline")
+    parser.add_argument("--source", default="http",
+                        help="'http' to run the test images through /predict, a JSONL file of frame results, "
+                             "or the backend's AUDIT_LOG_DIR")
+    parser.add_argument("--follow", action="store_true", help="keep tailing the JSONL file / audit log (sidecar mode)")
+    parser.add_argument("--limit", type=int, default=None, help="max test images for --source http")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--build-baseline", metavar="OUT", help="write a histogram baseline from the source instead")
+    parser.add_argument("--model-version", default=None,
+                        help="recorded in the baseline; with an audit log, only that model's frames are read")
+    parser.add_argument("--bucket-frames", type=int, default=500)
+    parser.add_argument("--buckets", type=int, default=10, help="window = buckets x bucket-frames latest frames")
+    parser.add_argument("--report-every", type=int, default=5000)
+    parser.add_argument("--fail-on-drift", action="store_true")
+    args = parser.parse_args()
+
+    print("--- Starting Drift Detection Check ---")
+    if args.source == "http":
+        chunks = http_records(args.limit)
+    elif os.path.isdir(args.source):
+        chunks = audit_records(args.source, follow=args.follow, model=args.model_version)
+    else:
+        chunks = file_records(args.source, follow=args.follow)
+    detect_drift(chunks, args)
+
+
 if __name__ == "__main__":
-    detect_drift()
\ No newline at end of file
+    main()
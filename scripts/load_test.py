@@ -0,0 +1,469 @@
+import os
+import sys
+import time
+import json
+import random
+import asyncio
+import logging
+import argparse
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Allow "python scripts/load_test.py" from the repo root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Configuration
+TEST_DIR = "evaluation/test_images"
+PREDICT_URL = "http://localhost:8000/predict"
+ALERTS_URL = "http://localhost:8001/get_alerts"
+
+
+# ---------------------------------------------------------------------------
+# Workload
+# ---------------------------------------------------------------------------
+
+def load_images(test_dir):
+    names = sorted(f for f in os.listdir(test_dir) if f.lower().endswith((".jpg", ".png", ".jpeg")))
+    images = []
+    for name in names:
+        with open(os.path.join(test_dir, name), "rb") as f:
+            images.append((name, f.read()))
+    return images
+
+
+def load_replay(path):
+    # Recorded traffic: one JSON object per line with an "image" path and,
+    # optionally, "t" (seconds since start) to replay the original arrival times
+    frames = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            image_path = record.get("image")
+            if not image_path:
+                continue
+            if not os.path.isabs(image_path):
+                image_path = os.path.join(ROOT, image_path)
+            with open(image_path, "rb") as img:
+                frames.append((os.path.basename(image_path), img.read(), record.get("t")))
+    return frames
+
+
+def multipart_body(image_bytes, filename, stream_id):
+    boundary = uuid.uuid4().hex
+    parts = [
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"stream_id\"\r\n\r\n{stream_id}\r\n".encode(),
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: image/jpeg\r\n\r\n".encode(),
+        image_bytes,
+        f"\r\n--{boundary}--\r\n".encode(),
+    ]
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+# ---------------------------------------------------------------------------
+# Clients: each returns (status_code, body) or raises TimeoutError
+# ---------------------------------------------------------------------------
+
+class HttpClient:
+    # Real HTTP via requests; blocking calls run on a thread pool, one
+    # keep-alive Session per thread
+
+    def __init__(self, predict_url, alerts_url, timeout_s, max_workers):
+        import requests
+        self.requests = requests
+        self.predict_url = predict_url
+        self.alerts_url = alerts_url
+        self.timeout_s = timeout_s
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.local = threading.local()
+
+    def _session(self):
+        if getattr(self.local, "session", None) is None:
+            self.local.session = self.requests.Session()
+        return self.local.session
+
+    def _post(self, body, content_type):
+        try:
+            r = self._session().post(self.predict_url, data=body, timeout=self.timeout_s,
+                                     headers={"Content-Type": content_type})
+            return r.status_code, r.content
+        except self.requests.Timeout:
+            raise TimeoutError()
+
+    def _get_alerts(self):
+        try:
+            r = self._session().get(self.alerts_url, timeout=self.timeout_s)
+            return r.status_code, r.content
+        except self.requests.Timeout:
+            raise TimeoutError()
+
+    async def predict(self, body, content_type):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._post, body, content_type)
+
+    async def get_alerts(self):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._get_alerts)
+
+    async def close(self):
+        self.executor.shutdown(wait=False)
+
+
+async def asgi_request(app, method, path, body=b"", content_type=None, timeout_s=None):
+    # Minimal in-process ASGI call: no sockets, no extra client library
+    headers = [(b"content-length", str(len(body)).encode())]
+    if content_type:
+        headers.append((b"content-type", content_type.encode()))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "", "headers": headers,
+        "client": ("127.0.0.1", 50000), "server": ("loadtest", 80),
+    }
+    sent = False
+    response = {"status": None, "body": []}
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()  # never disconnects
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+
+    try:
+        await asyncio.wait_for(app(scope, receive, send), timeout_s)
+    except asyncio.TimeoutError:
+        raise TimeoutError()
+    return response["status"], b"".join(response["body"])
+
+
+class InProcessClient:
+    # Drives backend.app (and optionally alert_service.app) directly over ASGI
+    # with a stub model, so no network, GPU or model weights are needed
+
+    def __init__(self, timeout_s, stub_latency_ms, with_alerts):
+        self.timeout_s = timeout_s
+        self.stub_latency_ms = stub_latency_ms
+        self.with_alerts = with_alerts
+        self.lifespan = None
+
+    async def start(self):
+        # Alerts from the backend go nowhere in-process; keep retry noise out of the report
+        os.environ.setdefault("ALERT_BATCH_URL", "http://127.0.0.1:9/log_violations")
+        logging.getLogger("backend").setLevel(logging.ERROR)
+
+        import backend.app as backend_app
+        install_stub_model(backend_app.model_manager, self.stub_latency_ms)
+        self.backend = backend_app.app
+        self.lifespan = self.backend.router.lifespan_context(self.backend)
+        await self.lifespan.__aenter__()
+        # /predict answers 503 until warm-up is done; don't count those as load shedding
+        while not backend_app.startup_report["ready"]:
+            if backend_app.startup_report["error"]:
+                raise RuntimeError(f"Backend warm-up failed: {backend_app.startup_report['error']}")
+            await asyncio.sleep(0.05)
+
+        if self.with_alerts:
+            import alert_service.app as alert_app
+            self.alert_app = alert_app.app
+
+    async def predict(self, body, content_type):
+        return await asgi_request(self.backend, "POST", "/predict", body, content_type, self.timeout_s)
+
+    async def get_alerts(self):
+        return await asgi_request(self.alert_app, "GET", "/get_alerts", timeout_s=self.timeout_s)
+
+    async def close(self):
+        if self.lifespan:
+            await self.lifespan.__aexit__(None, None, None)
+
+
+def install_stub_model(model_manager, latency_ms):
+    # Stub "model" behind the real ModelManager registry: fixed cost per batch
+    # plus a small per-image cost, one fake detection per frame
+    from backend.utils.detections import from_arrays, class_ids
+
+    person = class_ids(["person"])
+
+    def run(version, model, imgs):
+        time.sleep(latency_ms / 1000 * (1 + 0.1 * (len(imgs) - 1)))
+        results = []
+        for img in imgs:
+            h, w = img.shape[:2]
+            results.append(from_arrays([[w // 4, h // 4, w // 2, h // 2]], [0.9], person))
+        return results
+
+    model_manager._load_tf_model = lambda: "stub-ssd"
+    model_manager._load_yolo_onnx = lambda: "stub-yolo"
+    model_manager._run = run
+
+
+# ---------------------------------------------------------------------------
+# Load generation
+# ---------------------------------------------------------------------------
+
+class Recorder:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = {}
+        self.ok = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    def record(self, latency_ms, status, body):
+        self.latencies.append(latency_ms)
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+        if status in (429, 503):
+            self.rejected += 1
+        elif status != 200:
+            self.errors += 1
+        else:
+            # The backend answers 200 with an "error" field when inference fails
+            try:
+                failed = "error" in json.loads(body)
+            except ValueError:
+                failed = True
+            if failed:
+                self.errors += 1
+            else:
+                self.ok += 1
+
+    def record_timeout(self, latency_ms):
+        self.latencies.append(latency_ms)
+        self.timeouts += 1
+
+    def summary(self, elapsed_s):
+        total = len(self.latencies)
+        lat = np.asarray(self.latencies) if total else np.zeros(1)
+        return {
+            "requests": total,
+            "ok": self.ok,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "error_rate": (self.errors + self.timeouts) / total if total else 0,
+            "timeout_rate": self.timeouts / total if total else 0,
+            "rejection_rate": self.rejected / total if total else 0,
+            "status_codes": self.statuses,
+            "elapsed_s": elapsed_s,
+            "throughput_rps": self.ok / elapsed_s if elapsed_s else 0,
+            "latency_ms": {
+                "mean": float(lat.mean()),
+                "p50": float(np.percentile(lat, 50)),
+                "p95": float(np.percentile(lat, 95)),
+                "p99": float(np.percentile(lat, 99)),
+                "max": float(lat.max()),
+            },
+        }
+
+
+async def send_one(client, frame, stream_id, recorder, scheduled=None):
+    name, image_bytes = frame[0], frame[1]
+    body, content_type = multipart_body(image_bytes, name, stream_id)
+    # Open-loop latency is measured from the *scheduled* send time so a slow
+    # server can't hide queueing delay (coordinated omission)
+    start = scheduled if scheduled is not None else time.perf_counter()
+    try:
+        status, response = await client.predict(body, content_type)
+        recorder.record((time.perf_counter() - start) * 1000, status, response)
+    except TimeoutError:
+        recorder.record_timeout((time.perf_counter() - start) * 1000)
+    except Exception:
+        recorder.record((time.perf_counter() - start) * 1000, -1, b"")
+
+
+async def poll_alerts(client, stop, recorder, interval_s=1.0):
+    # What every open ExamMonitor tab does: GET /get_alerts once a second
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            status, body = await client.get_alerts()
+            recorder.record((time.perf_counter() - start) * 1000, status, b"{}" if status == 200 else body)
+        except TimeoutError:
+            recorder.record_timeout((time.perf_counter() - start) * 1000)
+        except Exception:
+            recorder.record((time.perf_counter() - start) * 1000, -1, b"")
+        try:
+            await asyncio.wait_for(stop.wait(), interval_s)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def closed_loop(client, frames, concurrency, duration_s, max_requests, with_alerts):
+    # `concurrency` virtual clients, each sending its next frame as soon as
+    # the previous answer arrives (like the webcam loop in ExamMonitor.js)
+    recorder, alert_recorder = Recorder(), Recorder()
+    stop = asyncio.Event()
+    sent = 0
+    deadline = time.perf_counter() + duration_s
+
+    async def client_loop(index):
+        nonlocal sent
+        stream_id = f"loadtest-{index}"
+        i = index
+        while time.perf_counter() < deadline and (not max_requests or sent < max_requests):
+            sent += 1
+            await send_one(client, frames[i % len(frames)], stream_id, recorder)
+            i += concurrency
+
+    pollers = [asyncio.create_task(poll_alerts(client, stop, alert_recorder))
+               for _ in range(concurrency)] if with_alerts else []
+    start = time.perf_counter()
+    await asyncio.gather(*[client_loop(i) for i in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await asyncio.gather(*pollers)
+
+    result = {"mode": "closed", "concurrency": concurrency, **recorder.summary(elapsed)}
+    if with_alerts:
+        result["alert_service"] = alert_recorder.summary(elapsed)
+    return result
+
+
+async def open_loop(client, frames, rate, duration_s, streams, poisson, with_alerts):
+    # Requests arrive at `rate` per second regardless of how fast the server
+    # answers; frames with a recorded "t" are sent at their original offsets
+    recorder, alert_recorder = Recorder(), Recorder()
+    stop = asyncio.Event()
+    tasks = []
+    rng = random.Random(0)
+
+    pollers = [asyncio.create_task(poll_alerts(client, stop, alert_recorder))
+               for _ in range(streams)] if with_alerts else []
+    start = time.perf_counter()
+    offset = 0.0
+    i = 0
+    replay_timed = all(len(f) > 2 and f[2] is not None for f in frames)
+    while True:
+        if replay_timed:
+            if i >= len(frames):
+                break
+            offset = frames[i][2] - frames[0][2]
+        elif offset >= duration_s:
+            break
+
+        scheduled = start + offset
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        frame = frames[i % len(frames)]
+        tasks.append(asyncio.create_task(send_one(client, frame, f"loadtest-{i % streams}", recorder, scheduled)))
+        i += 1
+        if not replay_timed:
+            offset += rng.expovariate(rate) if poisson else 1 / rate
+
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await asyncio.gather(*pollers)
+
+    result = {"mode": "open", "rate_rps": rate, "streams": streams, **recorder.summary(elapsed)}
+    if with_alerts:
+        result["alert_service"] = alert_recorder.summary(elapsed)
+    return result
+
+
+def find_saturation(levels, slo_ms, min_gain=0.10):
+    # Saturation = the first level where adding load stops buying throughput
+    # (< min_gain improvement), latency breaks the SLO, or errors appear
+    best = None
+    for previous, level in zip([None] + levels[:-1], levels):
+        breached = level["latency_ms"]["p99"] > slo_ms or level["error_rate"] > 0.01 or level["rejection_rate"] > 0.01
+        flat = previous is not None and level["throughput_rps"] < previous["throughput_rps"] * (1 + min_gain)
+        if breached or flat:
+            reason = "slo_or_errors" if breached else "throughput_plateau"
+            return {"level": level.get("concurrency", level.get("rate_rps")), "reason": reason,
+                    "max_good_throughput_rps": best["throughput_rps"] if best else 0}
+        best = level
+    return {"level": None, "reason": "not_reached",
+            "max_good_throughput_rps": best["throughput_rps"] if best else 0}
+
+
+async def run(args):
+    if args.replay:
+        frames = load_replay(args.replay)
+    else:
+        frames = [(name, data, None) for name, data in load_images(args.test_dir)]
+    if not frames:
+        print("No frames to send.")
+        sys.exit(1)
+
+    if args.in_process:
+        client = InProcessClient(args.timeout_s, args.stub_latency_ms, args.alerts)
+        await client.start()
+    else:
+        levels = [int(x) for x in args.sweep.split(",")] if args.sweep else [args.concurrency]
+        client = HttpClient(args.url, args.alerts_url, args.timeout_s,
+                            max_workers=max(levels + [args.streams]) * (2 if args.alerts else 1) + 4)
+
+    results = []
+    try:
+        if args.rate:
+            rates = [float(x) for x in args.rate.split(",")]
+            for rate in rates:
+                results.append(await open_loop(client, frames, rate, args.duration_s,
+                                               args.streams, args.poisson, args.alerts))
+        else:
+            levels = [int(x) for x in args.sweep.split(",")] if args.sweep else [args.concurrency]
+            for concurrency in levels:
+                results.append(await closed_loop(client, frames, concurrency, args.duration_s,
+                                                 args.max_requests, args.alerts))
+    finally:
+        await client.close()
+
+    return {
+        "config": {
+            "target": "in-process" if args.in_process else args.url,
+            "frames": len(frames),
+            "duration_s": args.duration_s,
+            "timeout_s": args.timeout_s,
+            "slo_p99_ms": args.slo_ms,
+            "stub_latency_ms": args.stub_latency_ms if args.in_process else None,
+        },
+        "levels": results,
+        "saturation": find_saturation(results, args.slo_ms),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the /predict API")
+    parser.add_argument("--url", default=PREDICT_URL)
+    parser.add_argument("--alerts-url", default=ALERTS_URL)
+    parser.add_argument("--alerts", action="store_true", help="also poll the alert service like the frontend")
+    parser.add_argument("--in-process", action="store_true", help="drive backend.app over ASGI with a stub model")
+    parser.add_argument("--stub-latency-ms", type=float, default=20.0)
+    parser.add_argument("--test-dir", default=os.path.join(ROOT, TEST_DIR))
+    parser.add_argument("--replay", help="JSONL of recorded traffic ({\"image\": path, \"t\": seconds})")
+    parser.add_argument("--concurrency", type=int, default=4, help="closed-loop virtual clients")
+    parser.add_argument("--sweep", help="comma-separated concurrency levels, e.g. 1,2,4,8,16")
+    parser.add_argument("--rate", help="open-loop arrival rate(s) in req/s, e.g. 10,20,40")
+    parser.add_argument("--poisson", action="store_true", help="exponential inter-arrival times")
+    parser.add_argument("--streams", type=int, default=8, help="distinct stream ids in open-loop mode")
+    parser.add_argument("--duration-s", type=float, default=10.0)
+    parser.add_argument("--max-requests", type=int, default=0)
+    parser.add_argument("--timeout-s", type=float, default=5.0)
+    parser.add_argument("--slo-ms", type=float, default=500.0, help="p99 latency budget for saturation")
+    parser.add_argument("--out", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=4)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()